@@ -1,8 +1,10 @@
 from django.contrib import admin
-from .models import Book, Category, CashEntry, BookMember
+from .models import Book, Category, CashEntry, BookMember, BookBalance, ReportJob
 # Register your models here.
 
 admin.site.register(Book)
 admin.site.register(Category)
 admin.site.register(BookMember)
-admin.site.register(CashEntry)
\ No newline at end of file
+admin.site.register(CashEntry)
+admin.site.register(BookBalance)
+admin.site.register(ReportJob)
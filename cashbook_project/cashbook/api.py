@@ -0,0 +1,69 @@
+import json
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # The standard library does the same job, a little slower
+    orjson = None
+
+API_VERSION = 1
+API_PAGE_SIZE = 25
+API_MAX_PAGE_SIZE = 200
+
+# Field name -> how to read it off a CashEntry (user select_related, category attached from the catalog).
+# Every value is a str, int or None, so both JSON encoders produce the same output.
+ENTRY_FIELDS = {
+    'id': lambda entry: entry.id,
+    'date': lambda entry: entry.date.isoformat() if entry.date else '',
+    'time': lambda entry: entry.time.strftime('%H:%M:%S') if entry.time else '',
+    'transaction_type': lambda entry: entry.transaction_type,
+    'transaction_type_display': lambda entry: entry.get_transaction_type_display(),
+    'amount': lambda entry: str(entry.amount),
+    'category': lambda entry: entry.category.name if entry.category else '',
+    'category_id': lambda entry: entry.category_id,
+    'remarks': lambda entry: entry.remarks or '',
+    'optional_field': lambda entry: entry.optional_field or '',
+    'image': lambda entry: entry.image.url if entry.image else '',
+    'thumbnail': lambda entry: entry.thumbnail.url if entry.thumbnail else '',
+    'preview': lambda entry: entry.preview.url if entry.preview else '',
+    'user': lambda entry: entry.user.username if entry.user else '',
+    'created_at': lambda entry: entry.created_at.isoformat() if entry.created_at else '',
+}
+# running_balance is not a column: it costs two extra queries per page, so it is only computed when asked for
+COMPUTED_FIELDS = ('running_balance',)
+DEFAULT_LIST_FIELDS = ('id', 'date', 'time', 'transaction_type', 'amount', 'category', 'remarks', 'user',
+                       'running_balance')
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(value, default=tuple(ENTRY_FIELDS) + COMPUTED_FIELDS):
+    """The ?fields=a,b,c selection as a tuple, or default when absent."""
+    if not value:
+        return tuple(default)
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in ENTRY_FIELDS and name not in COMPUTED_FIELDS]
+    if unknown:
+        raise InvalidFields(f"Unknown field(s): {', '.join(unknown)}. "
+                            f"Available: {', '.join(list(ENTRY_FIELDS) + list(COMPUTED_FIELDS))}.")
+    return fields
+
+
+def serialize_entry(entry, fields, running_balance=None):
+    data = {name: ENTRY_FIELDS[name](entry) for name in fields if name in ENTRY_FIELDS}
+    if 'running_balance' in fields:
+        data['running_balance'] = None if running_balance is None else str(running_balance)
+    return data
+
+
+def json_response(payload, status=200):
+    """Compact JSON: orjson when it is installed, otherwise json without whitespace."""
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    response = HttpResponse(body, status=status, content_type='application/json')
+    response['X-API-Version'] = str(API_VERSION)
+    return response
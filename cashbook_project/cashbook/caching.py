@@ -0,0 +1,115 @@
+import hashlib
+import secrets
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Bump when what is cached changes shape, so values written by older code are ignored
+CACHE_FORMAT_VERSION = 1
+
+
+def _stamp_key(scope, object_id):
+    return f'cashbook:{scope}-stamp:{object_id}'
+
+
+def stamp(scope, object_id):
+    """The current stamp of one object in scope (e.g. 'role' for a user's groups), made on first use.
+
+    A stamp that was never set or has been evicted gets a fresh random value, so
+    anything cached under the old one can no longer be found.
+    """
+    key = _stamp_key(scope, object_id)
+    value = cache.get(key)
+    if value is None:
+        value = secrets.token_hex(8)
+        # add() so two requests creating the same stamp end up agreeing on it
+        if not cache.add(key, value, None):
+            value = cache.get(key, value)
+    return value
+
+
+def bump(scope, object_ids):
+    """Give new stamps to the ids in scope, now and again once the current transaction commits.
+
+    The first bump makes the rest of this transaction see the change; the second
+    stops a concurrent request that read the old rows before the commit from
+    leaving them cached under the new stamp.
+    """
+    object_ids = {object_id for object_id in object_ids if object_id is not None}
+    if not object_ids:
+        return
+
+    def write():
+        cache.set_many({_stamp_key(scope, object_id): secrets.token_hex(8) for object_id in object_ids}, None)
+
+    write()
+    transaction.on_commit(write)
+
+
+def user_stamp(user_id):
+    """The stamp of the user's book list, from the database so every process agrees on it."""
+    from .models import UserCacheStamp
+
+    value = UserCacheStamp.objects.filter(user_id=user_id).values_list('books_stamp', flat=True).first()
+    if value is None:
+        value = UserCacheStamp.objects.get_or_create(user_id=user_id)[0].books_stamp
+    return value
+
+
+def bump_users(user_ids):
+    """The books these users can see have changed.
+
+    Users without a stamp row have nothing cached under one, so only existing rows change.
+    The update commits with the change that caused it, so no request can cache the old
+    list under the new stamp.
+    """
+    from .models import UserCacheStamp, new_stamp
+
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        UserCacheStamp.objects.filter(user_id__in=user_ids).update(books_stamp=new_stamp())
+
+
+def homepage_key(user_id, search_query, page):
+    search = hashlib.sha1(search_query.encode()).hexdigest()[:16]
+    return f'cashbook:homepage:{CACHE_FORMAT_VERSION}:{user_id}:{user_stamp(user_id)}:{search}:{page}'
+
+
+def get_homepage(key):
+    """The cached homepage data for key, or None if missing or any book on it has changed since.
+
+    Which books a user sees is covered by the stamp in the key. What is shown for
+    each book (name, balance, member count) is checked against BookBalance.version,
+    which every entry, member and name change bumps, with one primary key lookup.
+    """
+    from .models import BookBalance
+
+    cached = cache.get(key)
+    if cached is None:
+        return None
+    versions = cached['versions']
+    if versions:
+        current = dict(BookBalance.objects.filter(book_id__in=versions).values_list('book_id', 'version'))
+        if any(current.get(book_id) != version for book_id, version in versions.items()):
+            return None
+    return cached
+
+
+def book_detail_key(book_id, version, tier, filters, cursor, exact_count):
+    """Key for one book_detail page: the book's data version, the viewer's tier and the normalized filters.
+
+    Relative date filters go in as the dates they resolve to, so "today" moves on at midnight.
+    """
+    params = (filters.range_start, filters.range_end, filters.category or '', filters.transaction_type or '',
+              filters.search.strip(), filters.ranked, cursor or '', exact_count)
+    digest = hashlib.sha1(repr(params).encode()).hexdigest()
+    return f'cashbook:book-detail:{CACHE_FORMAT_VERSION}:{book_id}:{version}:{tier}:{digest}'
+
+
+def get_book_detail(key):
+    # The version in the key makes any entry found current
+    return cache.get(key)
+
+
+def store(key, data):
+    cache.set(key, data, settings.PAGE_CACHE_TIMEOUT)
@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.core.cache import cache
+from .caching import CACHE_FORMAT_VERSION
+from .models import BookBalance, CashEntry, Category, new_stamp
+
+# Catalogs kept in this process, by (book id, categories_stamp); emptied when it grows past this
+LOCAL_CATALOG_LIMIT = 1000
+_local = {}
+
+
+class CategoryCatalog:
+    """One book's categories in creation order, with lookups by id.
+
+    The Category instances only carry id, name and book_id: enough for option
+    lists and entry.category.name. They are shared, so never save or change them.
+    """
+
+    def __init__(self, book_id, rows):
+        self.book_id = book_id
+        self.rows = rows
+        self.categories = [Category(id=category_id, name=name, book_id=book_id) for category_id, name in rows]
+        self.by_id = {category.id: category for category in self.categories}
+        self.names = {category.id: category.name for category in self.categories}
+
+    def __iter__(self):
+        return iter(self.categories)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def name(self, category_id, default=None):
+        """Name of a category of this book; category_id may be a query string value."""
+        try:
+            return self.names.get(int(category_id), default)
+        except (TypeError, ValueError):
+            return default
+
+    def choices(self, empty_label=None):
+        choices = [(category.id, category.name) for category in self.categories]
+        return choices if empty_label is None else [('', empty_label)] + choices
+
+    def attach(self, entries):
+        """Fill in entry.category from the catalog, so reading it needs no join or query."""
+        field = CashEntry._meta.get_field('category')
+        for entry in entries:
+            category = self.by_id.get(entry.category_id)
+            if category is not None:
+                field.set_cached_value(entry, category)
+        return entries
+
+
+def category_catalog(book_id, categories_stamp=None):
+    """The book's catalog from this process, else the shared cache, else one query.
+
+    Each call costs one primary key lookup for the book's categories_stamp, unless the
+    caller already has it from the book's BookBalance. The stamp lives in the database,
+    so a category saved in one process is seen by every other worker at once.
+    """
+    if categories_stamp is None:
+        categories_stamp = BookBalance.objects.filter(book_id=book_id).values_list('categories_stamp', flat=True).first()
+        if categories_stamp is None:
+            # No balance row yet: nothing to key a copy on, so read the rows as they are
+            return CategoryCatalog(book_id, _load_rows(book_id))
+    catalog = _local.get((book_id, categories_stamp))
+    if catalog is None:
+        key = f'cashbook:categories:{CACHE_FORMAT_VERSION}:{book_id}:{categories_stamp}'
+        rows = cache.get(key)
+        if rows is None:
+            rows = _load_rows(book_id)
+            cache.set(key, rows, settings.PAGE_CACHE_TIMEOUT)
+        if len(_local) >= LOCAL_CATALOG_LIMIT:
+            _local.clear()
+        catalog = _local[(book_id, categories_stamp)] = CategoryCatalog(book_id, rows)
+    return catalog
+
+
+def _load_rows(book_id):
+    return list(Category.objects.filter(book_id=book_id).order_by('id').values_list('id', 'name'))
+
+
+def forget_categories(book_ids):
+    """Give these books a new categories_stamp; every process rebuilds their catalogs on next use."""
+    BookBalance.objects.filter(book_id__in=book_ids).update(categories_stamp=new_stamp())
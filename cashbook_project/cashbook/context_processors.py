@@ -0,0 +1,3 @@
+def user_role(request):
+    """user_role for every template: the system role on the request, fresh if the view checked permissions."""
+    return {'user_role': getattr(request, 'user_role', None)}
@@ -0,0 +1,118 @@
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+from dateutil.relativedelta import relativedelta
+from django.db.models import Sum
+from .models import BookBalance, CashEntry, NEWEST_FIRST, summary_totals
+from .search import search_entries
+
+logger = logging.getLogger(__name__)
+
+
+class EntryFilters:
+    """The entry list filters shared by book_detail and the entries API.
+
+    Parsed once from the query string: date_filter (today, yesterday, this_month,
+    last_month, or custom with start_date/end_date), category, type, search and
+    sort (relevance, which only applies along with a search).
+    Problems with the dates end up in errors instead of raising.
+    """
+
+    def __init__(self, params):
+        self.date_filter = params.get('date_filter')
+        self.category = params.get('category')
+        self.transaction_type = params.get('type')
+        self.search = params.get('search', '')
+        self.sort = params.get('sort', '')
+        self.start_date = params.get('start_date')
+        self.end_date = params.get('end_date')
+        self.range_start = self.range_end = None
+        self.errors = []
+        self._parse_dates()
+
+    def _parse_dates(self):
+        today = datetime.now().date()
+        if self.date_filter == 'today':
+            self.range_start = self.range_end = today
+        elif self.date_filter == 'yesterday':
+            self.range_start = self.range_end = today - timedelta(days=1)
+        elif self.date_filter == 'this_month':
+            self.range_start, self.range_end = today.replace(day=1), today
+        elif self.date_filter == 'last_month':
+            start_of_last_month = (today - relativedelta(months=1)).replace(day=1)
+            self.range_start = start_of_last_month
+            self.range_end = start_of_last_month + relativedelta(months=1, days=-1)
+        elif self.date_filter == 'custom' and self.start_date and self.end_date:
+            try:
+                start = datetime.strptime(self.start_date, '%Y-%m-%d').date()
+                end = datetime.strptime(self.end_date, '%Y-%m-%d').date()
+            except ValueError:
+                self.errors.append('Invalid date format. Please use YYYY-MM-DD.')
+                logger.error(f"Invalid date format for start_date: {self.start_date}, end_date: {self.end_date}")
+                return
+            if start > end:
+                self.errors.append('Start date cannot be after end date.')
+                logger.error(f"Invalid date range: Start date {start} is after end date {end}")
+                return
+            self.range_start, self.range_end = start, end
+
+    @property
+    def is_filtered(self):
+        return bool(self.range_start or self.category or self.transaction_type or self.search)
+
+    @property
+    def ranked(self):
+        return self.sort == 'relevance' and bool(self.search.strip())
+
+    @property
+    def ordering(self):
+        """Order of the entry list: best search matches first when ranked, otherwise newest first."""
+        return ('-search_rank', *NEWEST_FIRST) if self.ranked else NEWEST_FIRST
+
+    def apply(self, entries, rank=False):
+        """The entries matching the filters; with rank=True they carry search_rank when the list is ranked."""
+        if self.range_start:
+            entries = entries.filter(date__gte=self.range_start, date__lte=self.range_end)
+        if self.category:
+            entries = entries.filter(category__id=self.category)
+        if self.transaction_type:
+            entries = entries.filter(transaction_type=self.transaction_type)
+        # Words go through the text index, amounts accept >500 and 100..200
+        if self.search:
+            entries = search_entries(entries, self.search, ranked=rank and self.ranked)
+        return entries
+
+    def totals(self, book, entries):
+        """(cash_in, cash_out, net_balance, entry_count) of the filtered entries.
+
+        entry_count is None when it would cost a COUNT over the entries.
+        """
+        if not self.is_filtered:
+            # No filter applied: read the stored ledger instead of aggregating every entry
+            balance = BookBalance.for_book(book)
+            return balance.cash_in, balance.cash_out, balance.net, balance.entry_count
+        if not self.search:
+            # Date/category/type filters line up with the daily and monthly rollups
+            cash_in, cash_out, count = summary_totals(
+                book, self.range_start, self.range_end,
+                category_id=self.category or None, transaction_type=self.transaction_type or None)
+            return cash_in, cash_out, cash_in - cash_out, count
+        cash_in = entries.filter(transaction_type='IN').aggregate(Sum('amount'))['amount__sum'] or 0
+        cash_out = entries.filter(transaction_type='OUT').aggregate(Sum('amount'))['amount__sum'] or 0
+        return cash_in, cash_out, cash_in - cash_out, None
+
+
+def page_running_balances(entries, paginator, page, net_balance):
+    """{entry id: running balance} for one page of the filtered entries (newest first).
+
+    The database adds up the page rows with SUM() OVER (...); the balance before the
+    page is the filtered net minus the page and everything newer than it, so no
+    request has to walk the older history.
+    """
+    if not page.object_list:
+        return {}
+    window = dict(CashEntry.objects.filter(pk__in=[entry.pk for entry in page])
+                  .with_running_balance().values_list('pk', 'running_balance'))
+    newer_total = entries.filter(paginator.preceding(page.object_list[0])).net_total()
+    opening = Decimal(net_balance) - newer_total - window[page.object_list[0].pk]
+    return {pk: opening + value for pk, value in window.items()}
@@ -4,6 +4,9 @@ from django.contrib.auth.forms import UserCreationForm
 from django.core.exceptions import ValidationError
 from django.db.models import Q
 from .models import Book, Category, CashEntry, BookMember
+from .categories import category_catalog
+from .permissions import BookAccess
+from .images import process_in_background
 
 class UserRegistrationForm(UserCreationForm):
     class Meta:
@@ -65,13 +68,12 @@ class CreateUserForBookForm(forms.Form):
         self.instance = kwargs.pop('instance', None)  # BookMember or User instance
         super().__init__(*args, **kwargs)
         if self.request and self.book:
-            if not (self.request.user.groups.filter(name='Admin').exists() or 
-                    self.book.created_by == self.request.user or 
-                    BookMember.objects.filter(book=self.book, user=self.request.user, role='admin').exists()):
+            # Reuses the access already resolved by the view, so this costs no extra queries
+            if not BookAccess.for_request(self.request, self.book).is_admin:
                 raise ValidationError("Only Admins, book creators, or book admins can add/edit users.")
             self.fields['select_user'].queryset = User.objects.filter(
-                Q(book_memberships__book__created_by=self.book.created_by) |
-                Q(id=self.book.created_by.id)
+                Q(book_memberships__book__created_by=self.book.created_by_id) |
+                Q(id=self.book.created_by_id)
             ).distinct().exclude(book_memberships__book=self.book)
         if self.instance:
             self.fields['select_user'].disabled = True
@@ -168,8 +170,75 @@ class CashEntryForm(forms.ModelForm):
         book = kwargs.pop('book', None)  # Extract the book parameter
         super().__init__(*args, **kwargs)
         if book:
-            # Filter categories to only those associated with the given book
-            self.fields['category'].queryset = Category.objects.filter(book=book)
+            # Filter categories to only those associated with the given book.
+            # The options come from the cached catalog; the queryset only checks a submitted id
+            field = self.fields['category']
+            field.queryset = Category.objects.filter(book=book)
+            field.choices = category_catalog(book.id).choices(field.empty_label)
+
+    def save(self, commit=True):
+        if 'image' in self.changed_data:
+            # The old thumbnails show the old image; they are remade once the new one is processed
+            self.instance.thumbnail = self.instance.preview = None
+        entry = super().save(commit=commit)
+        if commit:
+            self.process_image()
+        return entry
+
+    def process_image(self):
+        # Views that save with commit=False call this once the entry has its id
+        if 'image' in self.changed_data and self.instance.image:
+            process_in_background(self.instance)
+
+
+class EntryImportForm(forms.Form):
+    file = forms.FileField(
+        help_text='CSV (UTF-8) or Excel .xlsx with a header row: date, time, type, amount, category, remarks.',
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+    )
+    dry_run = forms.BooleanField(
+        required=False, label='Only check the file, do not import anything',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        extension = upload.name.rsplit('.', 1)[-1].lower() if '.' in upload.name else ''
+        if extension not in ('csv', 'xlsx'):
+            raise forms.ValidationError('Upload a .csv or .xlsx file.')
+        upload.extension = extension
+        return upload
+
+
+class BulkEntryActionForm(forms.Form):
+    """One action over many entries of a book: the ticked ones, or every entry matching the list filters."""
+    ACTIONS = (
+        ('delete', 'Delete'),
+        ('set_category', 'Change category'),
+        ('set_type', 'Change type'),
+    )
+    action = forms.ChoiceField(choices=ACTIONS, widget=forms.Select(attrs={'class': 'form-select'}))
+    entries = forms.ModelMultipleChoiceField(queryset=CashEntry.objects.none(), required=False)
+    # The book_detail query string, so "all matching" acts on exactly the filtered list
+    filters = forms.CharField(required=False, widget=forms.HiddenInput)
+    all_matching = forms.BooleanField(required=False)
+    new_category = forms.ModelChoiceField(queryset=Category.objects.none(), required=False,
+                                          empty_label='No category', widget=forms.Select(attrs={'class': 'form-select'}))
+    new_type = forms.ChoiceField(choices=CashEntry.TRANSACTION_TYPES, required=False,
+                                 widget=forms.Select(attrs={'class': 'form-select'}))
+
+    def __init__(self, book, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['entries'].queryset = CashEntry.objects.filter(book=book)
+        self.fields['new_category'].queryset = Category.objects.filter(book=book)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('all_matching') and not cleaned_data.get('entries'):
+            raise ValidationError('Select at least one entry.')
+        if cleaned_data.get('action') == 'set_type' and not cleaned_data.get('new_type'):
+            self.add_error('new_type', 'Choose Cash In or Cash Out.')
+        return cleaned_data
 
 
 
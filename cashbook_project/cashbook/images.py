@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Longest side of the stored image; phone photos are 4000px and more
+IMAGE_MAX_SIZE = 1600
+PREVIEW_SIZE = 800
+THUMBNAIL_SIZE = 160
+JPEG_QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix='cashbook-images')
+        return _executor
+
+
+def process_in_background(entry):
+    """Compress the entry's image and make its thumbnails after the current transaction commits.
+
+    Pillow releases the GIL while decoding, resizing and encoding, so a small
+    thread pool keeps add_entry fast without a separate worker. With
+    IMAGE_WORKERS = 0 the work runs inline instead (tests, management commands).
+    """
+    entry_id, name = entry.pk, entry.image.name
+
+    def submit():
+        if settings.IMAGE_WORKERS > 0:
+            _pool().submit(_run, entry_id, name)
+        else:
+            process_entry_image(entry_id, name)
+
+    transaction.on_commit(submit)
+
+
+def _run(entry_id, name):
+    close_old_connections()
+    try:
+        process_entry_image(entry_id, name)
+    except Exception as e:
+        # Nothing waits on the future, so log here or the error is lost
+        logger.error(f"Image processing failed for entry {entry_id}: {str(e)}", exc_info=True)
+    finally:
+        close_old_connections()
+
+
+def _jpeg(image, size):
+    """A JPEG of image scaled to fit size x size, without EXIF or other metadata."""
+    copy = image.copy()
+    copy.thumbnail((size, size), Image.LANCZOS)
+    output = BytesIO()
+    copy.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def _flatten(image):
+    # Turn the photo upright from its EXIF orientation before the EXIF is dropped
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        # JPEG has no alpha: put transparent screenshots on white rather than black
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image.convert('RGBA'), mask=image.convert('RGBA').split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+def process_entry_image(entry_id, name=None):
+    """Replace an entry's image with a bounded, metadata-free JPEG and add its thumbnail and preview.
+
+    name is the image the work was queued for; if the entry has a different image
+    by now (edited again, or deleted) it is left alone. Returns the bytes saved
+    (negative if the file grew), or None when there was nothing to do.
+    """
+    from .models import CashEntry
+
+    entry = CashEntry.objects.filter(pk=entry_id).only('id', 'image', 'thumbnail', 'preview').first()
+    if entry is None or not entry.image or (name is not None and entry.image.name != name):
+        return None
+    storage = entry.image.storage
+    original = entry.image.name
+    try:
+        with storage.open(original, 'rb') as source:
+            original_size = storage.size(original)
+            image = Image.open(source)
+            # JPEGs can decode straight at 1/2, 1/4 or 1/8 scale, much cheaper than full size then resize
+            image.draft('RGB', (IMAGE_MAX_SIZE, IMAGE_MAX_SIZE))
+            image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        logger.error(f"Entry {entry_id}: cannot read image {original}: {str(e)}")
+        return None
+
+    image = _flatten(image)
+    stem = os.path.splitext(os.path.basename(original))[0]
+    # Always re-encoded, even when that saves nothing: phone EXIF carries GPS coordinates
+    compressed = _jpeg(image, IMAGE_MAX_SIZE)
+    new_name = storage.save(f'cashbook_images/{stem}.jpg', ContentFile(compressed))
+    thumbnail = storage.save(f'cashbook_images/thumbs/{stem}.jpg', ContentFile(_jpeg(image, THUMBNAIL_SIZE)))
+    preview = storage.save(f'cashbook_images/previews/{stem}.jpg', ContentFile(_jpeg(image, PREVIEW_SIZE)))
+
+    # Only swap the files in if the entry still points at the image that was processed
+    updated = CashEntry.objects.filter(pk=entry_id, image=original).update(
+        image=new_name, thumbnail=thumbnail, preview=preview)
+    if not updated:
+        for path in (new_name, thumbnail, preview):
+            storage.delete(path)
+        return None
+    for path in (original, entry.thumbnail.name, entry.preview.name):
+        if path:
+            storage.delete(path)
+    logger.info(f"Entry {entry_id}: image {original} -> {new_name} ({original_size} -> {len(compressed)} bytes), "
+                f"thumbnail {thumbnail}")
+    return original_size - len(compressed)
@@ -0,0 +1,53 @@
+import logging
+import tempfile
+import traceback
+import django
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def init_process():
+    # Pool processes are spawned fresh, so each one sets Django up before taking work
+    django.setup()
+
+
+def run_job(job_id):
+    """Pool entry point: render one claimed ReportJob by id."""
+    # Imported here: this module is loaded by the pool before django.setup() has run
+    from .models import ReportJob
+
+    close_old_connections()
+    try:
+        render_job(ReportJob.objects.select_related('book').get(pk=job_id))
+    finally:
+        close_old_connections()
+
+
+def render_job(job):
+    """Store the job's report in the job row and mark it done, or failed with the error."""
+    from . import report_cache
+    from .models import BookBalance, ReportJob
+    from .reports import write_report
+
+    logger.info(f"Rendering report job {job.id}: {job.report_type} for Book ID {job.book_id}")
+    try:
+        # Read the version first: a write during rendering makes the key stale rather than the file wrong
+        version = BookBalance.for_book(job.book).version
+        key = report_cache.cache_key(job.book_id, job.report_type, job.report_scope, job.category_id, version)
+        with tempfile.TemporaryFile() as output:
+            write_report(output, job.book, job.report_type, job.report_scope, job.category_id, progress=job.set_progress)
+            output.seek(0)
+            # In the database, not on this host's disk: the web dyno has no access to the worker's files
+            content = output.read()
+        now = timezone.now()
+        ReportJob.objects.filter(pk=job.pk).update(
+            content=content, size=len(content), cache_key=key, status=ReportJob.DONE, progress=100,
+            finished_at=now, used_at=now)
+        logger.info(f"Report job {job.id} done: {len(content)} bytes")
+        report_cache.evict(settings.REPORT_CACHE_MAX_BYTES)
+    except Exception as e:
+        logger.error(f"Report job {job.id} failed: {str(e)}\n{traceback.format_exc()}")
+        ReportJob.objects.filter(pk=job.pk).update(status=ReportJob.FAILED, error=str(e), finished_at=timezone.now())
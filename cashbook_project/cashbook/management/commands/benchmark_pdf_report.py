@@ -0,0 +1,71 @@
+import resource
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from cashbook.pdf_report import can_render_in_parallel, page_count, render_pages, render_parallel
+
+
+class SyntheticRows:
+    """Deterministic report rows generated on the fly, so the benchmark measures the PDF engine and not the database."""
+
+    def amount(self, i):
+        return Decimal(i % 997 + 1) / 4
+
+    def signed(self, i):
+        return self.amount(i) if i % 3 else -self.amount(i)
+
+    def prepare(self, starts):
+        return {start: (start, sum(self.signed(i) for i in range(start))) for start in starts}
+
+    def rows(self, state, count):
+        start, balance = state
+        for i in range(start, start + count):
+            balance += self.signed(i)
+            yield (date(2020, 1, 1) + timedelta(days=i // 40), 'Cash In' if i % 3 else 'Cash Out', self.amount(i),
+                   f'Category {i % 12}', f'Synthetic entry {i} for supplier {i % 311}', balance)
+
+
+class Command(BaseCommand):
+    help = 'Time the PDF report engine on synthetic books of increasing size to check that it scales linearly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='10000,50000,100000,250000,500000',
+                            help='Comma-separated row counts to render, smallest first.')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Render page ranges in this many processes and merge them (needs pypdf).')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['rows'].split(','))
+        processes = options['processes']
+        if processes > 1 and not can_render_in_parallel():
+            raise CommandError('Parallel rendering needs pypdf installed.')
+        source = SyntheticRows()
+        summary = (Decimal('0'), Decimal('0'), Decimal('0'))
+
+        self.stdout.write(f"{'rows':>9} {'pages':>7} {'seconds':>9} {'us/row':>8} {'MB out':>8} {'peak RSS MB':>12}")
+        per_row = []
+        for size in sizes:
+            with tempfile.TemporaryFile() as output:
+                started = time.perf_counter()
+                if processes > 1:
+                    render_parallel(output, 'Benchmark', size, summary, source, processes)
+                else:
+                    render_pages(output, 'Benchmark', source.rows((0, Decimal('0')), size),
+                                 total_pages=page_count(size), summary=summary)
+                elapsed = time.perf_counter() - started
+                written = output.tell()
+            # ru_maxrss is kilobytes on Linux; it only ever grows, hence smallest size first
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            per_row.append(elapsed / size * 1e6)
+            self.stdout.write(f"{size:>9} {page_count(size):>7} {elapsed:>9.2f} {per_row[-1]:>8.1f} "
+                              f"{written / 1e6:>8.1f} {peak:>12.0f}")
+
+        # Linear scaling means the cost per row stays flat as the book grows
+        drift = per_row[-1] / per_row[0]
+        self.stdout.write(f"Cost per row, largest vs smallest: {drift:.2f}x")
+        if drift > 1.5:
+            self.stdout.write(self.style.WARNING('Per-row cost grows with book size: rendering is not linear.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Per-row cost is flat: rendering scales linearly.'))
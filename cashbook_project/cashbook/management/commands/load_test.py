@@ -0,0 +1,185 @@
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from django.core.management.base import BaseCommand, CommandError
+from cashbook.models import Book, BookMember, Category
+
+# (endpoint, weight): roughly how often a real session does each thing
+ENDPOINTS = (
+    ('homepage', 25),
+    ('book_detail', 25),
+    ('book_detail filtered', 20),
+    ('add_entry', 15),
+    ('download_report', 15),
+)
+DATE_FILTERS = ('today', 'yesterday', 'this_month', 'last_month')
+SEARCH_TERMS = ('invoice', 'payment', 'petty cash', '>1000', '100..500', 'fuel')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A redirect is the endpoint's answer (saved entry, queued report); time it, do not follow it
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Session:
+    """One simulated user: a cookie jar, a login, and the books that user can open."""
+
+    def __init__(self, base_url, username, password, books, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect)
+        self.timeout = timeout
+        self.books = books
+        self.username = username
+        self.login(password)
+
+    def csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def request(self, path, data=None):
+        """Fetch path, reading the whole body. Returns the HTTP status."""
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode({**data, 'csrfmiddlewaretoken': self.csrf_token()}).encode()
+        request = urllib.request.Request(self.base_url + path, data=body,
+                                         headers={'Referer': self.base_url + path, 'Accept-Encoding': 'identity'})
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                while response.read(65536):
+                    pass
+                return response.status
+        except urllib.error.HTTPError as e:
+            # 3xx land here too because redirects are not followed
+            if 300 <= e.code < 400 and '/login/' in e.headers.get('Location', ''):
+                return 401
+            return e.code
+
+    def login(self, password):
+        self.request('/login/')
+        status = self.request('/login/', {'username': self.username, 'password': password})
+        if status != 302:
+            raise CommandError(f"Could not log in as {self.username} (HTTP {status}).")
+
+
+class Command(BaseCommand):
+    help = ('Replay a mix of page views and writes against a running server with concurrent sessions '
+            'of seeded users, then report latency percentiles and throughput per endpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--prefix', default='seed', help='Prefix the users were seeded with (see seed_cashbook).')
+        parser.add_argument('--password', default='cashbook')
+        parser.add_argument('--sessions', type=int, default=10, help='Concurrent simulated users.')
+        parser.add_argument('--duration', type=float, default=60, help='Seconds to run.')
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Mean pause in seconds between one session\'s requests.')
+        parser.add_argument('--timeout', type=float, default=60)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--no-writes', action='store_true', help='Skip add_entry posts.')
+
+    def handle(self, *args, **options):
+        accounts = self.accounts(options['prefix'])
+        if not accounts:
+            raise CommandError(f"No seeded users named '{options['prefix']}-...' with books. Run seed_cashbook first.")
+        rng = random.Random(options['seed'])
+        endpoints = [(name, weight) for name, weight in ENDPOINTS if not (options['no_writes'] and name == 'add_entry')]
+
+        self.stdout.write(f"Logging in {options['sessions']} session(s) against {options['base_url']}...")
+        sessions = [
+            Session(options['base_url'], username, options['password'], books, options['timeout'])
+            for username, books in (accounts[i % len(accounts)] for i in range(options['sessions']))
+        ]
+        samples = {name: [] for name, _ in endpoints}
+        errors = {name: 0 for name, _ in endpoints}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+
+        def run(session, session_rng):
+            while time.monotonic() < deadline:
+                name = session_rng.choices([name for name, _ in endpoints], [weight for _, weight in endpoints])[0]
+                path, data = self.plan(session_rng, name, session.books)
+                started = time.perf_counter()
+                status = session.request(path, data)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    samples[name].append(elapsed)
+                    if status >= 400:
+                        errors[name] += 1
+                if options['think_time']:
+                    time.sleep(session_rng.expovariate(1 / options['think_time']))
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+            futures = [pool.submit(run, session, random.Random(rng.random())) for session in sessions]
+            for future in futures:
+                future.result()
+        self.report(samples, errors, time.monotonic() - started)
+
+    def accounts(self, prefix):
+        """[(username, [(book_id, [category ids], can_write)])] for every seeded user with at least one book."""
+        books = {}
+        for book_id, owner in Book.objects.filter(created_by__username__startswith=f'{prefix}-').values_list(
+                'id', 'created_by__username'):
+            books.setdefault(owner, []).append((book_id, 'admin'))
+        for book_id, username, role in BookMember.objects.filter(user__username__startswith=f'{prefix}-').values_list(
+                'book_id', 'user__username', 'role'):
+            books.setdefault(username, []).append((book_id, role))
+        categories = {}
+        for book_id, category_id in Category.objects.filter(book__created_by__username__startswith=f'{prefix}-').values_list(
+                'book_id', 'id'):
+            categories.setdefault(book_id, []).append(category_id)
+        return [
+            (username, [(book_id, categories.get(book_id, []), role in ('admin', 'manager')) for book_id, role in owned])
+            for username, owned in sorted(books.items())
+        ]
+
+    def plan(self, rng, name, books):
+        """The (path, POST data or None) for one request of the given endpoint."""
+        book_id, category_ids, can_write = rng.choice(books)
+        if name == 'homepage':
+            return '/', None
+        if name == 'book_detail':
+            return f'/book/{book_id}/', None
+        if name == 'book_detail filtered':
+            params = rng.choice([
+                {'date_filter': rng.choice(DATE_FILTERS)},
+                {'type': rng.choice(['IN', 'OUT'])},
+                {'category': rng.choice(category_ids)} if category_ids else {'type': 'IN'},
+                {'search': rng.choice(SEARCH_TERMS)},
+            ])
+            return f'/book/{book_id}/?{urllib.parse.urlencode(params)}', None
+        if name == 'add_entry':
+            if not can_write:
+                # Partners cannot write; they get redirected, which still exercises the permission check
+                return f'/book/{book_id}/add/IN/', None
+            transaction_type = rng.choice(['IN', 'OUT'])
+            return f'/book/{book_id}/add/{transaction_type}/', {
+                'transaction_type': transaction_type,
+                'amount': f'{rng.lognormvariate(5.5, 1.2):.2f}',
+                'remarks': 'load test',
+                'category': rng.choice(category_ids) if category_ids else '',
+                'optional_field': '',
+            }
+        report_type = rng.choice(['csv', 'csv', 'jsonl', 'pdf', 'excel'])
+        return f'/book/{book_id}/download/?report_type={report_type}&report_scope=all', None
+
+    def report(self, samples, errors, elapsed):
+        self.stdout.write(f"\n{'endpoint':<24}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>8}")
+        total = 0
+        for name, latencies in samples.items():
+            total += len(latencies)
+            if len(latencies) < 2:
+                self.stdout.write(f"{name:<24}{len(latencies):>9}{errors[name]:>8}")
+                continue
+            cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+            p50, p95, p99 = (cuts[i] * 1000 for i in (49, 94, 98))
+            self.stdout.write(f"{name:<24}{len(latencies):>9}{errors[name]:>8}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}"
+                              f"{len(latencies) / elapsed:>8.1f}")
+        self.stdout.write(self.style.SUCCESS(f"{total} requests in {elapsed:.1f}s: {total / elapsed:.1f} req/s overall."))
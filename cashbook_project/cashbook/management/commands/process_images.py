@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Q
+from cashbook.images import process_entry_image
+from cashbook.models import CashEntry
+
+
+def _process(entry_id):
+    close_old_connections()
+    try:
+        return process_entry_image(entry_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = ('Compress entry images uploaded before the image pipeline and make their thumbnails. '
+            'Entries that already have a thumbnail are skipped unless --all is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, action='append', dest='books',
+                            help='Only this book id (can be given more than once).')
+        parser.add_argument('--all', action='store_true', help='Reprocess images that already have thumbnails.')
+        parser.add_argument('--workers', type=int, default=4, help='Images processed at the same time.')
+
+    def handle(self, *args, **options):
+        entries = CashEntry.objects.exclude(image='').exclude(image__isnull=True)
+        if options['books']:
+            entries = entries.filter(book_id__in=options['books'])
+        if not options['all']:
+            entries = entries.filter(Q(thumbnail__isnull=True) | Q(thumbnail=''))
+        entry_ids = list(entries.order_by('id').values_list('id', flat=True))
+        self.stdout.write(f'{len(entry_ids)} image(s) to process with {options["workers"]} worker(s).')
+
+        done = failed = saved = 0
+        pool = ThreadPoolExecutor(max_workers=options['workers']) if options['workers'] > 1 else None
+        results = pool.map(_process, entry_ids) if pool else map(process_entry_image, entry_ids)
+        try:
+            for result in results:
+                if result is None:
+                    failed += 1
+                else:
+                    done += 1
+                    saved += result
+                if (done + failed) % 100 == 0:
+                    self.stdout.write(f'  {done + failed}/{len(entry_ids)}')
+        finally:
+            if pool:
+                pool.shutdown()
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} image(s) could not be read; see the log.'))
+        self.stdout.write(self.style.SUCCESS(f'{done} image(s) processed, {saved / 1024 / 1024:.1f} MB saved.'))
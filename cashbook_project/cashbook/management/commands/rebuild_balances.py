@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from cashbook.models import BookBalance
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored per-book balances from CashEntry rows, or verify them with --verify.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, action='append', dest='books',
+                            help='Only this book id (can be given more than once).')
+        parser.add_argument('--verify', action='store_true',
+                            help='Compare stored balances with the entries without writing anything.')
+
+    def handle(self, *args, **options):
+        book_ids = options['books']
+        if options['verify']:
+            mismatches = BookBalance.drift(book_ids)
+            for book_id, stored, actual in mismatches:
+                self.stdout.write(f"Book {book_id}: stored {stored}, actual {actual}")
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} book balance(s) out of step. Run rebuild_balances to fix.")
+            self.stdout.write(self.style.SUCCESS('All book balances match their entries.'))
+            return
+        count = BookBalance.rebuild(book_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} book balance(s).'))
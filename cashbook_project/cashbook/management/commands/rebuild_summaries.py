@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from cashbook.models import DailyBookSummary, MonthlyBookSummary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily and monthly per-book rollups from CashEntry rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, action='append', dest='books',
+                            help='Only this book id (can be given more than once).')
+
+    def handle(self, *args, **options):
+        book_ids = options['books']
+        for model in (DailyBookSummary, MonthlyBookSummary):
+            model.rebuild(book_ids)
+            rows = model.objects.all() if book_ids is None else model.objects.filter(book_id__in=book_ids)
+            self.stdout.write(f'{model.__name__}: {rows.count()} row(s)')
+        self.stdout.write(self.style.SUCCESS('Rollups rebuilt.'))
@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from cashbook.jobs import init_process, run_job
+from cashbook.models import ReportJob
+
+
+class Command(BaseCommand):
+    help = 'Render queued report jobs in a pool of worker processes, using the database as the queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 2,
+                            help='Reports rendered at the same time (default: number of CPUs).')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Seconds to wait between queue checks when idle.')
+        parser.add_argument('--stale-after', type=int, default=120,
+                            help='Seconds without a heartbeat before a running job is given to another worker.')
+        parser.add_argument('--keep-hours', type=int, default=24,
+                            help='Finished jobs and their files are deleted after this many hours.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling forever.')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        stale_after = timedelta(seconds=options['stale_after'])
+        keep = timedelta(hours=options['keep_hours'])
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Report worker {worker} started with {processes} process(es).")
+
+        running = {}
+        last_purge = 0
+        # spawn, not fork: children must not share this process's database connections
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_process) as pool:
+            try:
+                while True:
+                    close_old_connections()
+                    for future in [future for future in running if future.done()]:
+                        job_id = running.pop(future)
+                        if future.exception() is not None:
+                            # The pool process died (killed, out of memory) before it could record anything
+                            ReportJob.objects.filter(pk=job_id, status=ReportJob.RUNNING).update(
+                                status=ReportJob.FAILED, error=str(future.exception()), finished_at=timezone.now())
+                        self.stdout.write(f"Job {job_id} finished.")
+
+                    # Our own jobs are alive as long as we are; anyone else's may be orphaned
+                    ReportJob.heartbeat(list(running.values()))
+                    requeued, failed = ReportJob.requeue_stale(stale_after)
+                    if requeued or failed:
+                        self.stdout.write(f"Requeued {requeued} and failed {failed} stale job(s).")
+                    if time.monotonic() - last_purge > 3600:
+                        ReportJob.purge(keep)
+                        last_purge = time.monotonic()
+
+                    while len(running) < processes:
+                        job = ReportJob.claim(worker)
+                        if job is None:
+                            break
+                        self.stdout.write(f"Job {job.id}: {job.report_type} report for book {job.book_id}.")
+                        running[pool.submit(run_job, job.id)] = job.id
+
+                    if options['once'] and not running:
+                        break
+                    time.sleep(options['poll'])
+            except KeyboardInterrupt:
+                self.stdout.write('Stopping; running jobs will be picked up again by the next worker.')
+                pool.shutdown(wait=False, cancel_futures=True)
+        self.stdout.write(self.style.SUCCESS('Report worker stopped.'))
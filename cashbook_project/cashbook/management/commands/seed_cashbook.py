@@ -0,0 +1,163 @@
+import random
+import time as clock
+from datetime import date, time, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from cashbook.models import Book, BookBalance, BookMember, CashEntry, Category, DailyBookSummary, MonthlyBookSummary
+
+CATEGORY_NAMES = [
+    'Sales', 'Rent', 'Salaries', 'Electricity', 'Internet', 'Fuel', 'Office Supplies', 'Groceries', 'Repairs',
+    'Transport', 'Insurance', 'Taxes', 'Marketing', 'Loan Repayment', 'Interest', 'Refunds', 'Bank Charges',
+    'Travel', 'Meals', 'Water', 'Software', 'Consulting', 'Commission', 'Maintenance',
+]
+VENDORS = [
+    'Sharma Traders', 'City Power', 'Metro Fuels', 'Green Grocers', 'Apex Logistics', 'Bluewave Telecom',
+    'Star Hardware', 'Prime Insurance', 'Sunrise Bakery', 'Delta Motors', 'Lotus Pharmacy', 'Orbit Software',
+]
+REMARKS = [
+    'Invoice {n} from {vendor}', 'Payment to {vendor}', 'Cash received from {vendor}', 'Advance to {vendor}',
+    'Monthly bill {vendor}', 'Refund from {vendor} ref {n}', 'Petty cash', 'Counter sales', '',
+]
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with synthetic users, books, members, categories and entries for load testing. '
+            'The same --seed always produces the same data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1, help='Random seed; the data depends only on it and the sizes.')
+        parser.add_argument('--prefix', default='seed', help='Username and book name prefix, so several sets can coexist.')
+        parser.add_argument('--admins', type=int, default=5)
+        parser.add_argument('--managers', type=int, default=20)
+        parser.add_argument('--partners', type=int, default=100)
+        parser.add_argument('--books', type=int, default=50)
+        parser.add_argument('--entries', type=int, default=1000000, help='Total entries, spread unevenly over the books.')
+        parser.add_argument('--years', type=int, default=3, help='Entries are dated over this many years.')
+        parser.add_argument('--end-date', type=date.fromisoformat, default=None,
+                            help='Last entry date (YYYY-MM-DD, default today).')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='cashbook', help='Password for every seeded user.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f"Users named '{prefix}-...' already exist. Pick another --prefix.")
+        rng = random.Random(options['seed'])
+        end = options['end_date'] or date.today()
+        started = clock.monotonic()
+
+        with transaction.atomic():
+            admins, managers, partners = self.create_users(prefix, options)
+            books = self.create_books(rng, prefix, options['books'], admins, managers, partners)
+        self.stdout.write(f"{len(admins) + len(managers) + len(partners)} users and {len(books)} books created.")
+
+        created = self.create_entries(rng, books, options['entries'], end, options['years'], options['batch_size'])
+
+        # Entries went in without the per-batch ledger updates; build balances and rollups once
+        book_ids = [book.id for book, _, _ in books]
+        BookBalance.rebuild(book_ids)
+        DailyBookSummary.rebuild(book_ids)
+        MonthlyBookSummary.rebuild(book_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {created} entries in {clock.monotonic() - started:.1f}s. Log in as {prefix}-admin-1 / {options['password']}."))
+
+    def create_users(self, prefix, options):
+        # Hashing is deliberately slow, so every seeded user shares one hash
+        password = make_password(options['password'])
+        by_role = {}
+        for role, count in (('admin', options['admins']), ('manager', options['managers']), ('partner', options['partners'])):
+            group, _ = Group.objects.get_or_create(name=role.capitalize())
+            users = User.objects.bulk_create([
+                User(username=f'{prefix}-{role}-{i}', password=password) for i in range(1, count + 1)])
+            # bulk_create only sets primary keys on some databases
+            users = list(User.objects.filter(username__startswith=f'{prefix}-{role}-').order_by('id'))
+            User.groups.through.objects.bulk_create([
+                User.groups.through(user_id=user.id, group_id=group.id) for user in users])
+            by_role[role] = users
+        if not by_role['admin']:
+            raise CommandError('At least one admin is needed to own the books.')
+        return by_role['admin'], by_role['manager'], by_role['partner']
+
+    def create_books(self, rng, prefix, count, admins, managers, partners):
+        """Books with members and categories. Returns [(book, categories, users who write entries)]."""
+        created_books = Book.objects.bulk_create([
+            Book(name=f'{prefix} {rng.choice(VENDORS)} {i}', created_by=admins[i % len(admins)])
+            for i in range(1, count + 1)])
+        created_books = list(Book.objects.filter(name__startswith=f'{prefix} ').order_by('id'))
+
+        members, categories = [], []
+        for book in created_books:
+            owner = book.created_by
+            chosen = [(user, 'manager') for user in rng.sample(managers, min(len(managers), rng.randint(0, 3)))]
+            chosen += [(user, 'partner') for user in rng.sample(partners, min(len(partners), rng.randint(0, 8)))]
+            members.extend(BookMember(book=book, user=user, role=role, created_by=owner) for user, role in chosen)
+            categories.extend(Category(name=name, book=book, created_by=owner)
+                              for name in rng.sample(CATEGORY_NAMES, rng.randint(4, 15)))
+        BookMember.objects.bulk_create(members)
+        Category.objects.bulk_create(categories)
+
+        categories_by_book = {}
+        for category in Category.objects.filter(book__in=created_books).order_by('id'):
+            categories_by_book.setdefault(category.book_id, []).append(category.id)
+        writers_by_book = {}
+        for member in BookMember.objects.filter(book__in=created_books, role='manager').order_by('id'):
+            writers_by_book.setdefault(member.book_id, []).append(member.user_id)
+        return [(book, categories_by_book.get(book.id, []), [book.created_by_id] + writers_by_book.get(book.id, []))
+                for book in created_books]
+
+    def create_entries(self, rng, books, total, end, years, batch_size):
+        # A few busy books hold most of the entries, as in real use
+        weights = [rng.paretovariate(1.2) for _ in books]
+        scale = total / sum(weights)
+        sizes = [int(weight * scale) for weight in weights]
+        sizes[0] += total - sum(sizes)
+        span = years * 365
+
+        created = 0
+        batch = []
+        for (book, category_ids, writers), size in zip(books, sizes):
+            # Zipf-like category use: the first few categories take most entries
+            category_weights = [1 / (rank + 1) for rank in range(len(category_ids))]
+            for n in range(size):
+                batch.append(self.entry(rng, book.id, category_ids, category_weights, writers, end, span, n))
+                if len(batch) >= batch_size:
+                    created += self.insert(batch)
+                    batch = []
+                    self.stdout.write(f"  {created}/{total} entries")
+        if batch:
+            created += self.insert(batch)
+        return created
+
+    def entry(self, rng, book_id, category_ids, category_weights, writers, end, span, n):
+        # Activity grows over time, so recent dates are more common; weekends are quieter
+        day = end - timedelta(days=int(rng.triangular(0, span, 0)))
+        while day.weekday() >= 5 and rng.random() < 0.6:
+            day = end - timedelta(days=int(rng.triangular(0, span, 0)))
+        hour = min(23, max(0, int(rng.gauss(13, 3))))
+        at = time(hour, rng.randrange(60), rng.randrange(60))
+
+        # Few large receipts, many smaller payments; amounts are log-normal and often round
+        if rng.random() < 0.4:
+            transaction_type, amount = 'IN', rng.lognormvariate(7.5, 1.1)
+        else:
+            transaction_type, amount = 'OUT', rng.lognormvariate(5.5, 1.3)
+        amount = min(amount, 9999999)
+        amount = Decimal(round(amount, -1) if rng.random() < 0.3 else round(amount, 2)).quantize(Decimal('0.01'))
+        amount = max(amount, Decimal('1.00'))
+
+        category_id = None
+        if category_ids and rng.random() > 0.1:
+            category_id = rng.choices(category_ids, category_weights)[0]
+        remarks = rng.choice(REMARKS).format(n=n + 1, vendor=rng.choice(VENDORS))
+        return CashEntry(book_id=book_id, user_id=rng.choice(writers), date=day, time=at,
+                         transaction_type=transaction_type, amount=amount, category_id=category_id, remarks=remarks)
+
+    def insert(self, batch):
+        # Plain QuerySet.bulk_create: CashEntryQuerySet.bulk_create would update the ledger
+        # batch by batch, which handle() does once at the end instead
+        with transaction.atomic():
+            models.QuerySet(CashEntry).bulk_create(batch)
+        return len(batch)
@@ -0,0 +1,129 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+# Stored media names are never reused (storage.save picks a fresh name), so a URL's bytes never change
+CACHE_CONTROL = 'private, max-age=31536000, immutable'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(stat):
+    # Size and mtime, as nginx does: cheap, and any rewrite of the file changes it
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(request, size, etag, modified):
+    """(start, end) inclusive for a single satisfiable byte range, None for the whole file, or False if unsatisfiable.
+
+    Multiple ranges are answered with the whole file, which RFC 9110 allows. An If-Range
+    that no longer matches means the client's partial copy is stale, so it gets everything.
+    """
+    header = request.headers.get('Range', '')
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != modified:
+        return None
+    first, last = match.groups()
+    if first == '':
+        # bytes=-500 is the last 500 bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class _RangeFile:
+    """Reads at most length bytes from an open file. No fileno(), so servers stream it instead of sendfile-ing the rest."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _transfer(request, name, path, stat, etag, modified, content_type):
+    server = settings.MEDIA_SERVER
+    if server == 'nginx':
+        # nginx serves the bytes (ranges included) from an internal location that maps onto MEDIA_ROOT
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(name)
+        return response
+    if server == 'sendfile':
+        # Apache mod_xsendfile and lighttpd take the absolute path
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+
+    byte_range = parse_range(request, stat.st_size, etag, modified)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    file = open(path, 'rb')
+    if byte_range is None:
+        # A real file object: gunicorn and other WSGI servers with wsgi.file_wrapper send it with sendfile()
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(_RangeFile(file, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve(request, name, storage=default_storage):
+    """Send one stored file with strong validators and long private caching.
+
+    Permission checks belong to the caller. Depending on MEDIA_SERVER the bytes are
+    handed to nginx (X-Accel-Redirect), to Apache/lighttpd (X-Sendfile), or sent by
+    Django, with Range support and sendfile() for whole files.
+    """
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        # Remote storage (S3 and the like): no local file to hand off, so stream it
+        if not storage.exists(name):
+            raise Http404('No such file.')
+        response = FileResponse(storage.open(name, 'rb'), content_type=content_type)
+        response['Cache-Control'] = CACHE_CONTROL
+        patch_vary_headers(response, ('Cookie',))
+        return response
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404('No such file.')
+    etag = file_etag(stat)
+    modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=modified)
+    if response is None:
+        response = _transfer(request, name, path, stat, etag, modified, content_type)
+        if response.status_code == 416:
+            return response
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    response['Cache-Control'] = CACHE_CONTROL
+    patch_vary_headers(response, ('Cookie',))
+    return response
@@ -0,0 +1,12 @@
+from .permissions import user_role
+
+
+class UserRoleMiddleware:
+    """Sets request.user_role, from the session while it is current, so templates never query the user's groups."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user_role(request)
+        return self.get_response(request)
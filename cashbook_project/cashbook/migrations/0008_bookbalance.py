@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:55
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_balances(apps, schema_editor):
+    Book = apps.get_model('cashbook', 'Book')
+    BookBalance = apps.get_model('cashbook', 'BookBalance')
+    CashEntry = apps.get_model('cashbook', 'CashEntry')
+    totals = {
+        row['book_id']: row
+        for row in CashEntry.objects.order_by().values('book_id').annotate(
+            total_in=Sum('amount', filter=Q(transaction_type='IN')),
+            total_out=Sum('amount', filter=Q(transaction_type='OUT')),
+            total_count=Count('id'),
+        )
+    }
+    balances = []
+    for book_id in Book.objects.values_list('id', flat=True):
+        row = totals.get(book_id, {})
+        cash_in = row.get('total_in') or Decimal('0')
+        cash_out = row.get('total_out') or Decimal('0')
+        balances.append(BookBalance(book_id=book_id, cash_in=cash_in, cash_out=cash_out,
+                                    net=cash_in - cash_out, entry_count=row.get('total_count', 0)))
+    BookBalance.objects.bulk_create(balances, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashbook', '0007_book_users'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookBalance',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='cashbook.book')),
+                ('cash_in', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cash_out', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('net', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('entry_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashbook', '0008_bookbalance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cashentry',
+            index=models.Index(fields=['book', 'date', 'time', 'id'], name='entry_book_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cashentry',
+            index=models.Index(fields=['book', 'category', 'date', 'time', 'id'], name='entry_book_cat_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cashentry',
+            index=models.Index(condition=models.Q(('transaction_type', 'IN')), fields=['book', 'date', 'time', 'id'], name='entry_book_in_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cashentry',
+            index=models.Index(condition=models.Q(('transaction_type', 'OUT')), fields=['book', 'date', 'time', 'id'], name='entry_book_out_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+
+def populate_summaries(apps, schema_editor):
+    CashEntry = apps.get_model('cashbook', 'CashEntry')
+    for model_name, field, period in (
+        ('DailyBookSummary', 'date', F('date')),
+        ('MonthlyBookSummary', 'month', TruncMonth('date', output_field=models.DateField())),
+    ):
+        model = apps.get_model('cashbook', model_name)
+        rows = CashEntry.objects.order_by().values('book_id', 'category_id', 'transaction_type').annotate(
+            period=period, total_amount=Sum('amount'), total_count=Count('id'))
+        model.objects.bulk_create([
+            model(book_id=row['book_id'], category_id=row['category_id'], transaction_type=row['transaction_type'],
+                  total=row['total_amount'], entry_count=row['total_count'], **{field: row['period']})
+            for row in rows
+        ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashbook', '0009_cashentry_access_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBookSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(max_length=3)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('entry_count', models.IntegerField(default=0)),
+                ('date', models.DateField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cashbook.book')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cashbook.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', 'date', 'category', 'transaction_type'], name='daily_summary_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyBookSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(max_length=3)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('entry_count', models.IntegerField(default=0)),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cashbook.book')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cashbook.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', 'month', 'category', 'transaction_type'], name='monthly_summary_idx')],
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
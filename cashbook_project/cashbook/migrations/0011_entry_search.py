@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+def create_search_indexes(apps, schema_editor):
+    from cashbook.search import install_sqlite_fts, postgres_search_indexes
+
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        CashEntry = apps.get_model('cashbook', 'CashEntry')
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for index in postgres_search_indexes():
+            schema_editor.add_index(CashEntry, index)
+    elif vendor == 'sqlite':
+        install_sqlite_fts(schema_editor)
+
+
+def drop_search_indexes(apps, schema_editor):
+    from cashbook.search import postgres_search_indexes, remove_sqlite_fts
+
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        CashEntry = apps.get_model('cashbook', 'CashEntry')
+        for index in postgres_search_indexes():
+            schema_editor.remove_index(CashEntry, index)
+    elif vendor == 'sqlite':
+        remove_sqlite_fts(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashbook', '0010_book_summaries'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
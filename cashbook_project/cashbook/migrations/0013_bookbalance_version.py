@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashbook', '0012_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookbalance',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
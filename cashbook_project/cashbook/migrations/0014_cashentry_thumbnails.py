@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashbook', '0013_bookbalance_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cashentry',
+            name='preview',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='cashbook_images/previews/'),
+        ),
+        migrations.AddField(
+            model_name='cashentry',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='cashbook_images/thumbs/'),
+        ),
+    ]
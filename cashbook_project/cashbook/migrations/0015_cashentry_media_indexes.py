@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashbook', '0014_cashentry_thumbnails'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cashentry',
+            index=models.Index(condition=models.Q(('image__gt', '')), fields=['image'], name='entry_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cashentry',
+            index=models.Index(condition=models.Q(('thumbnail__gt', '')), fields=['thumbnail'], name='entry_thumbnail_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cashentry',
+            index=models.Index(condition=models.Q(('preview__gt', '')), fields=['preview'], name='entry_preview_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashbook', '0015_cashentry_media_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='reportjob',
+            name='file',
+        ),
+        migrations.AddField(
+            model_name='reportjob',
+            name='content',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+    ]
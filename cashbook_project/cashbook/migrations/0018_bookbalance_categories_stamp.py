@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:16
+
+import cashbook.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashbook', '0017_reportjob_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookbalance',
+            name='categories_stamp',
+            field=models.CharField(default=cashbook.models.new_stamp, max_length=16),
+        ),
+    ]
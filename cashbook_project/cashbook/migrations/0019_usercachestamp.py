@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:30
+
+import cashbook.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('cashbook', '0018_bookbalance_categories_stamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCacheStamp',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('books_stamp', models.CharField(default=cashbook.models.new_stamp, max_length=16)),
+            ],
+        ),
+    ]
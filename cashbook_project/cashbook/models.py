@@ -1,4 +1,11 @@
-from django.db import models
+import secrets
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from dateutil.relativedelta import relativedelta
+from django.db import models, transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Q, RowRange, Sum, Value, When, Window
+from django.db.models.functions import Coalesce, TruncMonth
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -45,6 +52,475 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+# Fields whose change moves money between books, days, categories or cash in/out
+TRACKED_FIELDS = {'book', 'book_id', 'date', 'category', 'category_id', 'transaction_type', 'amount'}
+
+# Set while a CashEntry queryset delete applies its own set-based update,
+# so the per-row delete signals do not count those rows a second time
+_ledger_state = threading.local()
+
+
+def ledger_suspended():
+    return getattr(_ledger_state, 'depth', 0) > 0
+
+
+class suspend_ledger:
+    def __enter__(self):
+        _ledger_state.depth = getattr(_ledger_state, 'depth', 0) + 1
+
+    def __exit__(self, *exc):
+        _ledger_state.depth -= 1
+
+
+def add_entry_change(changes, book_id, date, category_id, transaction_type, amount, count):
+    """Accumulate one entry's effect into a {(book, date, category, type): [amount, count]} map."""
+    if isinstance(date, datetime):
+        # An unsaved default of timezone.now() is still a datetime; store it the way DateField does
+        date = models.DateField().to_python(date)
+    change = changes.setdefault((book_id, date, category_id, transaction_type), [Decimal('0'), 0])
+    change[0] += Decimal(str(amount))
+    change[1] += count
+    return changes
+
+
+def entry_groups(queryset):
+    """Amount and row count per (book, date, category, type) for a CashEntry queryset, in one query."""
+    rows = queryset.order_by().values('book_id', 'date', 'category_id', 'transaction_type').annotate(
+        total=Sum('amount'), total_count=Count('id'))
+    return {
+        (row['book_id'], row['date'], row['category_id'], row['transaction_type']): [row['total'], row['total_count']]
+        for row in rows
+    }
+
+
+def diff_groups(after, before):
+    changes = {}
+    for key in set(after) | set(before):
+        new = after.get(key, [Decimal('0'), 0])
+        old = before.get(key, [Decimal('0'), 0])
+        if new != old:
+            changes[key] = [new[0] - old[0], new[1] - old[1]]
+    return changes
+
+
+def apply_entry_changes(changes, create_missing=True):
+    """Move the book balances and the daily/monthly rollups by a set of entry changes.
+
+    Callers hold BookBalance.lock() for every book involved, which also serialises
+    the rollup rows of those books.
+    """
+    deltas = {}
+    for (book_id, _, _, transaction_type), (amount, count) in changes.items():
+        delta = deltas.setdefault(book_id, [Decimal('0'), Decimal('0'), 0])
+        delta[0 if transaction_type == 'IN' else 1] += amount
+        delta[2] += count
+    BookBalance.apply_deltas(deltas, create_missing=create_missing)
+    DailyBookSummary.apply_changes(changes, create_missing=create_missing)
+    MonthlyBookSummary.apply_changes(changes, create_missing=create_missing)
+
+
+def entry_totals(queryset):
+    """Cash in, cash out and row count per book for a CashEntry queryset, in one query."""
+    money = DecimalField(max_digits=14, decimal_places=2)
+    rows = queryset.order_by().values('book_id').annotate(
+        total_in=Coalesce(Sum('amount', filter=Q(transaction_type='IN')), Value(Decimal('0')), output_field=money),
+        total_out=Coalesce(Sum('amount', filter=Q(transaction_type='OUT')), Value(Decimal('0')), output_field=money),
+        total_count=Count('id'),
+    )
+    # SQLite sums decimals as floats, so round back to cents before comparing with stored values
+    cent = Decimal('0.01')
+    return {
+        row['book_id']: [row['total_in'].quantize(cent), row['total_out'].quantize(cent), row['total_count']]
+        for row in rows
+    }
+
+
+def new_stamp():
+    return secrets.token_hex(8)
+
+
+class UserCacheStamp(models.Model):
+    """Changes whenever the list of books a user can see does; cached homepages are keyed on it.
+
+    Kept in the database rather than the cache so every worker process sees a change at once.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    books_stamp = models.CharField(max_length=16, default=new_stamp)
+
+    def __str__(self):
+        return f"Cache stamp for {self.user_id}: {self.books_stamp}"
+
+
+class BookBalance(models.Model):
+    """Stored totals for a book, kept in step with every CashEntry write.
+
+    version goes up on every change to the book's entries, categories, members or name, so
+    anything derived from the book's data can be cached under (book, version).
+    categories_stamp changes only with the book's categories (see categories.forget_categories);
+    it is random rather than counted so a reused book id never matches an old catalog.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='balance')
+    cash_in = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cash_out = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    entry_count = models.IntegerField(default=0)
+    version = models.PositiveBigIntegerField(default=0)
+    categories_stamp = models.CharField(max_length=16, default=new_stamp)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Balance for {self.book_id}: {self.net}"
+
+    @classmethod
+    def lock(cls, book_ids):
+        # Lock in a fixed order so two writers touching the same books cannot deadlock
+        book_ids = sorted(book_id for book_id in book_ids if book_id is not None)
+        if book_ids:
+            list(cls.objects.select_for_update().filter(book_id__in=book_ids).order_by('book_id').values_list('book_id', flat=True))
+
+    @classmethod
+    def apply_deltas(cls, deltas, create_missing=True):
+        for book_id in sorted(deltas):
+            d_in, d_out, d_count = deltas[book_id]
+            if not (d_in or d_out or d_count):
+                # Totals unchanged (remarks edit, entry moved within the book) but the data did change
+                cls.touch([book_id])
+                continue
+            updated = cls.objects.filter(book_id=book_id).update(
+                cash_in=F('cash_in') + d_in,
+                cash_out=F('cash_out') + d_out,
+                net=F('net') + (d_in - d_out),
+                entry_count=F('entry_count') + d_count,
+                version=F('version') + 1,
+                updated_at=timezone.now(),
+            )
+            if not updated and create_missing:
+                # No stored row yet: the write has already happened, so a full count includes it
+                cls.rebuild([book_id])
+
+    @classmethod
+    def touch(cls, book_ids):
+        """Bump the data version of books whose content changed without moving their totals.
+
+        book_ids may be a list or a values('book_id') queryset.
+        """
+        return cls.objects.filter(book_id__in=book_ids).update(version=F('version') + 1, updated_at=timezone.now())
+
+    @classmethod
+    def rebuild(cls, book_ids=None):
+        """Recompute balances from the raw entries. Returns the number of rows written.
+
+        The entries are summed only after the balance rows are locked: a writer that
+        commits before the lock is in the sum, one that commits after it waits and
+        applies its delta on top of the rebuilt totals.
+        """
+        books = Book.objects.all() if book_ids is None else Book.objects.filter(id__in=book_ids)
+        entries = CashEntry.objects.all() if book_ids is None else CashEntry.objects.filter(book_id__in=book_ids)
+        book_ids = list(books.values_list('id', flat=True))
+        with transaction.atomic():
+            # Every book needs a row to lock; missing ones start at zero and are filled in below
+            cls.objects.bulk_create([cls(book_id=book_id) for book_id in book_ids], batch_size=500, ignore_conflicts=True)
+            cls.lock(book_ids)
+            totals = entry_totals(entries)
+            now = timezone.now()
+            rows = []
+            for book_id in book_ids:
+                cash_in, cash_out, count = totals.get(book_id, [Decimal('0'), Decimal('0'), 0])
+                rows.append(cls(book_id=book_id, cash_in=cash_in, cash_out=cash_out,
+                                net=cash_in - cash_out, entry_count=count, updated_at=now))
+            cls.objects.bulk_update(rows, ['cash_in', 'cash_out', 'net', 'entry_count', 'updated_at'], batch_size=500)
+            # Anything cached from the old numbers is stale now
+            cls.touch(book_ids)
+        return len(rows)
+
+    @classmethod
+    def drift(cls, book_ids=None):
+        """Books whose stored balance disagrees with their entries, as (book_id, stored, actual)."""
+        entries = CashEntry.objects.all() if book_ids is None else CashEntry.objects.filter(book_id__in=book_ids)
+        totals = entry_totals(entries)
+        books = Book.objects.all() if book_ids is None else Book.objects.filter(id__in=book_ids)
+        stored = {
+            row.book_id: [row.cash_in, row.cash_out, row.entry_count]
+            for row in cls.objects.filter(book__in=books)
+        }
+        mismatches = []
+        for book_id in books.values_list('id', flat=True).order_by('id'):
+            actual = totals.get(book_id, [Decimal('0'), Decimal('0'), 0])
+            if stored.get(book_id) != actual:
+                mismatches.append((book_id, stored.get(book_id), actual))
+        return mismatches
+
+    @classmethod
+    def for_book(cls, book):
+        balance = cls.objects.filter(book=book).first()
+        if balance is None:
+            # rebuild() creates and locks the row before it counts the entries
+            cls.rebuild([book.id])
+            balance = cls.objects.get(book=book)
+        return balance
+
+
+class BookSummary(models.Model):
+    """Entry totals for one book, period, category and transaction type."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, related_name='+')
+    transaction_type = models.CharField(max_length=3)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    entry_count = models.IntegerField(default=0)
+
+    period_field = None
+    # Above this many changed rows apply_changes switches from one UPDATE per row to bulk writes
+    BULK_THRESHOLD = 50
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def period_of(cls, day):
+        raise NotImplementedError
+
+    @classmethod
+    def apply_changes(cls, changes, create_missing=True):
+        merged = {}
+        for (book_id, day, category_id, transaction_type), (amount, count) in changes.items():
+            key = (book_id, cls.period_of(day), category_id, transaction_type)
+            change = merged.setdefault(key, [Decimal('0'), 0])
+            change[0] += amount
+            change[1] += count
+        merged = {key: change for key, change in merged.items() if change[0] or change[1]}
+        if len(merged) > cls.BULK_THRESHOLD:
+            cls._apply_in_bulk(merged, create_missing)
+            return
+        for (book_id, period, category_id, transaction_type), (amount, count) in sorted(merged.items(), key=str):
+            rows = cls.objects.filter(book_id=book_id, category_id=category_id, transaction_type=transaction_type,
+                                      **{cls.period_field: period})
+            updated = rows.update(total=F('total') + amount, entry_count=F('entry_count') + count)
+            if not updated and create_missing and count > 0:
+                cls.objects.create(book_id=book_id, category_id=category_id, transaction_type=transaction_type,
+                                   total=amount, entry_count=count, **{cls.period_field: period})
+            elif count < 0:
+                rows.filter(entry_count__lte=0).delete()
+
+    @classmethod
+    def _apply_in_bulk(cls, merged, create_missing):
+        # Imports and bulk edits touch thousands of rows at once: read them in a few queries,
+        # then delete them and insert the new totals rather than running one UPDATE each.
+        # Safe because the caller's BookBalance.lock() serialises these rows.
+        periods = sorted({period for _, period, _, _ in merged})
+        book_ids = {book_id for book_id, _, _, _ in merged}
+        existing = {}
+        for start in range(0, len(periods), 500):
+            rows = cls.objects.filter(book_id__in=book_ids, **{f'{cls.period_field}__in': periods[start:start + 500]})
+            for row in rows:
+                key = (row.book_id, getattr(row, cls.period_field), row.category_id, row.transaction_type)
+                if key in merged:
+                    existing[key] = row
+        replaced, rows = [], []
+        for key, (amount, count) in merged.items():
+            row = existing.get(key)
+            if row is not None:
+                replaced.append(row.pk)
+                amount, count = row.total + amount, row.entry_count + count
+            elif not create_missing:
+                continue
+            if count > 0:
+                book_id, period, category_id, transaction_type = key
+                rows.append(cls(book_id=book_id, category_id=category_id, transaction_type=transaction_type,
+                                total=amount, entry_count=count, **{cls.period_field: period}))
+        for start in range(0, len(replaced), 500):
+            cls.objects.filter(pk__in=replaced[start:start + 500]).delete()
+        cls.objects.bulk_create(rows, batch_size=500)
+
+    @classmethod
+    def rebuild(cls, book_ids=None):
+        entries = CashEntry.objects.all() if book_ids is None else CashEntry.objects.filter(book_id__in=book_ids)
+        rows = entries.order_by().values('book_id', 'category_id', 'transaction_type').annotate(
+            period=cls.period_expression(), total_amount=Sum('amount'), total_count=Count('id'),
+        ).values('book_id', 'category_id', 'transaction_type', 'period', 'total_amount', 'total_count')
+        with transaction.atomic():
+            # Entry writers hold the same locks, so none can add to a rollup between the delete and the re-insert
+            BookBalance.lock(Book.objects.values_list('id', flat=True) if book_ids is None else book_ids)
+            existing = cls.objects.all() if book_ids is None else cls.objects.filter(book_id__in=book_ids)
+            existing.delete()
+            batch = []
+            for row in rows.iterator(chunk_size=2000):
+                batch.append(cls(book_id=row['book_id'], category_id=row['category_id'],
+                                 transaction_type=row['transaction_type'], total=row['total_amount'],
+                                 entry_count=row['total_count'], **{cls.period_field: row['period']}))
+                if len(batch) >= 2000:
+                    cls.objects.bulk_create(batch)
+                    batch = []
+            cls.objects.bulk_create(batch)
+
+
+class DailyBookSummary(BookSummary):
+    date = models.DateField()
+
+    period_field = 'date'
+
+    class Meta:
+        indexes = [models.Index(fields=['book', 'date', 'category', 'transaction_type'], name='daily_summary_idx')]
+
+    def __str__(self):
+        return f"{self.book_id} {self.date} {self.transaction_type}: {self.total}"
+
+    @classmethod
+    def period_of(cls, day):
+        return day
+
+    @classmethod
+    def period_expression(cls):
+        return F('date')
+
+
+class MonthlyBookSummary(BookSummary):
+    month = models.DateField(help_text="First day of the month")
+
+    period_field = 'month'
+
+    class Meta:
+        indexes = [models.Index(fields=['book', 'month', 'category', 'transaction_type'], name='monthly_summary_idx')]
+
+    def __str__(self):
+        return f"{self.book_id} {self.month:%Y-%m} {self.transaction_type}: {self.total}"
+
+    @classmethod
+    def period_of(cls, day):
+        return day.replace(day=1)
+
+    @classmethod
+    def period_expression(cls):
+        return TruncMonth('date', output_field=models.DateField())
+
+
+def summary_totals(book, start=None, end=None, category_id=None, transaction_type=None):
+    """Cash in, cash out and entry count for a book over an inclusive date range.
+
+    Whole months inside the range are read from MonthlyBookSummary and the partial
+    months at either edge from DailyBookSummary, so a multi-year range sums a few
+    hundred rollup rows instead of every entry.
+    """
+    months = MonthlyBookSummary.objects.filter(book=book)
+    days = DailyBookSummary.objects.filter(book=book)
+    if category_id:
+        months, days = months.filter(category_id=category_id), days.filter(category_id=category_id)
+    if transaction_type:
+        months, days = months.filter(transaction_type=transaction_type), days.filter(transaction_type=transaction_type)
+
+    # First month that starts inside the range and first day after the last whole month
+    first_month = None if start is None else (start if start.day == 1 else (start.replace(day=1) + relativedelta(months=1)))
+    after_last_month = None if end is None else (end + timedelta(days=1)).replace(day=1)
+    if first_month is not None and after_last_month is not None and first_month >= after_last_month:
+        # No whole month in the range: days only
+        months = months.none()
+        days = days.filter(date__gte=start, date__lte=end)
+    else:
+        if first_month is not None:
+            months = months.filter(month__gte=first_month)
+        if after_last_month is not None:
+            months = months.filter(month__lt=after_last_month)
+        edges = Q(pk__in=[])
+        if start is not None and start < first_month:
+            edges |= Q(date__gte=start, date__lt=first_month)
+        if end is not None and after_last_month <= end:
+            edges |= Q(date__gte=after_last_month, date__lte=end)
+        days = days.filter(edges)
+
+    cash_in, cash_out, count = Decimal('0'), Decimal('0'), 0
+    for rows in (months, days):
+        for row in rows.order_by().values('transaction_type').annotate(amount=Sum('total'), entries=Sum('entry_count')):
+            if row['transaction_type'] == 'IN':
+                cash_in += row['amount']
+            else:
+                cash_out += row['amount']
+            count += row['entries']
+    return cash_in, cash_out, count
+
+
+# Both orderings match the (book, date, time, id) indexes, so the database
+# walks the index instead of sorting the book. id makes them unique for keyset paging.
+NEWEST_FIRST = ('-date', '-time', '-id')
+OLDEST_FIRST = ('date', 'time', 'id')
+
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def signed_amount():
+    """+amount for cash in, -amount for cash out."""
+    return Case(
+        When(transaction_type='IN', then=F('amount')),
+        default=-F('amount'),
+        output_field=MONEY,
+    )
+
+
+class CashEntryQuerySet(models.QuerySet):
+    def newest_first(self):
+        return self.order_by(*NEWEST_FIRST)
+
+    def oldest_first(self):
+        return self.order_by(*OLDEST_FIRST)
+
+    def net_total(self):
+        return self.aggregate(net=Coalesce(Sum(signed_amount()), Value(Decimal('0')), output_field=MONEY))['net']
+
+    def with_running_balance(self, opening=Decimal('0')):
+        """Annotate running_balance = opening + SUM(signed amount) OVER (ORDER BY date, time, id).
+
+        The window only sees the rows this queryset selects, so filters narrow the
+        balance to that window and opening carries in whatever came before it.
+        """
+        return self.annotate(running_balance=ExpressionWrapper(
+            Window(Sum(signed_amount()), order_by=[F(name).asc() for name in OLDEST_FIRST], frame=RowRange(start=None, end=0))
+            + Value(Decimal(opening)),
+            output_field=MONEY,
+        ))
+
+    # Bulk paths bypass Model.save()/delete(), so they keep BookBalance in step here
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        changes = {}
+        for obj in objs:
+            add_entry_change(changes, obj.book_id, obj.date, obj.category_id, obj.transaction_type, obj.amount, 1)
+        with transaction.atomic(using=self.db, savepoint=False):
+            BookBalance.lock({book_id for book_id, _, _, _ in changes})
+            created = super().bulk_create(objs, *args, **kwargs)
+            apply_entry_changes(changes)
+        return created
+
+    def update(self, **kwargs):
+        if not TRACKED_FIELDS.intersection(kwargs):
+            with transaction.atomic(using=self.db, savepoint=False):
+                BookBalance.touch(self.order_by().values('book_id'))
+                return super().update(**kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            book_ids = set(self.order_by().values_list('book_id', flat=True).distinct())
+            new_book = kwargs.get('book', kwargs.get('book_id'))
+            if new_book is not None:
+                book_ids.add(getattr(new_book, 'pk', new_book))
+            BookBalance.lock(book_ids)
+            pks = list(self.values_list('pk', flat=True))
+            before = entry_groups(self.model.objects.filter(pk__in=pks))
+            rows = super().update(**kwargs)
+            after = entry_groups(self.model.objects.filter(pk__in=pks))
+            apply_entry_changes(diff_groups(after, before))
+        return rows
+
+    def delete(self):
+        with transaction.atomic(using=self.db, savepoint=False):
+            BookBalance.lock(self.order_by().values_list('book_id', flat=True).distinct())
+            removed = entry_groups(self)
+            with suspend_ledger():
+                result = super().delete()
+            apply_entry_changes(diff_groups({}, removed), create_missing=False)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class CashEntry(models.Model):
     TRANSACTION_TYPES = (
         ('IN', 'Cash In'),
@@ -59,9 +535,147 @@ class CashEntry(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
     remarks = models.TextField(blank=True)
     image = models.ImageField(upload_to='cashbook_images/', blank=True, null=True)
+    # Small copies of the image for the entry list and the entry modal, made by cashbook/images.py
+    thumbnail = models.ImageField(upload_to='cashbook_images/thumbs/', blank=True, null=True, editable=False)
+    preview = models.ImageField(upload_to='cashbook_images/previews/', blank=True, null=True, editable=False)
     optional_field = models.CharField(max_length=200, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CashEntryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # book_detail list, date filters and reports: filter by book, walk in date/time order
+            models.Index(fields=['book', 'date', 'time', 'id'], name='entry_book_date_time_idx'),
+            # Category filter and category-wise reports
+            models.Index(fields=['book', 'category', 'date', 'time', 'id'], name='entry_book_cat_date_idx'),
+            # Cash In / Cash Out splits
+            models.Index(fields=['book', 'date', 'time', 'id'], name='entry_book_in_idx',
+                         condition=Q(transaction_type='IN')),
+            models.Index(fields=['book', 'date', 'time', 'id'], name='entry_book_out_idx',
+                         condition=Q(transaction_type='OUT')),
+            # serve_media finds the entry (and so the book) behind a media path; only rows with a file are indexed
+            models.Index(fields=['image'], name='entry_image_idx', condition=Q(image__gt='')),
+            models.Index(fields=['thumbnail'], name='entry_thumbnail_idx', condition=Q(thumbnail__gt='')),
+            models.Index(fields=['preview'], name='entry_preview_idx', condition=Q(preview__gt='')),
+        ]
+
     def __str__(self):
-        return f"{self.transaction_type} - {self.amount} in {self.book.name}"
\ No newline at end of file
+        return f"{self.transaction_type} - {self.amount} in {self.book.name}"
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not TRACKED_FIELDS.intersection(update_fields):
+            return super().save(*args, **kwargs)
+        # Write the entry and move the book balance and rollups in one transaction, under the balance row lock
+        with transaction.atomic():
+            BookBalance.lock([self.book_id])
+            old = None
+            if self.pk:
+                old = CashEntry.objects.select_for_update().filter(pk=self.pk).values(
+                    'book_id', 'date', 'category_id', 'transaction_type', 'amount').first()
+                if old and old['book_id'] != self.book_id:
+                    BookBalance.lock([old['book_id']])
+            super().save(*args, **kwargs)
+            changes = {}
+            if old:
+                add_entry_change(changes, old['book_id'], old['date'], old['category_id'],
+                                 old['transaction_type'], -old['amount'], -1)
+            add_entry_change(changes, self.book_id, self.date, self.category_id, self.transaction_type, self.amount, 1)
+            apply_entry_changes(changes)
+
+class ReportJob(models.Model):
+    """A report rendered by the run_report_worker command instead of inside the request.
+
+    The table is the queue: workers claim QUEUED rows, keep RUNNING rows alive with
+    heartbeat_at, and put rows back in the queue when their worker stops heartbeating.
+    The rendered file goes in content rather than on the worker's disk, so any web
+    process can send it wherever the worker runs. Load jobs with defer('content')
+    unless the file itself is needed.
+    """
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    REPORT_TYPES = (
+        ('pdf', 'PDF'),
+        ('excel', 'Excel'),
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+    )
+    MAX_ATTEMPTS = 3
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='report_jobs')
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='report_jobs')
+    report_type = models.CharField(max_length=10, choices=REPORT_TYPES)
+    report_scope = models.CharField(max_length=10)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)
+    content = models.BinaryField(blank=True, default=b'')
+    size = models.PositiveIntegerField(default=0)
+    # Finished jobs double as the report cache (cashbook/report_cache.py)
+    cache_key = models.CharField(max_length=64, blank=True, db_index=True)
+    used_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'], name='report_job_queue_idx')]
+
+    def __str__(self):
+        return f"{self.report_type} report for {self.book_id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    @classmethod
+    def claim(cls, worker):
+        """Take the oldest queued job for this worker, or None if the queue is empty."""
+        with transaction.atomic():
+            # skip_locked lets several workers poll at once without waiting on each other's rows
+            job_id = cls.objects.select_for_update(skip_locked=True).filter(status=cls.QUEUED).order_by(
+                'created_at', 'id').values_list('id', flat=True).first()
+            if job_id is None:
+                return None
+            now = timezone.now()
+            claimed = cls.objects.filter(pk=job_id, status=cls.QUEUED).update(
+                status=cls.RUNNING, worker=worker, attempts=F('attempts') + 1,
+                started_at=now, heartbeat_at=now, progress=0, error='',
+            )
+        return cls.objects.get(pk=job_id) if claimed else None
+
+    @classmethod
+    def heartbeat(cls, job_ids):
+        if job_ids:
+            cls.objects.filter(pk__in=job_ids, status=cls.RUNNING).update(heartbeat_at=timezone.now())
+
+    @classmethod
+    def requeue_stale(cls, stale_after):
+        """Put RUNNING jobs whose worker went quiet back in the queue, or fail them after MAX_ATTEMPTS."""
+        cutoff = timezone.now() - stale_after
+        stale = cls.objects.filter(status=cls.RUNNING, heartbeat_at__lt=cutoff)
+        failed = stale.filter(attempts__gte=cls.MAX_ATTEMPTS).update(
+            status=cls.FAILED, error='The report worker stopped while rendering this report.', finished_at=timezone.now())
+        requeued = stale.filter(attempts__lt=cls.MAX_ATTEMPTS).update(status=cls.QUEUED, worker='', progress=0)
+        return requeued, failed
+
+    @classmethod
+    def purge(cls, older_than):
+        """Delete finished jobs and their files. Returns the number of jobs removed."""
+        finished = cls.objects.filter(status__in=(cls.DONE, cls.FAILED), finished_at__lt=timezone.now() - older_than)
+        return finished.delete()[0]
+
+    def set_progress(self, done, total):
+        percent = min(99, done * 100 // total) if total else 0
+        ReportJob.objects.filter(pk=self.pk, status=self.RUNNING).update(progress=percent, heartbeat_at=timezone.now())
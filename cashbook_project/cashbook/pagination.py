@@ -0,0 +1,128 @@
+import copy
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+
+CURSOR_SALT = 'cashbook.cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class CursorPaginator:
+    """Keyset pagination over a fixed, unique ordering.
+
+    Each page is fetched with a WHERE on the last row seen plus LIMIT, so page N
+    reads the same number of index entries as page 1 and no COUNT(*) is needed.
+    The last field of the ordering must be unique (usually the primary key).
+    The ordering may start with an annotation of the queryset, such as search_rank.
+    Cursors are signed, so clients cannot forge positions.
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [self._field(name.lstrip('-')) for name in self.ordering]
+
+    def _field(self, name):
+        try:
+            return self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # A copy of the annotation's output field, named so it reads the value off each row
+            field = copy.copy(self.queryset.query.annotations[name].output_field)
+            field.set_attributes_from_name(name)
+            return field
+
+    def encode_cursor(self, obj, direction):
+        position = [field.value_to_string(obj) for field in self.fields]
+        return signing.dumps({'p': position, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+            values = [field.to_python(value) for field, value in zip(self.fields, data['p'])]
+            direction = data['d']
+        except (signing.BadSignature, KeyError, TypeError, ValueError) as e:
+            raise InvalidCursor(str(e))
+        if len(values) != len(self.fields) or direction not in ('next', 'prev'):
+            raise InvalidCursor('Malformed cursor')
+        return values, direction
+
+    def preceding(self, obj):
+        """Q for every row that sorts before obj in this ordering."""
+        return self._seek([getattr(obj, field.attname) for field in self.fields], False)
+
+    def following(self, values):
+        """Q for every row that sorts after a position given as one value per ordering field."""
+        return self._seek(values, True)
+
+    def _seek(self, values, forward):
+        # (a, b, c) after (A, B, C) == a > A OR (a = A AND b > B) OR (a = A AND b = B AND c > C),
+        # with > flipped to < for descending fields and everything flipped when paging back
+        condition = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, values):
+            field = name.lstrip('-')
+            descending = name.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def page(self, cursor=None):
+        if not cursor:
+            rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            return CursorPage(
+                rows,
+                next_cursor=self.encode_cursor(rows[-1], 'next') if has_more else None,
+            )
+
+        values, direction = self.decode_cursor(cursor)
+        if direction == 'next':
+            rows = list(self.queryset.filter(self._seek(values, True)).order_by(*self.ordering)[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            return CursorPage(
+                rows,
+                next_cursor=self.encode_cursor(rows[-1], 'next') if has_more and rows else None,
+                previous_cursor=self.encode_cursor(rows[0], 'prev') if rows else None,
+            )
+
+        reverse = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+        rows = list(self.queryset.filter(self._seek(values, False)).order_by(*reverse)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], 'next') if rows else None,
+            previous_cursor=self.encode_cursor(rows[0], 'prev') if has_more and rows else None,
+        )
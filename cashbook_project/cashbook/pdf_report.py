@@ -0,0 +1,239 @@
+import math
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from .categories import category_catalog
+from .jobs import init_process
+from .models import CashEntry, OLDEST_FIRST
+from .pagination import CursorPaginator
+
+try:
+    import pypdf
+except ImportError:  # Page ranges can only be rendered in parallel when they can be merged
+    pypdf = None
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 36
+ROW_HEIGHT = 14
+TITLE_HEIGHT = 40
+FONT, BOLD_FONT, FONT_SIZE = 'Helvetica', 'Helvetica-Bold', 8
+# (heading, width in points, right aligned); the widths fill the page between the margins
+COLUMNS = (
+    ('Date', 60, False),
+    ('Type', 50, False),
+    ('Amount', 75, True),
+    ('Category', 95, False),
+    ('Remarks', 170, False),
+    ('Running Balance', 90, True),
+)
+CELL_PADDING = 4
+# Every row is one line high, so each page holds a fixed number of rows and page N
+# always starts at row N * ROWS_PER_PAGE. That is what lets page ranges render independently.
+ROWS_PER_PAGE = int((PAGE_HEIGHT - 2 * MARGIN - TITLE_HEIGHT - ROW_HEIGHT) // ROW_HEIGHT)
+SUMMARY_ROWS = 4
+# Below this many rows starting a pool costs more than it saves
+PARALLEL_MIN_ROWS = 20000
+
+
+def can_render_in_parallel():
+    return pypdf is not None
+
+
+def data_pages(total_rows):
+    return max(1, math.ceil(total_rows / ROWS_PER_PAGE))
+
+
+def page_count(total_rows):
+    """Pages in a report of total_rows rows, including the summary block at the end."""
+    pages = data_pages(total_rows)
+    rows_on_last = total_rows - (pages - 1) * ROWS_PER_PAGE
+    if rows_on_last + SUMMARY_ROWS + 1 > ROWS_PER_PAGE:
+        pages += 1
+    return pages
+
+
+def _fit(text, width):
+    # Cut long remarks to the column instead of wrapping, which would break the fixed row height
+    width -= 2 * CELL_PADDING
+    if stringWidth(text, FONT, FONT_SIZE) <= width:
+        return text
+    text = text[:int(width / (FONT_SIZE * 0.4))]
+    while text and stringWidth(text + '...', FONT, FONT_SIZE) > width:
+        text = text[:-1]
+    return text + '...'
+
+
+class _PageWriter:
+    def __init__(self, fileobj, title, total_pages):
+        self.pdf = canvas.Canvas(fileobj, pagesize=letter, pageCompression=1)
+        self.pdf.setTitle(title)
+        self.title = title
+        self.total_pages = total_pages
+
+    def start_page(self, number):
+        pdf = self.pdf
+        pdf.setFont(BOLD_FONT, 12)
+        pdf.drawString(MARGIN, PAGE_HEIGHT - MARGIN - 12, self.title)
+        pdf.setFont(FONT, FONT_SIZE)
+        pdf.drawRightString(PAGE_WIDTH - MARGIN, PAGE_HEIGHT - MARGIN - 12, f"Page {number + 1} of {self.total_pages}")
+        y = PAGE_HEIGHT - MARGIN - TITLE_HEIGHT
+        pdf.setFillColor(colors.grey)
+        pdf.rect(MARGIN, y - ROW_HEIGHT, PAGE_WIDTH - 2 * MARGIN, ROW_HEIGHT, stroke=0, fill=1)
+        pdf.setFillColor(colors.whitesmoke)
+        pdf.setFont(BOLD_FONT, FONT_SIZE)
+        self._cells(y, [heading for heading, _, _ in COLUMNS])
+        pdf.setFillColor(colors.black)
+        pdf.setFont(FONT, FONT_SIZE)
+        return y - ROW_HEIGHT
+
+    def _cells(self, y, values):
+        x = MARGIN
+        baseline = y - ROW_HEIGHT + 4
+        for value, (_, width, right) in zip(values, COLUMNS):
+            if right:
+                self.pdf.drawRightString(x + width - CELL_PADDING, baseline, value)
+            else:
+                self.pdf.drawString(x + CELL_PADDING, baseline, value)
+            x += width
+
+    def row(self, y, row):
+        day, label, amount, category, remarks, running_balance = row
+        self._cells(y, [
+            str(day), label, str(amount), _fit(str(category), COLUMNS[3][1]),
+            _fit(str(remarks).replace('\n', ' '), COLUMNS[4][1]), str(running_balance),
+        ])
+        self.pdf.setStrokeColor(colors.lightgrey)
+        self.pdf.line(MARGIN, y - ROW_HEIGHT, PAGE_WIDTH - MARGIN, y - ROW_HEIGHT)
+
+    def summary(self, y, cash_in, cash_out, net_balance):
+        y -= ROW_HEIGHT
+        self.pdf.setFont(BOLD_FONT, FONT_SIZE)
+        self.pdf.drawString(MARGIN, y, 'Summary')
+        self.pdf.setFont(FONT, FONT_SIZE)
+        for label, value in (('Cash In', cash_in), ('Cash Out', cash_out), ('Net Balance', net_balance)):
+            y -= ROW_HEIGHT
+            self.pdf.drawString(MARGIN, y, label)
+            self.pdf.drawRightString(MARGIN + 200, y, str(value))
+
+    def next_page(self):
+        self.pdf.showPage()
+
+    def save(self):
+        self.pdf.showPage()
+        self.pdf.save()
+
+
+def render_pages(fileobj, title, rows, first_page=0, total_pages=1, summary=None):
+    """Draw rows ROWS_PER_PAGE to a page, numbering pages from first_page out of total_pages.
+
+    Each page is finished and compressed before the next row is read, so rows can come
+    straight off a database cursor. summary, a (cash_in, cash_out, net_balance) tuple,
+    is drawn after the last row.
+    """
+    writer = _PageWriter(fileobj, title, total_pages)
+    page = first_page
+    y = writer.start_page(page)
+    on_page = 0
+    for row in rows:
+        if on_page == ROWS_PER_PAGE:
+            writer.next_page()
+            page += 1
+            y = writer.start_page(page)
+            on_page = 0
+        writer.row(y, row)
+        y -= ROW_HEIGHT
+        on_page += 1
+    if summary is not None:
+        if on_page + SUMMARY_ROWS + 1 > ROWS_PER_PAGE:
+            writer.next_page()
+            page += 1
+            y = writer.start_page(page)
+        writer.summary(y, *summary)
+    writer.save()
+
+
+def _render_chunk(source, state, count, title, first_page, total_pages, summary, path):
+    # Runs in a pool process
+    with open(path, 'wb') as output:
+        render_pages(output, title, source.rows(state, count), first_page, total_pages, summary)
+    return count
+
+
+def render_parallel(fileobj, title, total_rows, summary, source, processes, progress=None):
+    """Split the report into page ranges, render them in a process pool and merge the parts.
+
+    source must be picklable and provide prepare(starts) -> {start_row: state} (called
+    once, here) and rows(state, count) (called in the pool process for each range).
+    """
+    total_pages = page_count(total_rows)
+    pages_per_chunk = math.ceil(data_pages(total_rows) / processes)
+    chunks = []
+    for first_page in range(0, data_pages(total_rows), pages_per_chunk):
+        start = first_page * ROWS_PER_PAGE
+        chunks.append((first_page, start, min(pages_per_chunk * ROWS_PER_PAGE, total_rows - start)))
+    states = source.prepare([start for _, start, _ in chunks])
+
+    with tempfile.TemporaryDirectory(prefix='cashbook-pdf-') as workdir:
+        paths = [os.path.join(workdir, f'{i}.pdf') for i in range(len(chunks))]
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_process) as pool:
+            futures = [
+                pool.submit(_render_chunk, source, states[start], count, title, first_page, total_pages,
+                            summary if i == len(chunks) - 1 else None, path)
+                for i, ((first_page, start, count), path) in enumerate(zip(chunks, paths))
+            ]
+            done = 0
+            for future in as_completed(futures):
+                done += future.result()
+                if progress is not None:
+                    progress(done)
+        merged = pypdf.PdfWriter()
+        for path in paths:
+            merged.append(path)
+        merged.write(fileobj)
+
+
+class EntryRows:
+    """Rows of one report's entries, addressable by position so page ranges can be fetched separately."""
+
+    def __init__(self, book_id, category_id=None):
+        self.book_id = book_id
+        self.category_id = category_id
+
+    def entries(self):
+        entries = CashEntry.objects.filter(book_id=self.book_id)
+        if self.category_id:
+            entries = entries.filter(category__id=self.category_id)
+        return entries
+
+    def prepare(self, starts):
+        """For each start row, the position of the row before it and the balance after that row.
+
+        One window query over the report finds every boundary at once.
+        """
+        states = {0: (None, Decimal('0'))}
+        boundaries = [start for start in starts if start > 0]
+        if boundaries:
+            marks = self.entries().oldest_first().with_running_balance().annotate(
+                row_number=Window(RowNumber(), order_by=[F(name).asc() for name in OLDEST_FIRST]),
+            ).filter(row_number__in=boundaries).values_list('row_number', 'date', 'time', 'id', 'running_balance')
+            for row_number, day, at, entry_id, running_balance in marks:
+                states[row_number] = ([day, at, entry_id], running_balance)
+        return states
+
+    def rows(self, state, count):
+        from .reports import report_rows  # reports imports this module
+
+        position, opening = state
+        entries = self.entries()
+        if position is not None:
+            entries = entries.filter(CursorPaginator(entries, count, OLDEST_FIRST).following(position))
+        return report_rows(entries, category_catalog(self.book_id).names, opening=opening, limit=count)
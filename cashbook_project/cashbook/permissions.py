@@ -0,0 +1,121 @@
+import time
+from django.conf import settings
+from .caching import stamp
+from .models import BookMember
+
+# Session key for the user's groups, stored with the stamp and time they were read at
+SESSION_GROUPS_KEY = 'cashbook_groups'
+
+
+def user_group_names(request):
+    """The current user's group names, read from the database once per request.
+
+    Permission checks use this, so they never trust the session copy: a demoted
+    Admin loses access on the very next request, whichever process serves it.
+    The names read are written back to the session for user_role.
+    """
+    if not hasattr(request, '_group_names'):
+        names = []
+        if request.user.is_authenticated:
+            # Lowest id first: the first group is the user's system role
+            names = list(request.user.groups.order_by('pk').values_list('name', flat=True))
+            _remember(request, names)
+        request._group_names = frozenset(names)
+        request.user_role = names[0] if names else None
+    return request._group_names
+
+
+def _remember(request, names):
+    session = getattr(request, 'session', None)
+    if session is None:
+        return
+    stored = {'user': request.user.pk, 'stamp': stamp('role', request.user.pk), 'groups': names,
+              'checked': int(time.time())}
+    previous = session.get(SESSION_GROUPS_KEY)
+    # Refresh the check time at most once a minute rather than saving the session on every request
+    if (not previous or {**previous, 'checked': 0} != {**stored, 'checked': 0}
+            or stored['checked'] - previous['checked'] > 60):
+        session[SESSION_GROUPS_KEY] = stored
+
+
+def user_role(request):
+    """The user's system role (Admin, Manager, Partner) for menus and labels, or None.
+
+    Served from the session copy while it is for this user, its role stamp is unchanged
+    and it is younger than USER_ROLE_SESSION_SECONDS; the stamp makes group changes show
+    at once where the cache is shared, the age bounds them where it is not. Anything that
+    grants access must use user_group_names instead.
+    """
+    if not hasattr(request, 'user_role'):
+        user = request.user
+        stored = getattr(request, 'session', {}).get(SESSION_GROUPS_KEY) if user.is_authenticated else None
+        if (stored and stored['user'] == user.pk and stored['stamp'] == stamp('role', user.pk)
+                and time.time() - stored['checked'] < settings.USER_ROLE_SESSION_SECONDS):
+            request.user_role = stored['groups'][0] if stored['groups'] else None
+        else:
+            user_group_names(request)
+    return request.user_role
+
+
+class BookAccess:
+    """What the request's user may do in one book.
+
+    Built from the user's group names and their BookMember role, each fetched at
+    most once per request, so every check after that is free.
+    """
+
+    def __init__(self, user, book, group_names, role):
+        self.user = user
+        self.book = book
+        self.group_names = group_names
+        self.role = role
+
+    @classmethod
+    def for_request(cls, request, book):
+        if not hasattr(request, '_book_access'):
+            request._book_access = {}
+        cache = request._book_access
+        if book.pk not in cache:
+            role = None
+            if request.user.is_authenticated:
+                role = BookMember.objects.filter(book=book, user=request.user).values_list('role', flat=True).first()
+            cache[book.pk] = cls(request.user, book, user_group_names(request), role)
+        return cache[book.pk]
+
+    @property
+    def is_system_admin(self):
+        return 'Admin' in self.group_names
+
+    @property
+    def is_manager(self):
+        return 'Manager' in self.group_names
+
+    @property
+    def is_partner(self):
+        return 'Partner' in self.group_names
+
+    @property
+    def is_creator(self):
+        return self.book.created_by_id == self.user.pk
+
+    @property
+    def is_member(self):
+        return self.role is not None
+
+    @property
+    def is_admin(self):
+        # Admins, the book creator and book admins can manage the book's users
+        return self.is_system_admin or self.is_creator or self.role == 'admin'
+
+    @property
+    def can_view(self):
+        return self.is_system_admin or self.is_creator or self.is_member
+
+    @property
+    def can_edit(self):
+        # Adding, editing and deleting entries
+        return self.is_system_admin or self.is_creator or self.role in ('admin', 'manager')
+
+    @property
+    def can_report(self):
+        return self.is_system_admin or self.is_manager or self.is_creator or self.role == 'admin'
@@ -0,0 +1,58 @@
+import hashlib
+import logging
+from io import BytesIO
+from django.utils import timezone
+from django.utils.http import http_date
+from .models import ReportJob
+
+logger = logging.getLogger(__name__)
+
+# Bump when the report layout changes so files rendered by older code are not served
+REPORT_FORMAT_VERSION = 1
+
+
+def cache_key(book_id, report_type, report_scope, category_id, data_version):
+    """Key for one rendering of a report: the same inputs always produce the same file."""
+    parts = [REPORT_FORMAT_VERSION, book_id, report_type, report_scope, category_id or '', data_version]
+    return hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def etag(key):
+    return f'"{key[:32]}"'
+
+
+def set_validators(response, key, modified):
+    """ETag/Last-Modified for a report response; no-cache makes browsers revalidate and get a 304."""
+    response['ETag'] = etag(key)
+    response['Last-Modified'] = http_date(modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def open_cached(key):
+    """An open binary file for a cached report, or None on a miss. Marks the entry recently used.
+
+    The cache is the finished ReportJob rows themselves: they sit in the database, so a
+    report rendered by the worker dyno is found by every web dyno.
+    """
+    job = ReportJob.objects.filter(cache_key=key, status=ReportJob.DONE).only('id', 'content').order_by('-id').first()
+    if job is None or not job.content:
+        return None
+    ReportJob.objects.filter(pk=job.pk).update(used_at=timezone.now())
+    return BytesIO(job.content)
+
+
+def evict(max_bytes):
+    """Delete the least recently used finished reports until they fit in max_bytes. Returns bytes freed."""
+    cached = ReportJob.objects.filter(status=ReportJob.DONE).exclude(cache_key='')
+    total = 0
+    evicted = []
+    for job_id, size in cached.order_by('-used_at', '-id').values_list('id', 'size'):
+        total += size
+        if total > max_bytes:
+            evicted.append((job_id, size))
+    freed = sum(size for _, size in evicted)
+    ReportJob.objects.filter(pk__in=[job_id for job_id, _ in evicted]).delete()
+    if freed:
+        logger.info(f"Report cache evicted {freed} bytes")
+    return freed
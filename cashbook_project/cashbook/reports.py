@@ -0,0 +1,205 @@
+import csv
+import json
+from decimal import Decimal
+from itertools import chain, islice
+import openpyxl
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from .categories import category_catalog
+from .models import BookBalance, CashEntry, Category, summary_totals
+from .pdf_report import (PARALLEL_MIN_ROWS, EntryRows, can_render_in_parallel, page_count, render_pages,
+                         render_parallel)
+
+REPORT_CHUNK_SIZE = 2000
+# Rows looked at to size the columns; later rows are streamed without being measured
+WIDTH_SAMPLE_ROWS = 500
+MAX_COLUMN_WIDTH = 60
+
+EXCEL_HEADERS = ['Date', 'Type', 'Amount', 'Category', 'Remarks', 'Running Balance']
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+STREAM_HEADERS = ['id', 'date', 'time', 'type', 'amount', 'category', 'remarks', 'running_balance']
+# Rows buffered into one chunk of a streamed response; bigger chunks mean fewer, larger writes
+STREAM_BATCH_ROWS = 200
+STREAM_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+REPORT_EXTENSIONS = {'pdf': 'pdf', 'excel': 'xlsx', 'csv': 'csv', 'jsonl': 'jsonl'}
+
+
+def report_data(book, report_scope, category_id=None):
+    """Entries, heading and totals for a report: (entries, category_name, cash_in, cash_out, entry_count).
+
+    Totals come from the stored ledger or the monthly rollups, never from the entries.
+    """
+    entries = CashEntry.objects.filter(book=book)
+    if report_scope == 'category' and category_id:
+        category_name = category_catalog(book.id).name(category_id)
+        if category_name is None:
+            raise Category.DoesNotExist(f"Category {category_id} is not in book {book.id}.")
+        entries = entries.filter(category__id=category_id)
+        cash_in, cash_out, count = summary_totals(book, category_id=category_id)
+    else:
+        category_name = 'All Categories'
+        balance = BookBalance.for_book(book)
+        cash_in, cash_out, count = balance.cash_in, balance.cash_out, balance.entry_count
+    return entries, category_name, cash_in, cash_out, count
+
+
+def report_filename(book, report_type, report_scope):
+    return f"cashbook_report_{book.name}_{report_scope}.{REPORT_EXTENSIONS[report_type]}"
+
+
+def _counted(rows, progress):
+    # Tell the caller how many rows are done once per chunk
+    if progress is None:
+        yield from rows
+        return
+    done = 0
+    for done, row in enumerate(rows, 1):
+        yield row
+        if done % REPORT_CHUNK_SIZE == 0:
+            progress(done)
+    progress(done)
+
+
+def report_rows(entries, category_names, progress=None, opening=Decimal('0'), limit=None):
+    """(date, type, amount, category, remarks, running balance) tuples, oldest first.
+
+    Reads plain tuples in chunks (no model instances, category names from the book's
+    catalog rather than a join), so memory stays flat however many entries the book
+    has. opening and limit let a caller render one slice of a report that starts
+    after some earlier rows.
+    """
+    type_labels = dict(CashEntry.TRANSACTION_TYPES)
+    rows = entries.oldest_first().with_running_balance(opening).values_list(
+        'date', 'transaction_type', 'amount', 'category_id', 'remarks', 'running_balance',
+    )
+    if limit is not None:
+        rows = rows[:limit]
+    rows = rows.iterator(chunk_size=REPORT_CHUNK_SIZE)
+    for day, transaction_type, amount, category_id, remarks, running_balance in _counted(rows, progress):
+        yield (day, type_labels.get(transaction_type, transaction_type), amount, category_names.get(category_id) or 'N/A',
+               remarks or 'N/A', running_balance)
+
+
+def column_widths(header, rows):
+    widths = [len(str(value)) for value in header]
+    for row in rows:
+        for i, value in enumerate(row):
+            widths[i] = max(widths[i], len(str(value)))
+    return [min(width + 2, MAX_COLUMN_WIDTH) for width in widths]
+
+
+def write_pdf_report(fileobj, book, entries, category_name, cash_in, cash_out, net_balance, progress=None,
+                     total_rows=0):
+    """Render the entry report page by page straight from the row iterator (see pdf_report)."""
+    render_pages(fileobj, f"Cashbook Report - {book.name} ({category_name})",
+                 report_rows(entries, category_catalog(book.id).names, progress),
+                 total_pages=page_count(total_rows), summary=(cash_in, cash_out, net_balance))
+
+
+def write_excel_report(fileobj, book, entries, category_name, cash_in, cash_out, net_balance, progress=None):
+    """Write the entry report as XLSX to fileobj using openpyxl's write-only mode.
+
+    Rows are flushed to disk as they are appended, so peak memory does not grow with
+    the number of entries.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    # Sheet titles are capped at 31 characters and may not contain []:*?/\
+    worksheet = workbook.create_sheet(title=''.join(c for c in f"{book.name} Report" if c not in '[]:*?/\\')[:31])
+
+    rows = report_rows(entries, category_catalog(book.id).names, progress)
+    sample = list(islice(rows, WIDTH_SAMPLE_ROWS))
+    # Column widths have to be set before the first row is written
+    for letter, width in zip('ABCDEF', column_widths(EXCEL_HEADERS, sample)):
+        worksheet.column_dimensions[letter].width = width
+
+    worksheet.append([f"Cashbook Report - {book.name} ({category_name})"])
+    worksheet.append(EXCEL_HEADERS)
+    for row in chain(sample, rows):
+        worksheet.append(row)
+
+    worksheet.append([])
+    worksheet.append(['Summary'])
+    worksheet.append(['Cash In', cash_in])
+    worksheet.append(['Cash Out', cash_out])
+    worksheet.append(['Net Balance', net_balance])
+    workbook.save(fileobj)
+
+
+def stream_rows(entries, category_names, progress=None):
+    """Entry rows in STREAM_HEADERS order, oldest first, with the running balance added in Python.
+
+    Runs on a server-side cursor and keeps nothing but the balance between rows, so the
+    first row goes out as soon as the database returns it.
+    """
+    balance = 0
+    rows = entries.oldest_first().values_list(
+        'id', 'date', 'time', 'transaction_type', 'amount', 'category_id', 'remarks',
+    ).iterator(chunk_size=REPORT_CHUNK_SIZE)
+    for entry_id, day, at, transaction_type, amount, category_id, remarks in _counted(rows, progress):
+        balance += amount if transaction_type == 'IN' else -amount
+        yield entry_id, day, at, transaction_type, amount, category_names.get(category_id, ''), remarks, balance
+
+
+class _Echo:
+    # csv.writer wants a file; this one hands each formatted line straight back
+    def write(self, value):
+        return value
+
+
+def _batched(lines):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= STREAM_BATCH_ROWS:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def csv_report(entries, category_names, progress=None):
+    """Generator of CSV text chunks: a header line, then one line per entry."""
+    writer = csv.writer(_Echo())
+    lines = chain([writer.writerow(STREAM_HEADERS)],
+                  (writer.writerow(row) for row in stream_rows(entries, category_names, progress)))
+    return _batched(lines)
+
+
+def jsonl_report(entries, category_names, progress=None):
+    """Generator of JSON Lines chunks, one object per entry. Money is written as strings."""
+    lines = (json.dumps(dict(zip(STREAM_HEADERS, row)), cls=DjangoJSONEncoder) + '\n'
+             for row in stream_rows(entries, category_names, progress))
+    return _batched(lines)
+
+
+STREAM_WRITERS = {
+    'csv': csv_report,
+    'jsonl': jsonl_report,
+}
+
+
+def write_report(fileobj, book, report_type, report_scope, category_id=None, progress=None):
+    """Render any report type into a binary file object.
+
+    progress, if given, is called with (rows_done, total_rows) as the entries are read.
+    """
+    entries, category_name, cash_in, cash_out, total = report_data(book, report_scope, category_id)
+    track = None if progress is None else (lambda done: progress(done, total))
+    if report_type in STREAM_WRITERS:
+        for chunk in STREAM_WRITERS[report_type](entries, category_catalog(book.id).names, track):
+            fileobj.write(chunk.encode('utf-8'))
+        return
+    if report_type == 'pdf':
+        processes = settings.REPORT_PDF_PROCESSES
+        if processes > 1 and total >= PARALLEL_MIN_ROWS and can_render_in_parallel():
+            source = EntryRows(book.id, category_id if report_scope == 'category' else None)
+            render_parallel(fileobj, f"Cashbook Report - {book.name} ({category_name})", total,
+                            (cash_in, cash_out, cash_in - cash_out), source, processes, track)
+        else:
+            write_pdf_report(fileobj, book, entries, category_name, cash_in, cash_out, cash_in - cash_out, track, total)
+        return
+    write_excel_report(fileobj, book, entries, category_name, cash_in, cash_out, cash_in - cash_out, track)
@@ -0,0 +1,145 @@
+import re
+from decimal import Decimal
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from .models import CashEntry, NEWEST_FIRST
+
+FTS_TABLE = 'cashbook_cashentry_fts'
+SEARCH_CONFIG = 'simple'
+
+NUMBER = r'\d[\d,]*(?:\.\d+)?'
+AMOUNT_RANGE = re.compile(rf'^({NUMBER})\.\.({NUMBER})$')
+AMOUNT_COMPARE = re.compile(rf'^(>=|<=|>|<|=)?({NUMBER})$')
+COMPARE_LOOKUPS = {'>': 'gt', '>=': 'gte', '<': 'lt', '<=': 'lte', '=': 'exact', None: 'exact'}
+WORD = re.compile(r'\w+')
+
+
+def parse_search(text):
+    """Split a search box query into an amount condition and free-text words.
+
+    `500` matches that exact amount, `>500` / `<=20` compare and `100..200` is an
+    inclusive range. Everything else is a word looked up in remarks and the optional field.
+    """
+    amount = Q()
+    words = []
+    for token in text.split():
+        match = AMOUNT_RANGE.match(token)
+        if match:
+            low, high = sorted(Decimal(value.replace(',', '')) for value in match.groups())
+            amount &= Q(amount__gte=low, amount__lte=high)
+            continue
+        match = AMOUNT_COMPARE.match(token)
+        if match:
+            amount &= Q(**{f'amount__{COMPARE_LOOKUPS[match.group(1)]}': Decimal(match.group(2).replace(',', ''))})
+            continue
+        words.extend(word.lower() for word in WORD.findall(token))
+    return amount, words
+
+
+def search_entries(entries, text, ranked=False):
+    """Filter entries by a search box query using the database's text index.
+
+    With ranked=True the result is ordered by relevance (newest first on ties) and
+    carries a `search_rank` annotation.
+    """
+    amount, words = parse_search(text)
+    entries = entries.filter(amount)
+    if not words:
+        return entries.annotate(search_rank=Value(0.0, output_field=FloatField())).newest_first() if ranked else entries
+    if connection.vendor == 'postgresql':
+        return _postgres_search(entries, words, ranked)
+    if connection.vendor == 'sqlite':
+        return _sqlite_search(entries, words, ranked)
+    # No text index on this backend: plain LIKE per word
+    for word in words:
+        entries = entries.filter(Q(remarks__icontains=word) | Q(optional_field__icontains=word))
+    return entries.annotate(search_rank=Value(0.0, output_field=FloatField())).newest_first() if ranked else entries
+
+
+# PostgreSQL: tsvector GIN index for whole words and prefixes, pg_trgm for typos and word fragments
+
+def search_vector():
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector('remarks', 'optional_field', config=SEARCH_CONFIG)
+
+
+def postgres_search_indexes():
+    """Indexes the PostgreSQL search relies on; the expressions must match the queries below."""
+    from django.contrib.postgres.indexes import GinIndex, OpClass
+    return [
+        GinIndex(search_vector(), name='entry_search_idx'),
+        GinIndex(OpClass('remarks', name='gin_trgm_ops'), name='entry_remarks_trgm_idx'),
+        GinIndex(OpClass('optional_field', name='gin_trgm_ops'), name='entry_optional_trgm_idx'),
+    ]
+
+
+def _postgres_search(entries, words, ranked):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+    from django.db.models.functions import Greatest
+
+    # Every word as a prefix: "rent" also finds "rental"
+    query = SearchQuery(' & '.join(f"'{word}':*" for word in words), config=SEARCH_CONFIG, search_type='raw')
+    phrase = ' '.join(words)
+    entries = entries.annotate(search=search_vector()).filter(
+        Q(search=query)
+        | Q(remarks__trigram_word_similar=phrase)
+        | Q(optional_field__trigram_word_similar=phrase)
+    )
+    if not ranked:
+        return entries
+    return entries.annotate(
+        search_rank=SearchRank(search_vector(), query) + Greatest(
+            TrigramWordSimilarity(phrase, 'remarks'), TrigramWordSimilarity(phrase, 'optional_field')),
+    ).order_by('-search_rank', *NEWEST_FIRST)
+
+
+# SQLite: external-content FTS5 table kept in step with cashbook_cashentry by triggers.
+# A migration that rebuilds cashbook_cashentry on SQLite drops the triggers, so it has
+# to call install_sqlite_fts() again afterwards.
+
+SQLITE_FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        remarks, optional_field, content='cashbook_cashentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON cashbook_cashentry BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, remarks, optional_field) VALUES (new.id, new.remarks, new.optional_field);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON cashbook_cashentry BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, remarks, optional_field)
+        VALUES ('delete', old.id, old.remarks, old.optional_field);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF remarks, optional_field ON cashbook_cashentry BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, remarks, optional_field)
+        VALUES ('delete', old.id, old.remarks, old.optional_field);
+        INSERT INTO {FTS_TABLE}(rowid, remarks, optional_field) VALUES (new.id, new.remarks, new.optional_field);
+    END""",
+]
+
+
+def install_sqlite_fts(schema_editor):
+    for statement in SQLITE_FTS_SCHEMA:
+        schema_editor.execute(statement)
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def remove_sqlite_fts(schema_editor):
+    for suffix in ('insert', 'delete', 'update'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def _sqlite_search(entries, words, ranked):
+    # Quoted prefix terms, implicitly ANDed; quoting keeps FTS5 operators in user input literal
+    match = ' '.join(f'"{word}"*' for word in words)
+    table = CashEntry._meta.db_table
+    entries = entries.filter(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,)))
+    if not ranked:
+        return entries
+    # bm25() is lower for better matches
+    rank = RawSQL(
+        f'SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id',
+        (match,), output_field=FloatField(),
+    )
+    return entries.annotate(search_rank=rank).order_by('-search_rank', *NEWEST_FIRST)
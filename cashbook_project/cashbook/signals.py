@@ -0,0 +1,121 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .caching import bump, bump_users
+from .categories import forget_categories
+from .models import (
+    Book, BookBalance, BookMember, CashEntry, Category, DailyBookSummary, MonthlyBookSummary,
+    add_entry_change, apply_entry_changes, ledger_suspended,
+)
+
+
+@receiver(post_save, sender=Book)
+def create_book_balance(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        # The new row's random categories_stamp keeps a reused id (tests, restored backups)
+        # from inheriting another book's cached categories
+        BookBalance.objects.get_or_create(book=instance)
+        bump_users([instance.created_by_id])
+    else:
+        # Renamed: report titles and other cached views of the book change
+        BookBalance.touch([instance.pk])
+        # and the book moves in (or out of a search on) everyone's homepage list
+        bump_users([instance.created_by_id, *instance.members.values_list('user_id', flat=True)])
+
+
+# Members lose theirs through the BookMember cascade
+@receiver(post_delete, sender=Book)
+def forget_deleted_book(sender, instance, **kwargs):
+    bump_users([instance.created_by_id])
+
+
+# The homepage shows member counts, and a membership decides whether the user sees the book at all
+@receiver(post_save, sender=BookMember)
+@receiver(post_delete, sender=BookMember)
+def touch_book_for_member(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    BookBalance.touch([instance.book_id])
+    bump_users([instance.user_id])
+
+
+# Admins, managers and partners see different sets of books and menus
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    user_ids = [instance.pk] if isinstance(instance, User) else (pk_set or [])
+    bump_users(user_ids)
+    # The role kept in each user's session is re-read on their next request
+    bump('role', user_ids)
+
+
+# Cached entry lists show who added each entry, so a rename is new data for every book they wrote in
+@receiver(pre_save, sender=User)
+def remember_old_username(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.pk is None or (update_fields is not None and 'username' not in update_fields):
+        return
+    instance._old_username = User.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def touch_books_for_username(sender, instance, raw=False, **kwargs):
+    old_username = instance.__dict__.pop('_old_username', None)
+    if not raw and old_username is not None and old_username != instance.username:
+        BookBalance.touch(CashEntry.objects.filter(user_id=instance.pk).values('book_id'))
+
+
+# Category names appear in reports and the entry list, so they count as book data
+@receiver(post_save, sender=Category)
+def touch_book_for_category(sender, instance, raw=False, **kwargs):
+    if not raw:
+        BookBalance.touch([instance.book_id])
+        forget_categories([instance.book_id])
+
+
+# Single-row deletes (delete_entry, admin, cascades from User/Book) go through the
+# deletion collector, which sends these inside its own transaction
+@receiver(pre_delete, sender=CashEntry)
+def lock_balance_for_entry_delete(sender, instance, **kwargs):
+    if not ledger_suspended():
+        BookBalance.lock([instance.book_id])
+
+
+@receiver(post_delete, sender=CashEntry)
+def remove_entry_from_balance(sender, instance, **kwargs):
+    if ledger_suspended():
+        return
+    changes = add_entry_change({}, instance.book_id, instance.date, instance.category_id,
+                               instance.transaction_type, -instance.amount, -1)
+    apply_entry_changes(changes, create_missing=False)
+
+
+# The cascade removes the category's rollup rows before post_delete could look for them
+@receiver(pre_delete, sender=Category)
+def note_category_rollups(sender, instance, **kwargs):
+    instance._has_rollups = DailyBookSummary.objects.filter(category=instance).exists()
+
+
+# Deleting a category nulls its entries without going through CashEntry.save(),
+# so the book's rollups are regrouped once the deletion (and any cascade that
+# removes the book itself) has committed
+@receiver(post_delete, sender=Category)
+def regroup_summaries_for_category(sender, instance, **kwargs):
+    book_id = instance.book_id
+    forget_categories([book_id])
+    if not instance.__dict__.pop('_has_rollups', True):
+        # Nothing was filed under it (delete_category only allows empty categories): only its name goes
+        BookBalance.touch([book_id])
+        return
+
+    def regroup():
+        if Book.objects.filter(pk=book_id).exists():
+            with transaction.atomic():
+                DailyBookSummary.rebuild([book_id])
+                MonthlyBookSummary.rebuild([book_id])
+                BookBalance.touch([book_id])
+
+    transaction.on_commit(regroup)
@@ -1,3 +1,1676 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time as clock
+from io import BytesIO, StringIO
+from datetime import date, time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.contrib.auth.models import Group, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, override_settings, tag
+from unittest import skipUnless
+from unittest.mock import patch
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import openpyxl
+import pypdf
+from PIL import Image
+from . import api, imports, models, report_cache
+from .categories import category_catalog
+from .images import process_entry_image
+from .jobs import render_job
+from .models import (Book, BookBalance, BookMember, CashEntry, Category, DailyBookSummary, MonthlyBookSummary,
+                     NEWEST_FIRST, ReportJob, UserCacheStamp, summary_totals)
+from .management.commands.benchmark_pdf_report import SyntheticRows
+from .pagination import CursorPaginator, InvalidCursor
+from .permissions import BookAccess, user_group_names
+from .pdf_report import ROWS_PER_PAGE, EntryRows, can_render_in_parallel, page_count, render_pages, render_parallel
+from .reports import report_rows
+from .search import parse_search, search_entries
 
-# Create your tests here.
+
+def query_plan(queryset):
+    """EXPLAIN output for a queryset, with index-avoidance switched off on PostgreSQL.
+
+    A tiny test table is cheaper to scan than to search, so PostgreSQL would pick a
+    sequential scan even with a perfect index. Disabling seq scans and sorts makes it
+    fall back to them only when no index can serve the query.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            cursor.execute('SET enable_sort = off')
+        try:
+            return queryset.explain()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+                cursor.execute('RESET enable_sort')
+    return queryset.explain()
+
+
+def plan_problems(plan, table='cashbook_cashentry'):
+    """Lines of a plan that scan the whole entry table or sort its rows."""
+    problems = []
+    for line in plan.splitlines():
+        if connection.vendor == 'postgresql':
+            if re.search(rf'Seq Scan on {table}\b', line) or re.search(r'(^|->\s*)(Incremental )?Sort\b', line.strip()):
+                problems.append(line.strip())
+        elif connection.vendor == 'sqlite':
+            if re.search(rf'\bSCAN {table}\b', line) or 'USE TEMP B-TREE' in line:
+                problems.append(line.strip())
+    return problems
+
+
+class QueryPlanTestCase(TestCase):
+    def assertIndexedPlan(self, queryset):
+        plan = query_plan(queryset)
+        problems = plan_problems(plan)
+        self.assertFalse(problems, f"Query falls back to a scan or sort:\n{plan}\n\nSQL: {queryset.query}")
+
+
+class CashEntryQueryPlanTests(QueryPlanTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        books = [Book.objects.create(name=f'Book {i}', created_by=cls.user) for i in range(3)]
+        cls.book = books[0]
+        cls.categories = [Category.objects.create(name=f'Cat {i}', book=cls.book, created_by=cls.user) for i in range(4)]
+        start = date(2024, 1, 1)
+        entries = []
+        for book in books:
+            for i in range(400):
+                entries.append(CashEntry(
+                    book=book,
+                    user=cls.user,
+                    date=start + timedelta(days=i % 120),
+                    time=time(i % 24, i % 60),
+                    transaction_type='IN' if i % 3 else 'OUT',
+                    amount=Decimal(10 + i % 50),
+                    category=cls.categories[i % 4] if book == cls.book else None,
+                    remarks=f'entry {i}',
+                ))
+        CashEntry.objects.bulk_create(entries)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def entries(self):
+        return CashEntry.objects.filter(book=self.book)
+
+    def test_book_detail_page(self):
+        self.assertIndexedPlan(self.entries().newest_first()[:10])
+
+    def test_book_detail_date_range(self):
+        self.assertIndexedPlan(
+            self.entries().filter(date__gte=date(2024, 2, 1), date__lte=date(2024, 2, 29)).newest_first()[:10])
+
+    def test_book_detail_category(self):
+        self.assertIndexedPlan(self.entries().filter(category__id=self.categories[1].id).newest_first()[:10])
+
+    def test_book_detail_transaction_type(self):
+        self.assertIndexedPlan(self.entries().filter(transaction_type='OUT').newest_first()[:10])
+
+    def test_download_report_all(self):
+        self.assertIndexedPlan(self.entries().oldest_first())
+
+    def test_media_lookup(self):
+        for field in ('image', 'thumbnail', 'preview'):
+            self.assertIndexedPlan(CashEntry.objects.filter(**{field: 'cashbook_images/a.jpg', f'{field}__gt': ''}))
+
+    def test_download_report_category(self):
+        self.assertIndexedPlan(self.entries().filter(category__id=self.categories[2].id).oldest_first())
+
+
+class BookAccessTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        groups = {name: Group.objects.create(name=name) for name in ('Admin', 'Manager', 'Partner')}
+        cls.creator = User.objects.create_user(username='creator', password='pw')
+        cls.book = Book.objects.create(name='Access', created_by=cls.creator)
+        cls.users = {'creator': cls.creator}
+        for name, group in (('system admin', 'Admin'), ('manager group', 'Manager'), ('non-member', 'Partner')):
+            cls.users[name] = User.objects.create_user(username=name.replace(' ', '-'), password='pw')
+            cls.users[name].groups.add(groups[group])
+        for role in ('admin', 'manager', 'partner'):
+            user = cls.users[f'book {role}'] = User.objects.create_user(username=f'book-{role}', password='pw')
+            user.groups.add(groups['Partner'])
+            BookMember.objects.create(book=cls.book, user=user, role=role, created_by=cls.creator)
+
+    def setUp(self):
+        cache.clear()
+
+    def access(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return BookAccess.for_request(request, self.book), request
+
+    def test_each_role(self):
+        # can_view, can_edit, can_report, is_admin
+        expected = {
+            'system admin': (True, True, True, True),
+            'manager group': (False, False, True, False),
+            'creator': (True, True, True, True),
+            'book admin': (True, True, True, True),
+            'book manager': (True, True, False, False),
+            'book partner': (True, False, False, False),
+            'non-member': (False, False, False, False),
+        }
+        for name, flags in expected.items():
+            access, _ = self.access(self.users[name])
+            self.assertEqual((access.can_view, access.can_edit, access.can_report, access.is_admin), flags, name)
+
+    def test_at_most_two_permission_queries(self):
+        with self.assertNumQueries(2):
+            access, request = self.access(self.users['book manager'])
+            access.can_view, access.can_edit, access.can_report, access.is_admin
+        with self.assertNumQueries(0):
+            again = BookAccess.for_request(request, self.book)
+            self.assertIs(again, access)
+            again.can_edit, user_group_names(request)
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Paged', created_by=user)
+        # Several entries share a date and time so the id tie-breaker matters
+        CashEntry.objects.bulk_create([
+            CashEntry(book=cls.book, user=user, date=date(2024, 1, 1 + i // 7), time=time(9, (i // 3) % 60),
+                      transaction_type='IN', amount=Decimal('1.00'))
+            for i in range(25)
+        ])
+
+    def test_walks_every_entry_once_in_both_directions(self):
+        entries = CashEntry.objects.filter(book=self.book)
+        expected = list(entries.newest_first().values_list('id', flat=True))
+        paginator = CursorPaginator(entries, 10, ordering=NEWEST_FIRST)
+
+        pages = [paginator.page()]
+        while pages[-1].has_next:
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([e.id for page in pages for e in page], expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertFalse(pages[0].has_previous)
+
+        back = pages[-1]
+        seen = []
+        while back.has_previous:
+            back = paginator.page(back.previous_cursor)
+            seen = [e.id for e in back] + seen
+        self.assertEqual(seen, expected[:20])
+
+    def test_rejects_tampered_cursor(self):
+        paginator = CursorPaginator(CashEntry.objects.filter(book=self.book), 10, ordering=NEWEST_FIRST)
+        cursor = paginator.page().next_cursor
+        with self.assertRaises(InvalidCursor):
+            paginator.page(cursor[:-2] + 'xx')
+
+
+class RunningBalanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Balances', created_by=cls.user)
+        CashEntry.objects.bulk_create([
+            CashEntry(book=cls.book, user=cls.user, date=date(2024, 1, 1) + timedelta(days=i // 4),
+                      time=time(8 + i % 4), transaction_type='OUT' if i % 3 == 0 else 'IN',
+                      amount=Decimal(i + 1))
+            for i in range(35)
+        ])
+
+    def expected_balances(self, entries):
+        balance, balances = Decimal('0'), {}
+        for entry in entries.oldest_first():
+            balance += entry.amount if entry.transaction_type == 'IN' else -entry.amount
+            balances[entry.id] = balance
+        return balances
+
+    def collect_pages(self, params=''):
+        self.client.force_login(self.user)
+        url = f'/book/{self.book.id}/?{params}'
+        seen = {}
+        while url:
+            response = self.client.get(url)
+            for entry, running_balance in response.context['entry_data']:
+                seen[entry.id] = running_balance
+            page = response.context['page_obj']
+            url = f'/book/{self.book.id}/?{params}&cursor={page.next_cursor}' if page.has_next else None
+        return seen
+
+    def test_book_detail_balances_are_cumulative_across_pages(self):
+        self.assertEqual(self.collect_pages(), self.expected_balances(CashEntry.objects.filter(book=self.book)))
+
+    def test_book_detail_balances_follow_filters(self):
+        expected = self.expected_balances(CashEntry.objects.filter(book=self.book, transaction_type='IN'))
+        self.assertEqual(self.collect_pages('type=IN'), expected)
+
+    def test_report_queryset_running_balance(self):
+        entries = CashEntry.objects.filter(book=self.book)
+        annotated = {entry.id: entry.running_balance for entry in entries.oldest_first().with_running_balance()}
+        self.assertEqual(annotated, self.expected_balances(entries))
+
+
+class SummaryRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Rollups', created_by=cls.user)
+        cls.categories = [Category.objects.create(name=f'Cat {i}', book=cls.book, created_by=cls.user) for i in range(2)]
+        CashEntry.objects.bulk_create([
+            CashEntry(book=cls.book, user=cls.user, date=date(2024, 1, 20) + timedelta(days=i * 3), time=time(10),
+                      transaction_type='OUT' if i % 4 == 0 else 'IN', amount=Decimal(i + 1),
+                      category=cls.categories[i % 2] if i % 3 else None)
+            for i in range(60)
+        ])
+
+    def snapshot(self, model):
+        return sorted(model.objects.filter(book=self.book).values_list(
+            model.period_field, 'category_id', 'transaction_type', 'total', 'entry_count'), key=str)
+
+    def assertRollupsMatchRebuild(self):
+        for model in (DailyBookSummary, MonthlyBookSummary):
+            incremental = self.snapshot(model)
+            model.rebuild([self.book.id])
+            self.assertEqual(incremental, self.snapshot(model), model.__name__)
+
+    def test_rollups_follow_every_write_path(self):
+        self.assertRollupsMatchRebuild()
+        entry = CashEntry.objects.filter(book=self.book).first()
+        entry.amount, entry.date, entry.transaction_type = Decimal('99.50'), date(2024, 6, 1), 'OUT'
+        entry.save()
+        CashEntry.objects.create(book=self.book, user=self.user, date=date(2024, 3, 3), time=time(9),
+                                 transaction_type='IN', amount=Decimal('7.00'), category=self.categories[0])
+        CashEntry.objects.filter(book=self.book, category=self.categories[1]).update(category=self.categories[0])
+        CashEntry.objects.filter(book=self.book, date__month=2).delete()
+        CashEntry.objects.filter(book=self.book).last().delete()
+        self.assertRollupsMatchRebuild()
+
+    def test_bulk_path_matches_row_by_row(self):
+        # Large change sets are read and rewritten in bulk; force that path for every write
+        with patch.object(DailyBookSummary, 'BULK_THRESHOLD', 0), patch.object(MonthlyBookSummary, 'BULK_THRESHOLD', 0):
+            self.test_rollups_follow_every_write_path()
+            CashEntry.objects.filter(book=self.book).delete()
+        self.assertEqual(self.snapshot(DailyBookSummary), [])
+
+    def test_rebuild_locks_before_replacing_rows(self):
+        locked_at = []
+        lock = BookBalance.lock
+
+        def locking(book_ids):
+            locked_at.append(len(queries.captured_queries))
+            lock(book_ids)
+
+        with patch.object(BookBalance, 'lock', side_effect=locking), CaptureQueriesContext(connection) as queries:
+            DailyBookSummary.rebuild([self.book.id])
+        first_delete = next(i for i, query in enumerate(queries.captured_queries)
+                            if query['sql'].startswith('DELETE'))
+        self.assertEqual(len(locked_at), 1)
+        self.assertLessEqual(locked_at[0], first_delete)
+
+    def test_category_delete_regroups_only_when_it_had_entries(self):
+        empty = Category.objects.create(name='Unused', book=self.book, created_by=self.user)
+        with patch.object(DailyBookSummary, 'rebuild') as rebuild, self.captureOnCommitCallbacks(execute=True):
+            empty.delete()
+        rebuild.assert_not_called()
+        category_id = self.categories[0].id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categories[0].delete()
+        self.assertFalse(DailyBookSummary.objects.filter(category_id=category_id).exists())
+        self.assertTrue(DailyBookSummary.objects.filter(book=self.book, category=None).exists())
+        self.assertRollupsMatchRebuild()
+
+    def test_summary_totals_match_entry_aggregates(self):
+        entries = CashEntry.objects.filter(book=self.book)
+        ranges = [(None, None), (date(2024, 2, 1), date(2024, 3, 31)), (date(2024, 1, 25), date(2024, 5, 10)),
+                  (date(2024, 2, 3), date(2024, 2, 20)), (date(2024, 4, 30), None)]
+        for start, end in ranges:
+            for category_id in (None, self.categories[1].id):
+                scoped = entries
+                if start:
+                    scoped = scoped.filter(date__gte=start)
+                if end:
+                    scoped = scoped.filter(date__lte=end)
+                if category_id:
+                    scoped = scoped.filter(category_id=category_id)
+                expected = (
+                    scoped.filter(transaction_type='IN').aggregate(total=Sum('amount'))['total'] or 0,
+                    scoped.filter(transaction_type='OUT').aggregate(total=Sum('amount'))['total'] or 0,
+                    scoped.count(),
+                )
+                self.assertEqual(summary_totals(self.book, start, end, category_id=category_id), expected,
+                                 (start, end, category_id))
+
+
+class BookBalanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Ledger', created_by=cls.user)
+        cls.other = Book.objects.create(name='Other', created_by=cls.user)
+        cls.category = Category.objects.create(name='Rent', book=cls.book, created_by=cls.user)
+        for i in range(6):
+            CashEntry.objects.create(book=cls.book, user=cls.user, date=date(2024, 1, i + 1), time=time(9),
+                                     transaction_type='OUT' if i % 3 == 0 else 'IN', amount=Decimal(f'{i + 1}.25'))
+
+    def assertBalancesMatchEntries(self):
+        for book in (self.book, self.other):
+            entries = CashEntry.objects.filter(book=book)
+            cash_in = entries.filter(transaction_type='IN').aggregate(total=Sum('amount'))['total'] or 0
+            cash_out = entries.filter(transaction_type='OUT').aggregate(total=Sum('amount'))['total'] or 0
+            balance = BookBalance.objects.get(book=book)
+            self.assertEqual((balance.cash_in, balance.cash_out, balance.net, balance.entry_count),
+                             (cash_in, cash_out, cash_in - cash_out, entries.count()), book.name)
+
+    def test_every_write_path_keeps_the_balance(self):
+        self.assertBalancesMatchEntries()
+        entry = CashEntry.objects.filter(book=self.book).first()
+        entry.amount, entry.transaction_type = Decimal('40.10'), 'OUT'
+        entry.save()
+        moved = CashEntry.objects.filter(book=self.book).last()
+        moved.book = self.other
+        moved.save()
+        CashEntry.objects.filter(book=self.book).first().delete()
+        self.assertBalancesMatchEntries()
+        CashEntry.objects.bulk_create([
+            CashEntry(book=self.other, user=self.user, date=date(2024, 2, i + 1), time=time(9),
+                      transaction_type='IN', amount=Decimal('3.30')) for i in range(4)])
+        CashEntry.objects.filter(book=self.book, transaction_type='IN').update(amount=Decimal('0.99'))
+        CashEntry.objects.filter(book=self.other).update(book=self.book)
+        CashEntry.objects.filter(book=self.book, transaction_type='OUT').delete()
+        self.assertBalancesMatchEntries()
+
+    def test_rebuild_counts_entries_after_locking(self):
+        events = []
+        lock, totals = BookBalance.lock, models.entry_totals
+
+        def locking(book_ids):
+            events.append('lock')
+            lock(book_ids)
+
+        def counting(queryset):
+            events.append('totals')
+            return totals(queryset)
+
+        BookBalance.objects.filter(book=self.other).delete()
+        BookBalance.objects.filter(book=self.book).update(cash_in=0, entry_count=0)
+        with patch.object(BookBalance, 'lock', side_effect=locking), \
+                patch('cashbook.models.entry_totals', side_effect=counting), \
+                CaptureQueriesContext(connection) as queries:
+            BookBalance.rebuild([self.book.id, self.other.id])
+        self.assertEqual(events, ['lock', 'totals'])
+        if connection.features.has_select_for_update:
+            self.assertTrue(any('FOR UPDATE' in query['sql'] for query in queries.captured_queries))
+        self.assertBalancesMatchEntries()
+        # A book without a stored row gets one on first read
+        BookBalance.objects.filter(book=self.other).delete()
+        self.assertEqual(BookBalance.for_book(self.other).entry_count, 0)
+
+    def test_verify_reports_drift(self):
+        out = StringIO()
+        call_command('rebuild_balances', '--verify', stdout=out)
+        self.assertIn('All book balances match', out.getvalue())
+        BookBalance.objects.filter(book=self.book).update(cash_in=Decimal('1.00'))
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 book balance(s) out of step'):
+            call_command('rebuild_balances', '--verify', stdout=out)
+        self.assertIn(f'Book {self.book.id}: stored', out.getvalue())
+        self.assertNotIn(f'Book {self.other.id}:', out.getvalue())
+        call_command('rebuild_balances', stdout=StringIO())
+        self.assertEqual(BookBalance.drift(), [])
+        self.assertBalancesMatchEntries()
+
+
+class EntrySearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Search', created_by=cls.user)
+        other = Book.objects.create(name='Other', created_by=cls.user)
+        rows = [
+            ('Office rent for March', '', '1500.00'),
+            ('Rental deposit', 'landlord', '500.00'),
+            ('Groceries', 'rent split', '120.50'),
+            ('Fuel', '', '150.00'),
+            ('Café supplies', '', '200.00'),
+        ]
+        for book in (cls.book, other):
+            for remarks, optional, amount in rows:
+                CashEntry.objects.create(book=book, user=cls.user, date=date(2024, 3, 1), time=time(9),
+                                         transaction_type='OUT', amount=Decimal(amount),
+                                         remarks=remarks, optional_field=optional)
+
+    def search(self, text, ranked=False):
+        return search_entries(CashEntry.objects.filter(book=self.book), text, ranked=ranked)
+
+    def remarks(self, text):
+        return sorted(self.search(text).values_list('remarks', flat=True))
+
+    def test_parse_search_separates_amounts_from_words(self):
+        amount, words = parse_search('Rent >=1,000 100..200 =5 x')
+        self.assertEqual(words, ['rent', 'x'])
+        self.assertEqual(len(amount.children), 4)
+
+    def test_words_match_prefixes_in_remarks_and_optional_field(self):
+        self.assertEqual(self.remarks('rent'), ['Groceries', 'Office rent for March', 'Rental deposit'])
+        self.assertEqual(self.remarks('RENT march'), ['Office rent for March'])
+        self.assertEqual(self.remarks('cafe'), ['Café supplies'])
+        self.assertEqual(self.remarks('"OR" NEAR('), [])
+
+    def test_amount_syntax(self):
+        self.assertEqual(self.remarks('500'), ['Rental deposit'])
+        self.assertEqual(self.remarks('>500'), ['Office rent for March'])
+        self.assertEqual(self.remarks('100..200'), ['Café supplies', 'Fuel', 'Groceries'])
+        self.assertEqual(self.remarks('rent <1000'), ['Groceries', 'Rental deposit'])
+
+    def test_index_follows_edits_and_deletes(self):
+        entry = CashEntry.objects.get(book=self.book, remarks='Fuel')
+        entry.remarks = 'Diesel for generator'
+        entry.save()
+        self.assertEqual(self.remarks('fuel'), [])
+        self.assertEqual(self.remarks('gener'), ['Diesel for generator'])
+        CashEntry.objects.filter(book=self.book, remarks__startswith='Rental').delete()
+        self.assertEqual(self.remarks('rent'), ['Groceries', 'Office rent for March'])
+
+    def test_ranked_search_orders_by_relevance(self):
+        results = list(self.search('rent', ranked=True))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results, sorted(results, key=lambda entry: -entry.search_rank))
+
+    def test_book_detail_search(self):
+        self.client.force_login(self.user)
+        response = self.client.get(f'/book/{self.book.id}/?search=rent+>200')
+        self.assertEqual([entry.remarks for entry, _ in response.context['entry_data']],
+                         ['Rental deposit', 'Office rent for March'])
+        self.assertEqual(response.context['cash_out'], Decimal('2000.00'))
+
+    def test_relevance_sort_pages_through_ranked_results(self):
+        self.client.force_login(self.user)
+        ranked = [entry.id for entry in self.search('rent', ranked=True)]
+        url = f'/api/v1/books/{self.book.id}/entries/?search=rent&sort=relevance&limit=1&fields=id,running_balance'
+        seen, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get(f'{url}&cursor={cursor}').json()
+            self.assertEqual([entry['running_balance'] for entry in data['entries']], [None])
+            seen.extend(entry['id'] for entry in data['entries'])
+            cursor = data['next_cursor']
+        self.assertEqual(seen, ranked)
+        self.assertEqual(Decimal(data['totals']['cash_out']), Decimal('2120.50'))
+
+        response = self.client.get(f'/book/{self.book.id}/?search=rent&sort=relevance')
+        self.assertEqual([(entry.id, balance) for entry, balance in response.context['entry_data']],
+                         [(entry_id, None) for entry_id in ranked])
+        # Without a search there is nothing to rank by, so the list stays in date order with balances
+        response = self.client.get(f'/book/{self.book.id}/?sort=relevance')
+        self.assertNotIn(None, [balance for _, balance in response.context['entry_data']])
+
+
+class ReportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Export: Q1/2024', created_by=cls.user)
+        cls.categories = [Category.objects.create(name=f'Cat {i}', book=cls.book, created_by=cls.user) for i in range(3)]
+
+    def add_entries(self, count):
+        CashEntry.objects.bulk_create([
+            CashEntry(book=self.book, user=self.user, date=date(2024, 1, 1) + timedelta(days=i % 90), time=time(9),
+                      transaction_type='IN' if i % 2 else 'OUT', amount=Decimal(i + 1),
+                      category=self.categories[i % 3] if i % 4 else None, remarks=f'row {i}')
+            for i in range(count)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def queue(self, **params):
+        query = '&'.join(f'{key}={value}' for key, value in {'report_type': 'excel', 'report_scope': 'all', **params}.items())
+        response = self.client.get(f'/book/{self.book.id}/download/?{query}')
+        job = ReportJob.objects.latest('id')
+        self.assertRedirects(response, f'/book/{self.book.id}/report/?job={job.id}')
+        return job
+
+    def download(self, job):
+        render_job(job)
+        status = self.client.get(f'/book/{self.book.id}/report/jobs/{job.id}/').json()
+        self.assertEqual((status['status'], status['progress']), ('done', 100))
+        # Served from the job row: the web process may not share the worker's disk
+        with override_settings(MEDIA_ROOT=os.path.join(tempfile.gettempdir(), 'cashbook-no-such-media')):
+            response = self.client.get(status['download_url'])
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_excel_rows_running_balance_and_summary(self):
+        self.add_entries(40)
+        sheet = openpyxl.load_workbook(BytesIO(self.download(self.queue()))).active
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(rows[1], ('Date', 'Type', 'Amount', 'Category', 'Remarks', 'Running Balance'))
+        body = rows[2:42]
+        self.assertEqual(len(body), 40)
+        balance = Decimal('0')
+        for day, label, amount, category, remarks, running_balance in body:
+            balance += Decimal(str(amount)) if label == 'Cash In' else -Decimal(str(amount))
+            self.assertEqual(Decimal(str(running_balance)), balance)
+        self.assertEqual(rows[-1][:2], ('Net Balance', balance))
+        self.assertIn('N/A', [row[3] for row in body])
+
+    def test_render_query_count_does_not_grow_with_rows(self):
+        self.add_entries(5)
+        job = self.queue(report_scope='category', category=self.categories[1].id)
+        render_job(job)
+        with CaptureQueriesContext(connection) as small:
+            render_job(job)
+        self.add_entries(300)
+        with self.assertNumQueries(len(small.captured_queries)):
+            render_job(job)
+
+    def test_pending_job_is_reused_and_hidden_from_other_users(self):
+        job = self.queue(report_type='pdf')
+        self.assertEqual(self.queue(report_type='pdf'), job)
+        other = User.objects.create_user(username='other', password='pw')
+        BookMember.objects.create(book=self.book, user=other, role='admin', created_by=self.user)
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(f'/book/{self.book.id}/report/jobs/{job.id}/').status_code, 404)
+
+    def test_queue_claims_oldest_first_and_requeues_orphans(self):
+        first, second = self.queue(report_type='pdf'), self.queue(report_type='excel')
+        self.assertEqual(ReportJob.claim('a'), first)
+        self.assertEqual(ReportJob.claim('b'), second)
+        self.assertIsNone(ReportJob.claim('c'))
+
+        ReportJob.objects.filter(pk=first.pk).update(heartbeat_at=timezone.now() - timedelta(minutes=10))
+        ReportJob.heartbeat([second.pk])
+        self.assertEqual(ReportJob.requeue_stale(timedelta(minutes=2)), (1, 0))
+        self.assertEqual(ReportJob.claim('c'), first)
+
+        ReportJob.objects.filter(pk=first.pk).update(heartbeat_at=timezone.now() - timedelta(minutes=10),
+                                                     attempts=ReportJob.MAX_ATTEMPTS)
+        self.assertEqual(ReportJob.requeue_stale(timedelta(minutes=2)), (0, 1))
+        self.assertEqual(ReportJob.objects.get(pk=first.pk).status, ReportJob.FAILED)
+
+    def test_unchanged_book_is_served_from_cache_or_304(self):
+        self.add_entries(10)
+        url = f'/book/{self.book.id}/download/?report_type=pdf&report_scope=all'
+        self.download(self.queue(report_type='pdf'))
+
+        jobs = ReportJob.objects.count()
+        # Another web process finds the worker's file through the job row
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(ReportJob.objects.count(), jobs)
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        # Any change to the book's data, even one that leaves the totals alone, invalidates it
+        CashEntry.objects.filter(book=self.book).update(remarks='edited')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 302)
+
+    def test_cache_evicts_least_recently_used(self):
+        jobs = {}
+        for age, key in enumerate(('a', 'b', 'c', 'd'), 1):
+            jobs[key] = ReportJob.objects.create(
+                book=self.book, requested_by=self.user, report_type='csv', report_scope='all', status=ReportJob.DONE,
+                content=b'x' * 100, size=100, cache_key=key, used_at=timezone.now() - timedelta(hours=10 - age))
+        report_cache.open_cached('a').close()
+        self.assertEqual(report_cache.evict(250), 200)
+        self.assertIsNotNone(report_cache.open_cached('a'))
+        self.assertIsNone(report_cache.open_cached('b'))
+        self.assertIsNone(report_cache.open_cached('c'))
+        self.assertEqual(report_cache.open_cached('d').read(), b'x' * 100)
+
+
+class StreamingReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Stream', created_by=cls.user)
+        category = Category.objects.create(name='Food, drinks', book=cls.book, created_by=cls.user)
+        CashEntry.objects.bulk_create([
+            CashEntry(book=cls.book, user=cls.user, date=date(2024, 5, 1) + timedelta(days=i // 3), time=time(9 + i % 3),
+                      transaction_type='OUT' if i % 4 == 0 else 'IN', amount=Decimal(f'{i + 1}.25'),
+                      category=category if i % 2 else None, remarks=f'line "{i}"\nsecond')
+            for i in range(450)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def download(self, report_type, **headers):
+        response = self.client.get(f'/book/{self.book.id}/download/?report_type={report_type}&report_scope=all', **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def expected_balances(self):
+        balance, balances = Decimal('0'), []
+        for entry in CashEntry.objects.filter(book=self.book).oldest_first():
+            balance += entry.amount if entry.transaction_type == 'IN' else -entry.amount
+            balances.append((entry.id, balance))
+        return balances
+
+    def test_csv(self):
+        response, body = self.download('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(body.decode('utf-8').splitlines(keepends=True)))
+        self.assertEqual([(int(row['id']), Decimal(row['running_balance'])) for row in rows], self.expected_balances())
+        self.assertEqual(rows[1]['category'], 'Food, drinks')
+        self.assertEqual(rows[1]['remarks'], 'line "1"\nsecond')
+
+    def test_jsonl_gzip(self):
+        response, body = self.download('jsonl&compress=gzip', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = [json.loads(line) for line in gzip.decompress(body).decode('utf-8').splitlines()]
+        self.assertEqual([(row['id'], Decimal(row['running_balance'])) for row in rows], self.expected_balances())
+        self.assertEqual(rows[0]['amount'], '1.25')
+
+    def test_gzip_needs_client_support(self):
+        response, body = self.download('jsonl&compress=gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(len(body.decode('utf-8').splitlines()), 450)
+
+    def test_category_from_another_book_is_refused(self):
+        other_book = Book.objects.create(name='Other', created_by=self.user)
+        foreign = Category.objects.create(name='Elsewhere', book=other_book, created_by=self.user)
+        url = f'/book/{self.book.id}/download/?report_type=csv&report_scope=category'
+        for category_id in (foreign.id, 999999, 'abc'):
+            response = self.client.get(f'{url}&category={category_id}')
+            self.assertRedirects(response, f'/book/{self.book.id}/report/', fetch_redirect_response=False)
+        own = Category.objects.get(book=self.book)
+        response = self.client.get(f'{url}&category={own.id}')
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode('utf-8').splitlines(keepends=True)))
+        self.assertEqual({row['category'] for row in rows}, {'Food, drinks'})
+        self.assertEqual(len(rows), 225)
+
+
+class PdfReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Pages', created_by=cls.user)
+        CashEntry.objects.bulk_create([
+            CashEntry(book=cls.book, user=cls.user, date=date(2024, 1, 1) + timedelta(days=i // 5), time=time(9),
+                      transaction_type='OUT' if i % 3 == 0 else 'IN', amount=Decimal(f'{i + 1}.50'),
+                      remarks='a very long remark that will not fit in its column ' * 3)
+            for i in range(300)
+        ])
+
+    def render(self, rows, total_rows):
+        output = BytesIO()
+        render_pages(output, 'Test', rows, total_pages=page_count(total_rows),
+                     summary=(Decimal('1'), Decimal('2'), Decimal('-1')))
+        output.seek(0)
+        return pypdf.PdfReader(output)
+
+    def test_page_count(self):
+        self.assertEqual(page_count(0), 1)
+        self.assertEqual(page_count(10), 1)
+        # A full last page pushes the summary onto a page of its own
+        self.assertEqual(page_count(ROWS_PER_PAGE), 2)
+        self.assertEqual(page_count(ROWS_PER_PAGE * 3 + 1), 4)
+
+    def test_pages_match_page_count(self):
+        for total in (0, 5, ROWS_PER_PAGE, 300):
+            rows = SyntheticRows().rows((0, Decimal('0')), total)
+            reader = self.render(rows, total)
+            self.assertEqual(len(reader.pages), page_count(total))
+            self.assertIn(f'Page {page_count(total)} of {page_count(total)}', reader.pages[-1].extract_text())
+
+    def test_entry_rows_slices_match_full_report(self):
+        source = EntryRows(self.book.id)
+        full = list(report_rows(CashEntry.objects.filter(book=self.book), category_catalog(self.book.id).names))
+        starts = [0, ROWS_PER_PAGE, ROWS_PER_PAGE * 4]
+        with self.assertNumQueries(1):
+            states = source.prepare(starts)
+        sliced = []
+        for start, end in zip(starts, starts[1:] + [len(full)]):
+            sliced.extend(source.rows(states[start], end - start))
+        self.assertEqual(sliced, full)
+
+    @skipUnless(can_render_in_parallel(), 'pypdf is not installed')
+    def test_parallel_render_merges_in_order(self):
+        total = ROWS_PER_PAGE * 5 + 3
+        output = BytesIO()
+        render_parallel(output, 'Test', total, (Decimal('1'), Decimal('2'), Decimal('-1')), SyntheticRows(), 2)
+        output.seek(0)
+        reader = pypdf.PdfReader(output)
+        self.assertEqual(len(reader.pages), page_count(total))
+        for number, page in enumerate(reader.pages, 1):
+            self.assertIn(f'Page {number} of {page_count(total)}', page.extract_text())
+        self.assertIn('Net Balance', reader.pages[-1].extract_text())
+
+
+PERF_BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'perf_baseline.json')
+
+
+@tag('performance')
+class ViewPerformanceTests(TestCase):
+    """Query budgets and timings for every page, on books of 1, 100 and 10,000 entries.
+
+    A view's query count must not depend on how much data it shows: the same request
+    against each size must run the same number of queries, and no more than the stored
+    baseline. Timings are only reported. Run just this suite with
+    `manage.py test cashbook --tag performance`; set CASHBOOK_PERF_BASELINE=update to
+    rewrite perf_baseline.json for the current database vendor.
+    """
+    SIZES = (1, 100, 10000)
+    MEMBERS = {1: 1, 100: 20, 10000: 60}
+    BOOKS = {1: 1, 100: 10, 10000: 40}
+    REPEAT = 5
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        admin_group = Group.objects.create(name='Admin')
+        partner_group = Group.objects.create(name='Partner')
+        cls.worlds = {}
+        for size in cls.SIZES:
+            admin = User.objects.create_user(username=f'admin{size}', password='pw')
+            admin.groups.add(admin_group)
+            book = Book.objects.create(name=f'Main {size}', created_by=admin)
+            Book.objects.bulk_create([Book(name=f'Book {size}-{i}', created_by=admin) for i in range(cls.BOOKS[size])])
+            categories = [Category.objects.create(name=f'Cat {i}', book=book, created_by=admin) for i in range(5)]
+            members = User.objects.bulk_create([
+                User(username=f'member{size}-{i}', password='!') for i in range(cls.MEMBERS[size])])
+            User.groups.through.objects.bulk_create([
+                User.groups.through(user_id=member.id, group_id=partner_group.id) for member in members])
+            BookMember.objects.bulk_create([
+                BookMember(book=book, user=member, role='partner', created_by=admin) for member in members])
+            CashEntry.objects.bulk_create([
+                CashEntry(book=book, user=members[i % len(members)], date=date(2024, 1, 1) + timedelta(days=i % 365),
+                          time=time(i % 24, i % 60), transaction_type='OUT' if i % 3 == 1 else 'IN',
+                          amount=Decimal(i % 500 + 60), category=categories[i % 5] if i % 4 != 3 else None,
+                          remarks=f'invoice {i} from supplier {i % 97}')
+                for i in range(size)
+            ])
+            job = ReportJob.objects.create(book=book, requested_by=admin, report_type='excel', report_scope='all')
+            # Entry 0 matches every filter below, so even the 1-entry book renders a full row
+            cls.worlds[size] = {
+                'admin': admin, 'book': book, 'category': categories[0], 'member': members[0], 'job': job,
+                'entry': CashEntry.objects.filter(book=book).first(),
+            }
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        baseline = cls.load_baseline()
+        lines = [f"\nView performance ({connection.vendor}), median of {cls.REPEAT} requests:",
+                 f"{'view':<28}{'size':>7}{'queries':>9}{'base':>6}{'ms':>9}{'base ms':>9}{'change':>9}"]
+        for name in sorted(cls.results):
+            for size, (queries, ms) in sorted(cls.results[name].items()):
+                base = baseline.get(name, {})
+                base_ms = base.get('ms', {}).get(str(size))
+                change = f"{(ms - base_ms) / base_ms:+.0%}" if base_ms else '-'
+                lines.append(f"{name:<28}{size:>7}{queries:>9}{base.get('queries', '-'):>6}{ms:>9.1f}"
+                             f"{base_ms if base_ms is not None else '-':>9}{change:>9}")
+        sys.stderr.write('\n'.join(lines) + '\n')
+        if os.environ.get('CASHBOOK_PERF_BASELINE') == 'update' and cls.results:
+            stored = cls.load_baseline(all_vendors=True)
+            stored[connection.vendor] = {
+                name: {'queries': max(queries for queries, _ in by_size.values()),
+                       'ms': {str(size): round(ms, 1) for size, (_, ms) in by_size.items()}}
+                for name, by_size in sorted(cls.results.items())
+            }
+            with open(PERF_BASELINE_PATH, 'w') as f:
+                json.dump(stored, f, indent=2, sort_keys=True)
+                f.write('\n')
+
+    @staticmethod
+    def load_baseline(all_vendors=False):
+        try:
+            with open(PERF_BASELINE_PATH) as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            stored = {}
+        return stored if all_vendors else stored.get(connection.vendor, {})
+
+    def request(self, url):
+        response = self.client.get(url)
+        self.assertIn(response.status_code, (200, 302), url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def assertConstantQueries(self, name, url_for):
+        """Request url_for(world) against every size; the query counts must all match the smallest book's."""
+        counts = {}
+        for size in self.SIZES:
+            world = self.worlds[size]
+            self.client.force_login(world['admin'])
+            url = url_for(world)
+            self.request(url)  # warm up: session, content types, first-use caches
+            with CaptureQueriesContext(connection) as captured:
+                self.request(url)
+            # Copy now: the next request clears connection.queries
+            queries = [query['sql'] for query in captured.captured_queries]
+            timings = []
+            for _ in range(self.REPEAT):
+                started = clock.perf_counter()
+                self.request(url)
+                timings.append((clock.perf_counter() - started) * 1000)
+            counts[size] = len(queries)
+            self.results.setdefault(name, {})[size] = (len(queries), statistics.median(timings))
+            if size == self.SIZES[0]:
+                smallest = queries
+        for size, count in counts.items():
+            self.assertEqual(count, counts[self.SIZES[0]],
+                             f"{name}: {count} queries at size {size}, {counts[self.SIZES[0]]} at size {self.SIZES[0]}"
+                             '\n' + '\n'.join(smallest))
+        budget = self.load_baseline().get(name, {}).get('queries')
+        if budget is not None:
+            self.assertLessEqual(counts[self.SIZES[0]], budget, f"{name} went over its query budget")
+
+    def test_homepage(self):
+        self.assertConstantQueries('homepage', lambda w: '/')
+        self.assertConstantQueries('homepage search', lambda w: '/?q=book')
+
+    def test_book_detail(self):
+        self.assertConstantQueries('book_detail', lambda w: f"/book/{w['book'].id}/")
+        self.assertConstantQueries('book_detail filtered', lambda w: (
+            f"/book/{w['book'].id}/?category={w['category'].id}&type=IN&date_filter=custom"
+            f"&start_date=2024-01-01&end_date=2024-06-30"))
+        self.assertConstantQueries('book_detail search', lambda w: f"/book/{w['book'].id}/?search=supplier >50")
+
+    def test_entries_api(self):
+        self.assertConstantQueries('api entries', lambda w: f"/api/v1/books/{w['book'].id}/entries/?type=IN")
+        self.assertConstantQueries('api entry', lambda w: f"/api/v1/books/{w['book'].id}/entries/{w['entry'].id}/")
+
+    def test_manage_my_users(self):
+        self.assertConstantQueries('manage_my_users', lambda w: '/users/my/')
+
+    def test_manage_categories(self):
+        self.assertConstantQueries('manage_categories', lambda w: '/categories/')
+
+    def test_report_pages(self):
+        self.assertConstantQueries('generate_report', lambda w: f"/book/{w['book'].id}/report/")
+        self.assertConstantQueries('report_job_status', lambda w: f"/book/{w['book'].id}/report/jobs/{w['job'].id}/")
+        self.assertConstantQueries('download_report csv', lambda w: (
+            f"/book/{w['book'].id}/download/?report_type=csv&report_scope=all"))
+
+    def test_entry_and_user_forms(self):
+        self.assertConstantQueries('add_entry', lambda w: f"/book/{w['book'].id}/add/IN/")
+        self.assertConstantQueries('edit_entry', lambda w: f"/book/{w['book'].id}/edit/{w['entry'].id}/")
+        self.assertConstantQueries('edit_book', lambda w: f"/edit_book/{w['book'].id}/")
+        self.assertConstantQueries('create_user_for_book', lambda w: f"/book/{w['book'].id}/create_user/")
+        self.assertConstantQueries('edit_user', lambda w: f"/user/edit/{w['member'].id}/")
+
+
+class SeedCashbookTests(TestCase):
+    def seed(self, prefix):
+        call_command('seed_cashbook', prefix=prefix, seed=7, admins=2, managers=3, partners=5, books=4, entries=600,
+                     end_date=date(2024, 6, 30), batch_size=250, stdout=StringIO())
+        entries = CashEntry.objects.filter(book__name__startswith=f'{prefix} ').order_by('id')
+        return list(entries.values_list('date', 'time', 'transaction_type', 'amount', 'category__name', 'remarks'))
+
+    def test_same_seed_same_data(self):
+        first = self.seed('one')
+        self.assertEqual(len(first), 600)
+        self.assertEqual(self.seed('two'), first)
+        self.assertTrue(User.objects.filter(username='one-manager-3', groups__name='Manager').exists())
+        self.assertTrue(all(day <= date(2024, 6, 30) for day, *_ in first))
+
+    def test_ledger_and_rollups_built(self):
+        self.seed('one')
+        self.assertEqual(BookBalance.drift(), [])
+        book = Book.objects.filter(name__startswith='one ').first()
+        entries = CashEntry.objects.filter(book=book, date__gte=date(2024, 3, 1))
+        cash_in, cash_out, count = summary_totals(book, date(2024, 3, 1))
+        self.assertEqual(count, entries.count())
+        expected_in = entries.filter(transaction_type='IN').aggregate(total=Sum('amount'))['total']
+        self.assertEqual(Decimal(cash_in).quantize(Decimal('0.01')), expected_in.quantize(Decimal('0.01')))
+
+
+class EntriesApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Api', created_by=cls.user)
+        cls.category = Category.objects.create(name='Rent', book=cls.book, created_by=cls.user)
+        CashEntry.objects.bulk_create([
+            CashEntry(book=cls.book, user=cls.user, date=date(2024, 3, 1) + timedelta(days=i // 3), time=time(9 + i % 3),
+                      transaction_type='OUT' if i % 4 == 0 else 'IN', amount=Decimal(f'{i + 1}.10'),
+                      category=cls.category if i % 2 else None, remarks=f'rent {i}' if i % 5 == 0 else f'misc {i}')
+            for i in range(60)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get(self, path, status=200):
+        response = self.client.get(f'/api/v1/books/{self.book.id}/entries/{path}')
+        self.assertEqual(response.status_code, status, response.content)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return json.loads(response.content)
+
+    def expected_balances(self, entries):
+        balance, balances = Decimal('0'), {}
+        for entry in entries.oldest_first():
+            balance += entry.amount if entry.transaction_type == 'IN' else -entry.amount
+            balances[entry.id] = balance
+        return balances
+
+    def test_pages_match_filters_and_balances(self):
+        entries = CashEntry.objects.filter(book=self.book, category=self.category, transaction_type='IN')
+        expected = self.expected_balances(entries)
+        seen, cursor = {}, ''
+        while True:
+            data = self.get(f'?category={self.category.id}&type=IN&limit=7&cursor={cursor}')
+            seen.update({row['id']: Decimal(row['running_balance']) for row in data['entries']})
+            if not data['next_cursor']:
+                break
+            cursor = data['next_cursor']
+        self.assertEqual(seen, expected)
+        self.assertEqual(data['totals']['count'], len(expected))
+        self.assertEqual(Decimal(data['totals']['net_balance']), list(expected.values())[-1])
+
+    def test_field_selection_and_search(self):
+        data = self.get('?search=rent&fields=id,remarks')
+        self.assertEqual({row['remarks'] for row in data['entries']}, {f'rent {i}' for i in range(0, 60, 5)})
+        self.assertEqual(set(data['entries'][0]), {'id', 'remarks'})
+        self.assertIn('Unknown field', self.get('?fields=id,password', status=400)['error'])
+        self.assertIn('Invalid cursor', self.get('?cursor=nope', status=400)['error'])
+
+    def test_entry_detail(self):
+        entry = CashEntry.objects.filter(book=self.book).order_by('-id').first()
+        expected = self.expected_balances(CashEntry.objects.filter(book=self.book))[entry.id]
+        data = self.get(f'{entry.id}/')['entry']
+        self.assertEqual((data['id'], data['amount'], Decimal(data['running_balance'])), (entry.id, str(entry.amount), expected))
+        self.assertEqual(set(self.get(f'{entry.id}/?fields=amount')['entry']), {'amount'})
+        self.get('999999/', status=404)
+
+    def test_other_users_are_refused(self):
+        self.client.force_login(User.objects.create_user(username='stranger', password='pw'))
+        self.get('', status=403)
+
+    def test_book_detail_leaves_details_to_the_api(self):
+        response = self.client.get(f'/book/{self.book.id}/')
+        self.assertNotContains(response, 'data-entry=')
+        self.assertContains(response, 'data-entry-id=', count=10)
+
+    def test_json_fallback_matches_orjson(self):
+        payload = {'entries': [{'id': 1, 'remarks': 'caf\u00e9', 'amount': '1.10'}], 'next_cursor': None}
+        fast = api.json_response(payload).content
+        with patch.object(api, 'orjson', None):
+            self.assertEqual(api.json_response(payload).content, fast)
+
+
+class EntryImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Import', created_by=cls.user)
+        cls.rent = Category.objects.create(name='Rent', book=cls.book, created_by=cls.user)
+
+    def setUp(self):
+        # Categories an import created are rolled back after each test; its cached catalog is not
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def upload(self, content, name='entries.csv', **data):
+        upload = SimpleUploadedFile(name, content)
+        return self.client.post(f'/book/{self.book.id}/import/', {'file': upload, **data})
+
+    def test_csv_rows_are_imported_and_errors_listed(self):
+        content = ('﻿Date,Time,Type,Amount,Category,Remarks\n'
+                   '2024-03-01,09:30,Cash In,"1,250.50",rent,March rent\n'
+                   '02/03/2024,,OUT,40,Fuel,\n'
+                   '\n'
+                   '2024-03-03,10:00,IN,abc,,bad amount\n'
+                   '2024-13-01,10:00,sideways,5,,bad date and type\n').encode('utf-8')
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 200)
+        result = response.context['result']
+        self.assertEqual((result.rows, result.imported, result.error_count), (4, 2, 2))
+        self.assertEqual([line for line, _ in result.errors], [5, 6])
+        self.assertIn('date', result.errors[1][1])
+        self.assertIn('transaction_type', result.errors[1][1])
+        self.assertEqual(result.new_categories, ['Fuel'])
+
+        first, second = CashEntry.objects.filter(book=self.book).oldest_first()
+        self.assertEqual((first.date, first.time, first.transaction_type, first.amount, first.category),
+                         (date(2024, 3, 1), time(9, 30), 'IN', Decimal('1250.50'), self.rent))
+        self.assertEqual((second.date, second.time, second.transaction_type, second.category.name),
+                         (date(2024, 3, 2), time(0, 0), 'OUT', 'Fuel'))
+        self.assertEqual(BookBalance.drift(), [])
+        self.assertEqual(BookBalance.for_book(self.book).net, Decimal('1210.50'))
+
+    def test_signed_amounts_without_type_column(self):
+        result = self.upload(b'date,amount\n2024-01-01,100\n2024-01-02,-30.25\n2024-01-03,0\n').context['result']
+        self.assertEqual((result.imported, result.error_count), (2, 1))
+        self.assertEqual(list(CashEntry.objects.filter(book=self.book).oldest_first().values_list('transaction_type', 'amount')),
+                         [('IN', Decimal('100.00')), ('OUT', Decimal('30.25'))])
+
+    def test_category_names_must_fit(self):
+        content = f'date,type,amount,category\n2024-01-01,IN,5,{"x" * 101}\n2024-01-02,IN,6,  Food  \n'.encode()
+        result = self.upload(content).context['result']
+        self.assertEqual((result.imported, result.error_count), (1, 1))
+        self.assertEqual(result.errors[0][0], 2)
+        self.assertIn('category: Ensure this value has at most 100 characters', result.errors[0][1])
+        self.assertEqual(result.new_categories, ['Food'])
+        self.assertFalse(Category.objects.filter(book=self.book, name__startswith='xxx').exists())
+
+    def test_dry_run_writes_nothing(self):
+        result = self.upload(b'date,type,amount,category\n2024-01-01,IN,5,New\n', dry_run='on').context['result']
+        self.assertEqual((result.dry_run, result.imported, result.new_categories), (True, 1, ['New']))
+        self.assertFalse(CashEntry.objects.filter(book=self.book).exists())
+        self.assertFalse(Category.objects.filter(book=self.book, name='New').exists())
+
+    def test_partners_only_use_existing_categories(self):
+        partner = User.objects.create_user(username='partner', password='pw')
+        partner.groups.add(Group.objects.get_or_create(name='Partner')[0])
+        BookMember.objects.create(book=self.book, user=partner, role='manager', created_by=self.user)
+        self.client.force_login(partner)
+        result = self.upload(b'date,type,amount,category\n2024-01-01,IN,5,New\n2024-01-02,IN,6,RENT\n').context['result']
+        self.assertEqual((result.imported, result.error_count, result.new_categories), (1, 1, []))
+        self.assertFalse(Category.objects.filter(book=self.book, name='New').exists())
+
+        outsider = User.objects.create_user(username='outsider', password='pw')
+        self.client.force_login(outsider)
+        self.assertRedirects(self.upload(b'date,amount\n2024-01-01,5\n'), f'/book/{self.book.id}/',
+                             fetch_redirect_response=False)
+
+    def test_xlsx_import(self):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['Date', 'Type', 'Amount', 'Category'])
+        sheet.append([date(2024, 5, 1), 'IN', 0.1 + 0.2, 'Rent'])
+        sheet.append(['2024-05-02', 'OUT', 12, None])
+        stream = BytesIO()
+        workbook.save(stream)
+        result = self.upload(stream.getvalue(), name='entries.xlsx').context['result']
+        self.assertEqual((result.imported, result.error_count), (2, 0))
+        self.assertEqual(CashEntry.objects.get(book=self.book, transaction_type='IN').amount, Decimal('0.30'))
+
+    def test_files_over_the_row_limit_are_refused(self):
+        rows = [f'2024-01-{day:02},IN,5\n' for day in range(1, 5)]
+        with patch.object(imports, 'IMPORT_MAX_ROWS', 3), patch.object(imports, 'IMPORT_BATCH_SIZE', 3):
+            response = self.upload(('date,type,amount\n' + ''.join(rows)).encode())
+            self.assertContains(response, 'The file has more than 3 rows.')
+            self.assertFalse(CashEntry.objects.filter(book=self.book).exists())
+            # Blank lines do not count towards the limit
+            result = self.upload(('date,type,amount\n\n' + ''.join(rows[:3])).encode()).context['result']
+        self.assertEqual(result.imported, 3)
+
+    def test_file_level_problems(self):
+        response = self.upload(b'when,how much\n2024-01-01,5\n')
+        self.assertContains(response, 'Missing column(s): date, amount')
+        response = self.upload(b'date,amount\n', name='entries.txt')
+        self.assertFalse(response.context['form'].is_valid())
+        self.assertFalse(CashEntry.objects.filter(book=self.book).exists())
+
+
+class BulkEntryActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Bulk', created_by=cls.user)
+        cls.other_book = Book.objects.create(name='Other', created_by=cls.user)
+        cls.rent, cls.fuel = (Category.objects.create(name=name, book=cls.book, created_by=cls.user) for name in ('Rent', 'Fuel'))
+        CashEntry.objects.bulk_create([
+            CashEntry(book=cls.book, user=cls.user, date=date(2024, 1, 1) + timedelta(days=i), time=time(10),
+                      transaction_type='IN' if i % 2 else 'OUT', amount=Decimal(i + 1), category=cls.rent if i % 3 else None)
+            for i in range(40)
+        ])
+        cls.stranger = CashEntry.objects.create(book=cls.other_book, user=cls.user, date=date(2024, 1, 1), time=time(9),
+                                                transaction_type='IN', amount=Decimal('5.00'))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self, **data):
+        return self.client.post(f'/book/{self.book.id}/bulk/', data)
+
+    def ids(self, count):
+        return list(CashEntry.objects.filter(book=self.book).order_by('id').values_list('id', flat=True)[:count])
+
+    def assertLedgerConsistent(self):
+        self.assertEqual(BookBalance.drift(), [])
+        for model in (DailyBookSummary, MonthlyBookSummary):
+            snapshot = lambda: sorted(model.objects.values_list(
+                'book_id', model.period_field, 'category_id', 'transaction_type', 'total', 'entry_count'), key=str)
+            incremental = snapshot()
+            model.rebuild()
+            self.assertEqual(incremental, snapshot(), model.__name__)
+
+    def test_actions_on_ticked_entries(self):
+        ids = self.ids(6)
+        response = self.post(action='set_category', entries=ids[:4], new_category=self.fuel.id, filters='type=IN&search=x')
+        self.assertRedirects(response, f'/book/{self.book.id}/?type=IN&search=x', fetch_redirect_response=False)
+        self.assertEqual(CashEntry.objects.filter(category=self.fuel).count(), 4)
+        self.post(action='set_category', entries=ids[:1], new_category='')
+        self.assertIsNone(CashEntry.objects.get(pk=ids[0]).category)
+        self.post(action='set_type', entries=ids[:3], new_type='OUT')
+        self.assertEqual(set(CashEntry.objects.filter(pk__in=ids[:3]).values_list('transaction_type', flat=True)), {'OUT'})
+        self.post(action='delete', entries=ids[4:])
+        self.assertEqual(CashEntry.objects.filter(book=self.book).count(), 38)
+        self.assertLedgerConsistent()
+
+    def test_all_matching_follows_the_filters(self):
+        self.post(action='set_type', all_matching='on', filters=f'category={self.rent.id}&type=OUT', new_type='IN')
+        self.assertFalse(CashEntry.objects.filter(book=self.book, category=self.rent, transaction_type='OUT').exists())
+        self.assertEqual(CashEntry.objects.filter(book=self.book, category=None, transaction_type='OUT').count(), 7)
+        self.post(action='delete', all_matching='on', filters='date_filter=custom&start_date=2024-01-01&end_date=2024-01-10')
+        self.assertEqual(CashEntry.objects.filter(book=self.book).count(), 30)
+        self.assertTrue(CashEntry.objects.filter(pk=self.stranger.pk).exists())
+        self.assertLedgerConsistent()
+
+    def test_one_statement_changes_the_entries(self):
+        for action, extra, statement in (('set_category', {'new_category': self.fuel.id}, 'UPDATE "cashbook_cashentry"'),
+                                         ('delete', {}, 'DELETE FROM "cashbook_cashentry"')):
+            ids = self.ids(30)
+            with CaptureQueriesContext(connection) as queries:
+                self.post(action=action, entries=ids, **extra)
+            statements = [query['sql'] for query in queries.captured_queries if query['sql'].startswith(statement)]
+            self.assertEqual(len(statements), 1, statements)
+        self.assertLedgerConsistent()
+
+    def test_refused_without_permission_or_with_foreign_entries(self):
+        response = self.post(action='delete', entries=self.ids(3) + [self.stranger.pk])
+        self.assertEqual(CashEntry.objects.filter(book=self.book).count(), 40)
+        self.assertTrue(CashEntry.objects.filter(pk=self.stranger.pk).exists())
+        self.post(action='set_type', entries=self.ids(1))
+        self.assertEqual(CashEntry.objects.get(pk=self.ids(1)[0]).transaction_type, 'OUT')
+
+        partner = User.objects.create_user(username='partner', password='pw')
+        BookMember.objects.create(book=self.book, user=partner, role='partner', created_by=self.user)
+        self.client.force_login(partner)
+        self.post(action='delete', all_matching='on')
+        self.assertEqual(CashEntry.objects.filter(book=self.book).count(), 40)
+
+
+def photo_bytes(size=(3000, 2000), mode='RGB', format='JPEG', orientation=None):
+    image = Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30))
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    exif[0x010F] = 'PhoneMaker'
+    output = BytesIO()
+    image.save(output, format, **({'exif': exif.tobytes()} if format == 'JPEG' else {}))
+    return output.getvalue()
+
+
+class ImagePipelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Images', created_by=cls.user)
+        cls.category = Category.objects.create(name='Bills', book=cls.book, created_by=cls.user)
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=media, IMAGE_WORKERS=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client.force_login(self.user)
+
+    def open(self, field):
+        field.open('rb')
+        try:
+            image = Image.open(field)
+            image.load()
+            return image
+        finally:
+            field.close()
+
+    def test_upload_is_rotated_stripped_and_downscaled(self):
+        upload = SimpleUploadedFile('IMG_0001.jpg', photo_bytes(orientation=6), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/book/{self.book.id}/add/IN/', {
+                'transaction_type': 'IN', 'amount': '10.00', 'remarks': 'receipt', 'category': self.category.id,
+                'optional_field': '', 'image': upload})
+        self.assertEqual(response.status_code, 302)
+        entry = CashEntry.objects.get(book=self.book)
+        image = self.open(entry.image)
+        # Orientation 6 is a portrait photo stored sideways
+        self.assertEqual(image.size, (1067, 1600))
+        self.assertEqual(len(image.getexif()), 0)
+        self.assertLessEqual(max(self.open(entry.thumbnail).size), 160)
+        self.assertLessEqual(max(self.open(entry.preview).size), 800)
+        # The raw upload is replaced, not kept next to the compressed copy
+        folder = os.path.join(settings.MEDIA_ROOT, 'cashbook_images')
+        self.assertEqual([name for name in os.listdir(folder) if name.endswith('.jpg')], [os.path.basename(entry.image.name)])
+        self.assertEqual(BookBalance.drift(), [])
+
+    def test_transparent_images_and_stale_work(self):
+        entry = CashEntry.objects.create(book=self.book, user=self.user, transaction_type='OUT', amount=Decimal('3.00'),
+                                         image=SimpleUploadedFile('shot.png', photo_bytes((400, 300), 'RGBA', 'PNG')))
+        # Queued for an image the entry no longer has: nothing happens
+        self.assertIsNone(process_entry_image(entry.id, 'cashbook_images/other.png'))
+        self.assertFalse(CashEntry.objects.get(pk=entry.pk).thumbnail)
+        self.assertIsNotNone(process_entry_image(entry.id))
+        image = self.open(CashEntry.objects.get(pk=entry.pk).image)
+        self.assertEqual((image.format, image.mode, image.size), ('JPEG', 'RGB', (400, 300)))
+        self.assertGreater(image.getpixel((0, 0))[1], 100)
+
+    def test_backfill_command(self):
+        entries = [CashEntry.objects.create(book=self.book, user=self.user, transaction_type='IN', amount=Decimal('1.00'),
+                                            image=SimpleUploadedFile(f'old{i}.jpg', photo_bytes((2400, 1800))))
+                   for i in range(3)]
+        CashEntry.objects.create(book=self.book, user=self.user, transaction_type='IN', amount=Decimal('1.00'),
+                                 image=SimpleUploadedFile('broken.jpg', b'not an image'))
+        output = StringIO()
+        call_command('process_images', '--workers=1', stdout=output)
+        self.assertIn('3 image(s) processed', output.getvalue())
+        for entry in entries:
+            entry.refresh_from_db()
+            self.assertEqual(self.open(entry.image).size, (1600, 1200))
+            self.assertTrue(entry.thumbnail)
+        output = StringIO()
+        call_command('process_images', '--workers=1', stdout=output)
+        self.assertIn('1 image(s) to process', output.getvalue())
+
+
+class MediaServingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Media', created_by=cls.user)
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=media, IMAGE_WORKERS=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.content = photo_bytes((300, 200))
+        self.entry = CashEntry.objects.create(book=self.book, user=self.user, transaction_type='IN', amount=Decimal('1.00'),
+                                              image=SimpleUploadedFile('bill.jpg', self.content))
+        self.url = self.entry.image.url
+        self.client.force_login(self.user)
+
+    def body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_members_get_the_file_with_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual((response['Content-Type'], response['Accept-Ranges']), ('image/jpeg', 'bytes'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertFalse(response['ETag'].startswith('W/'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_others_are_refused(self):
+        self.client.force_login(User.objects.create_user(username='stranger', password='pw'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/media/reports/2024/01/book.pdf').status_code, 404)
+        self.assertEqual(self.client.get('/media/cashbook_images/missing.jpg').status_code, 404)
+
+    def test_ranges(self):
+        size = len(self.content)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual((response.status_code, response['Content-Range'], response['Content-Length']),
+                         (206, f'bytes 10-19/{size}', '10'))
+        self.assertEqual(self.body(response), self.content[10:20])
+        self.assertEqual(self.body(self.client.get(self.url, HTTP_RANGE='bytes=-5')), self.content[-5:])
+        self.assertEqual(self.body(self.client.get(self.url, HTTP_RANGE=f'bytes={size - 3}-')), self.content[-3:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f'bytes={size}-').status_code, 416)
+        # A stale If-Range or several ranges get the whole file
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-1,5-6').status_code, 200)
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+
+    def test_web_server_handoff(self):
+        with self.settings(MEDIA_SERVER='nginx'):
+            response = self.client.get(self.url)
+            self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.entry.image.name}')
+            self.assertEqual(response.content, b'')
+        with self.settings(MEDIA_SERVER='sendfile'):
+            response = self.client.get(self.url)
+            self.assertEqual(response['X-Sendfile'], self.entry.image.path)
+
+
+class HomepageQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pw')
+        cls.one = User.objects.create_user(username='one', password='pw')
+        cls.many = User.objects.create_user(username='many', password='pw')
+        partner_group = Group.objects.create(name='Partner')
+        for user in (cls.one, cls.many):
+            user.groups.add(partner_group)
+        for i in range(12):
+            book = Book.objects.create(name=f'Book {i}', created_by=owner)
+            CashEntry.objects.create(book=book, user=owner, date=date(2024, 1, 1), time=time(9),
+                                     transaction_type='IN', amount=Decimal('10.00'))
+            for user in ([cls.one, cls.many] if i == 0 else [cls.many]):
+                BookMember.objects.create(book=book, user=user, role='partner', created_by=owner)
+
+    def homepage_queries(self, user):
+        self.client.force_login(user)
+        # Warm the session, then time a page built from the database rather than the page cache
+        self.client.get('/')
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/')
+        return len(response.context['books_with_balance']), len(queries.captured_queries)
+
+    def test_query_count_does_not_grow_with_books(self):
+        books, queries = self.homepage_queries(self.one)
+        self.assertEqual(books, 1)
+        self.assertEqual(self.homepage_queries(self.many), (12, queries))
+
+
+class HomepageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_group = Group.objects.create(name='Admin')
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.user.groups.add(cls.admin_group)
+        cls.book = Book.objects.create(name='Shop', created_by=cls.user)
+        CashEntry.objects.create(book=cls.book, user=cls.user, date=date(2024, 1, 1), time=time(9),
+                                 transaction_type='IN', amount=Decimal('100.00'))
+
+    def setUp(self):
+        # Ids are reused between test transactions, so stamps from an earlier test could match
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def rows(self):
+        response = self.client.get('/')
+        return [(item['book'].name, item['net_balance'], item['member_count'])
+                for item in response.context['books_with_balance']]
+
+    def test_repeat_visit_only_checks_versions(self):
+        self.assertEqual(self.rows(), [('Shop', Decimal('100.00'), 1)])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.rows(), [('Shop', Decimal('100.00'), 1)])
+        app_queries = [query['sql'] for query in queries.captured_queries if 'cashbook_' in query['sql']]
+        self.assertEqual(len(app_queries), 2, app_queries)
+        self.assertIn('cashbook_usercachestamp', app_queries[0])
+        self.assertIn('cashbook_bookbalance', app_queries[1])
+
+    def test_stamp_change_from_another_process_reaches_the_cache(self):
+        self.rows()
+        other = Book.objects.create(name='Cafe', created_by=User.objects.create_user(username='other', password='pw'))
+        # bulk_create sends no signals; the stamp written by the other process is all this one sees
+        BookMember.objects.bulk_create([BookMember(book=other, user=self.user, role='partner', created_by=self.user)])
+        self.assertEqual([name for name, _, _ in self.rows()], ['Shop'])
+        UserCacheStamp.objects.filter(user=self.user).update(books_stamp='elsewhere')
+        self.assertEqual([name for name, _, _ in self.rows()], ['Cafe', 'Shop'])
+
+    def test_balances_and_members_are_never_stale(self):
+        self.rows()
+        CashEntry.objects.create(book=self.book, user=self.user, date=date(2024, 1, 2), time=time(9),
+                                 transaction_type='OUT', amount=Decimal('30.00'))
+        self.assertEqual(self.rows(), [('Shop', Decimal('70.00'), 1)])
+        # Bulk writes send no signals but still move the book's version
+        CashEntry.objects.filter(book=self.book).update(amount=Decimal('10.00'))
+        self.assertEqual(self.rows(), [('Shop', Decimal('0.00'), 1)])
+        member = User.objects.create_user(username='partner', password='pw')
+        BookMember.objects.create(book=self.book, user=member, role='partner', created_by=self.user)
+        self.assertEqual(self.rows(), [('Shop', Decimal('0.00'), 2)])
+
+    def test_book_list_changes_reach_the_cache(self):
+        self.rows()
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Book.objects.create(name='Cafe', created_by=self.user)
+        self.assertEqual([name for name, _, _ in self.rows()], ['Cafe', 'Shop'])
+        with self.captureOnCommitCallbacks(execute=True):
+            other.name = 'Warehouse'
+            other.save()
+        self.assertEqual([name for name, _, _ in self.rows()], ['Shop', 'Warehouse'])
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertEqual([name for name, _, _ in self.rows()], ['Shop'])
+
+        # Losing the Admin group hides the add button and the books of other roles' rules
+        partner_group = Group.objects.create(name='Partner')
+        self.assertTrue(self.client.get('/').context['is_admin'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.set([partner_group])
+        self.assertEqual(self.rows(), [])
+        self.assertFalse(self.client.get('/').context['is_admin'])
+
+
+class BookDetailCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.viewer = User.objects.create_user(username='viewer', password='pw')
+        cls.book = Book.objects.create(name='Shop', created_by=cls.user)
+        BookMember.objects.create(book=cls.book, user=cls.viewer, role='partner', created_by=cls.user)
+        cls.rent = Category.objects.create(name='Rent', book=cls.book, created_by=cls.user)
+        for i in range(3):
+            CashEntry.objects.create(book=cls.book, user=cls.user, date=date(2024, 1, 1 + i), time=time(9),
+                                     transaction_type='IN', amount=Decimal('10.00'), category=cls.rent if i else None,
+                                     remarks=f'sale {i}')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/book/{self.book.id}/{query}')
+        entry_queries = [query['sql'] for query in queries.captured_queries
+                         if 'cashbook_cashentry' in query['sql'] or 'cashbook_category' in query['sql']]
+        self.fragments = response.context['fragments']
+        return response.content.decode(), entry_queries
+
+    def test_unchanged_book_skips_entry_and_category_queries(self):
+        _, queries = self.get('?type=IN&category=' + str(self.rent.id))
+        self.assertTrue(queries)
+        first = self.fragments
+        page, queries = self.get('?category=' + str(self.rent.id) + '&type=IN')
+        self.assertEqual(queries, [])
+        self.assertEqual(first, self.fragments)
+        self.assertIn(f'<option value="{self.rent.id}" selected>Rent</option>', page)
+
+    def test_changes_and_filters_get_their_own_pages(self):
+        page, _ = self.get()
+        self.assertIn('id="summary-net">30.00<', page)
+        CashEntry.objects.create(book=self.book, user=self.user, date=date(2024, 2, 1), time=time(9),
+                                 transaction_type='OUT', amount=Decimal('5.00'), remarks='stock')
+        page, queries = self.get()
+        self.assertTrue(queries)
+        self.assertIn('id="summary-net">25.00<', page)
+        page, _ = self.get('?type=OUT')
+        self.assertIn('id="summary-net">-5.00<', page)
+        self.rent.name = 'Lease'
+        self.rent.save()
+        page, _ = self.get()
+        self.assertIn('>Lease</option>', page)
+
+    def test_renamed_user_reaches_cached_entries(self):
+        page, _ = self.get()
+        self.assertIn('</span> owner', page)
+        version = BookBalance.objects.get(book=self.book).version
+        # Logins save last_login only, which leaves the books alone
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.viewer.username = 'watcher'
+        self.viewer.save()
+        self.assertEqual(BookBalance.objects.get(book=self.book).version, version)
+        self.user.username = 'shopkeeper'
+        self.user.save()
+        page, _ = self.get()
+        self.assertIn('</span> shopkeeper', page)
+
+    def test_viewers_do_not_share_the_editor_page(self):
+        page, _ = self.get()
+        self.assertIn('class="form-check-input entry-select"', page)
+        self.client.force_login(self.viewer)
+        page, _ = self.get()
+        self.assertNotIn('name="entries"', page)
+        self.assertIn('sale 2', page)
+
+
+class CategoryCatalogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pw')
+        cls.book = Book.objects.create(name='Shop', created_by=cls.user)
+        cls.other_book = Book.objects.create(name='Other', created_by=cls.user)
+        cls.rent, cls.fuel = (Category.objects.create(name=name, book=cls.book, created_by=cls.user) for name in ('Rent', 'Fuel'))
+        cls.foreign = Category.objects.create(name='Foreign', book=cls.other_book, created_by=cls.user)
+        CashEntry.objects.create(book=cls.book, user=cls.user, date=date(2024, 1, 1), time=time(9),
+                                 transaction_type='IN', amount=Decimal('10.00'), category=cls.rent)
+
+    def setUp(self):
+        # Category changes are rolled back after each test, but the catalogs cached from them are not
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_catalog_is_reused_until_a_category_changes(self):
+        catalog = category_catalog(self.book.id)
+        self.assertEqual(catalog.rows, [(self.rent.id, 'Rent'), (self.fuel.id, 'Fuel')])
+        # Only the stamp is read, and not even that when the caller has the book's balance
+        with self.assertNumQueries(1):
+            self.assertIs(category_catalog(self.book.id), catalog)
+        stamp = BookBalance.objects.get(book=self.book).categories_stamp
+        with self.assertNumQueries(0):
+            self.assertIs(category_catalog(self.book.id, stamp), catalog)
+            self.assertEqual(catalog.name(str(self.fuel.id)), 'Fuel')
+            self.assertIsNone(catalog.name(self.foreign.id))
+            self.assertIsNone(catalog.name('x'))
+        self.fuel.name = 'Petrol'
+        self.fuel.save()
+        self.assertEqual(category_catalog(self.book.id).name(self.fuel.id), 'Petrol')
+        # A change made by another process reaches this one through the database, not through its cache
+        Category.objects.bulk_create([Category(name='Tax', book=self.book, created_by=self.user)])
+        BookBalance.objects.filter(book=self.book).update(categories_stamp='elsewhere')
+        self.assertEqual([name for _, name in category_catalog(self.book.id).rows], ['Rent', 'Petrol', 'Tax'])
+        Category.objects.filter(book=self.book, name='Tax').delete()
+        self.rent.delete()
+        self.assertEqual(category_catalog(self.book.id).rows, [(self.fuel.id, 'Petrol')])
+        # Imports create categories with bulk_create, which has no signals
+        upload = SimpleUploadedFile('entries.csv', b'date,amount,category\n2024-01-02,5,Rent\n', content_type='text/csv')
+        self.client.post(f'/book/{self.book.id}/import/', {'file': upload})
+        self.assertEqual([name for _, name in category_catalog(self.book.id).rows], ['Petrol', 'Rent'])
+
+    def test_forms_rows_and_reports_read_names_from_the_catalog(self):
+        category_catalog(self.book.id)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/book/{self.book.id}/add/IN/')
+        self.assertNotIn('cashbook_category', ' '.join(query['sql'] for query in queries.captured_queries))
+        self.assertIn(f'<option value="{self.fuel.id}">Fuel</option>', response.content.decode())
+
+        # A submitted id is still checked against the book in the database
+        response = self.client.post(f'/book/{self.book.id}/add/OUT/', {
+            'transaction_type': 'OUT', 'amount': '3.00', 'remarks': 'x', 'category': self.foreign.id, 'optional_field': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CashEntry.objects.filter(book=self.book).count(), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(f'/api/v1/books/{self.book.id}/entries/?fields=id,category').json()
+        self.assertEqual(data['entries'][0]['category'], 'Rent')
+        self.assertNotIn('cashbook_category', ' '.join(query['sql'] for query in queries.captured_queries))
+        response = self.client.get(f'/book/{self.book.id}/download/?report_type=csv&report_scope=category'
+                                   f'&category={self.rent.id}')
+        self.assertIn(',Rent,', b''.join(response.streaming_content).decode())
+
+
+class ManageMyUsersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='boss', password='pw')
+        cls.admin.groups.add(Group.objects.create(name='Admin'))
+        partner_group = Group.objects.create(name='Partner')
+        books = [Book.objects.create(name=f'Book {i}', created_by=cls.admin) for i in range(3)]
+        users = User.objects.bulk_create([User(username=f'user{i:02d}', password='!') for i in range(30)])
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=user.id, group_id=partner_group.id) for user in users])
+        # user00 is in all three books, user01 in two, everyone else in one
+        BookMember.objects.bulk_create([
+            BookMember(book=book, user=user, role='partner', created_by=cls.admin)
+            for i, user in enumerate(users) for book in books[:max(3 - i, 1)]])
+        # Added by someone else: not listed
+        outsider = User.objects.create_user(username='user99', password='pw')
+        BookMember.objects.create(book=books[0], user=outsider, role='partner', created_by=outsider)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def usernames(self, query=''):
+        response = self.client.get(f'/users/my/{query}')
+        return [data['user'].username for data in response.context['user_data']]
+
+    def test_pages_search_and_sort(self):
+        self.assertEqual(self.usernames(), [f'user{i:02d}' for i in range(25)])
+        self.assertEqual(self.usernames('?page=2'), [f'user{i:02d}' for i in range(25, 30)])
+        self.assertEqual(self.usernames('?q=USER2'), [f'user{i:02d}' for i in range(20, 30)])
+        self.assertEqual(self.usernames('?sort=-username')[:2], ['user29', 'user28'])
+        self.assertEqual(self.usernames('?sort=books')[:3], ['user00', 'user01', 'user02'])
+        self.assertEqual(self.usernames('?sort=bogus')[0], 'user00')
+        response = self.client.get('/users/my/?q=user0')
+        books = [info['book'].name for info in response.context['user_data'][0]['books']]
+        self.assertEqual(sorted(books), ['Book 0', 'Book 1', 'Book 2'])
+        self.assertEqual(response.context['user_data'][0]['system_role'], 'Partner')
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        # The first request stores the role in the session
+        self.client.get('/users/my/?q=user01')
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/users/my/?q=user01')
+        with self.assertNumQueries(len(small.captured_queries)):
+            self.client.get('/users/my/')
+
+
+class UserRoleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='mgr', password='pw')
+        cls.user.groups.add(Group.objects.create(name='Manager'))
+        Group.objects.create(name='Admin')
+
+    def setUp(self):
+        cache.clear()
+        self.client.post('/login/', {'username': 'mgr', 'password': 'pw'})
+
+    def group_queries(self, path='/'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        return response, [q['sql'] for q in queries.captured_queries if 'auth_group' in q['sql']]
+
+    def test_role_comes_from_the_session(self):
+        self.group_queries()
+        # The homepage is cached now and checks no permissions: nothing reads the groups
+        response, queries = self.group_queries()
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context['user_role'], 'Manager')
+        self.assertContains(response, 'mgr (Manager)')
+        self.assertContains(response, 'href="/categories/"')
+        self.assertNotContains(response, 'Manage My Users')
+
+    def test_group_change_is_picked_up_on_the_next_request(self):
+        self.user.groups.set([Group.objects.get(name='Admin')])
+        response, queries = self.group_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.context['user_role'], 'Admin')
+        self.assertContains(response, 'Manage My Users')
+        response, queries = self.group_queries()
+        self.assertEqual(queries, [])
+
+    def test_demotion_missed_by_the_stamp_still_removes_access(self):
+        self.user.groups.set([Group.objects.get(name='Admin')])
+        self.client.get('/')
+        self.assertEqual(self.client.get('/users/my/').status_code, 200)
+        # A through-table delete sends no signal, like a change made where this process's cache cannot see it
+        User.groups.through.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get('/').context['user_role'], 'Admin')
+        # Menus catch up once the session copy is too old to trust...
+        with override_settings(USER_ROLE_SESSION_SECONDS=0):
+            self.assertIsNone(self.client.get('/').context['user_role'])
+        # ...but access checks never wait for that
+        self.user.groups.set([Group.objects.get(name='Admin')])
+        self.client.get('/users/my/')
+        User.groups.through.objects.filter(user=self.user).delete()
+        self.assertRedirects(self.client.get('/users/my/'), '/', fetch_redirect_response=False)
@@ -11,16 +11,22 @@ urlpatterns = [
     path('book/<int:book_id>/add/<str:transaction_type>/', views.add_entry, name='add_entry'),
     path('book/<int:book_id>/edit/<int:pk>/', views.edit_entry, name='edit_entry'),
     path('book/<int:book_id>/delete/<int:pk>/', views.delete_entry, name='delete_entry'),
+    path('book/<int:book_id>/import/', views.import_entries, name='import_entries'),
+    path('book/<int:book_id>/bulk/', views.bulk_entries, name='bulk_entries'),
     path('categories/', views.manage_categories, name='manage_categories'),
     path('categories/edit/<int:pk>/', views.edit_category, name='edit_category'),
     path('categories/delete/<int:pk>/', views.delete_category, name='delete_category'),
     path('book/<int:book_id>/report/', views.generate_report, name='generate_report'),
     path('book/<int:book_id>/download/', views.download_report, name='download_report'),
+    path('book/<int:book_id>/report/jobs/<int:job_id>/', views.report_job_status, name='report_job_status'),
+    path('book/<int:book_id>/report/jobs/<int:job_id>/download/', views.report_job_download, name='report_job_download'),
     path('book/<int:book_id>/create_user/', views.create_user_for_book, name='create_user_for_book'),
     path('users/my/', views.manage_my_users, name='manage_my_users'),
     path('user/edit/<int:user_id>/', views.edit_user, name='edit_user'),
     path('user/delete/<int:user_id>/', views.delete_user, name='delete_user'),
     path('edit_book/<int:book_id>/', views.edit_book, name='edit_book'),
     path('delete_book/<int:book_id>/', views.delete_book, name='delete_book'),
+    path('api/v1/books/<int:book_id>/entries/', views.api_book_entries, name='api_book_entries'),
+    path('api/v1/books/<int:book_id>/entries/<int:pk>/', views.api_book_entry, name='api_book_entry'),
     ]
-# Total we have a 20 URLs for our Routes
\ No newline at end of file
+# Total we have a 26 URLs for our Routes
\ No newline at end of file
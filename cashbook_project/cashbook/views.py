@@ -1,27 +1,36 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Sum, Q, Case, When, Value, DecimalField, F
+from django.db.models import Q, Case, When, Value, DecimalField, F, Count, Exists, OuterRef, Subquery, Prefetch
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User, Group
-from .models import CashEntry, Category, Book, BookMember, UserProfile
-from .forms import CashEntryForm, CategoryForm, BookForm, UserRegistrationForm, CreateUserForBookForm
-import json
-from django.http import JsonResponse, HttpResponse
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
+from .models import CashEntry, Category, Book, BookMember, UserProfile, BookBalance, ReportJob, OLDEST_FIRST
+from .forms import (CashEntryForm, CategoryForm, BookForm, UserRegistrationForm, CreateUserForBookForm, EntryImportForm,
+                    BulkEntryActionForm)
+from .permissions import BookAccess, user_group_names
+from .filters import EntryFilters, page_running_balances
+from .categories import category_catalog
+from .imports import IMPORT_MAX_ROWS, InvalidImportFile, import_entries as import_entry_file
+from .api import (API_MAX_PAGE_SIZE, API_PAGE_SIZE, DEFAULT_LIST_FIELDS, InvalidFields, json_response, parse_fields,
+                  serialize_entry)
+from .reports import REPORT_EXTENSIONS, STREAM_CONTENT_TYPES, STREAM_WRITERS, report_data, report_filename
+from . import caching, media, report_cache
+from .pagination import CursorPage, CursorPaginator, InvalidCursor
+from decimal import Decimal
 from io import BytesIO
-import openpyxl
+from django.http import JsonResponse, HttpResponse, FileResponse, StreamingHttpResponse, QueryDict, Http404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.text import compress_sequence
 from django.db import models
 import secrets
 import string
 import logging
 from django.db import transaction
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta  # Add this import for month calculations
+from datetime import datetime
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
@@ -49,6 +58,8 @@ def user_login(request):
         user = authenticate(request, username=username, password=password)
         if user is not None:
             login(request, user)
+            # Puts the role in the new session for the pages that follow
+            user_group_names(request)
             messages.success(request, 'Logged in successfully.')
             return redirect('homepage')
         else:
@@ -68,65 +79,90 @@ def user_logout(request):
 @login_required
 def homepage(request):
     user = request.user
-    books = Book.objects.none()  # Initialize empty queryset
+    search_query = request.GET.get('q', '').strip()
+    # Most visits are reloads of an unchanged list: serve the rows and page numbers from the cache
+    cache_key = caching.homepage_key(user.id, search_query, request.GET.get('page', ''))
+    cached = caching.get_homepage(cache_key)
+    if cached is not None:
+        page_obj = Paginator(range(cached['count']), 25).get_page(cached['number'])
+        logger.info(f"User: {user.username}, Books on page: {len(cached['rows'])} (cached), "
+                    f"Page: {page_obj.number}/{page_obj.paginator.num_pages}, Search: {search_query or 'N/A'}")
+        return render(request, 'homepage.html', {
+            'books_with_balance': cached['rows'],
+            'page_obj': page_obj,
+            'search_query': search_query,
+            'is_admin': cached['is_admin'],
+        })
+
+    group_names = user_group_names(request)
+    memberships = BookMember.objects.filter(user=user)
 
     # Determine books based on user group
-    if user.groups.filter(name='Admin').exists():
+    if 'Admin' in group_names:
         # Admins see books they created or are assigned to via BookMember
-        books = Book.objects.filter(created_by=user) | Book.objects.filter(members__user=user)
-        books = books.distinct()
-    elif user.groups.filter(name='Manager').exists():
+        books = Book.objects.filter(Q(created_by=user) | Q(id__in=memberships.values('book_id')))
+    elif 'Manager' in group_names:
         # Managers see only books where they are assigned as 'manager' in BookMember
-        books = Book.objects.filter(members__user=user, members__role='manager').distinct()
-    elif user.groups.filter(name='Partner').exists():
+        books = Book.objects.filter(id__in=memberships.filter(role='manager').values('book_id'))
+    elif 'Partner' in group_names:
         # Partners see only books they are members of
-        books = Book.objects.filter(members__user=user).distinct()
+        books = Book.objects.filter(id__in=memberships.values('book_id'))
     else:
         # Fallback: Show books created by or associated with the user
-        books = Book.objects.filter(created_by=user) | Book.objects.filter(members__user=user)
-        books = books.distinct()
+        books = Book.objects.filter(Q(created_by=user) | Q(id__in=memberships.values('book_id')))
 
-    # Debug: Log the books queryset
-    logger.info(f"User: {user.username}, Groups: {[g.name for g in user.groups.all()]}, Books fetched: {books.count()}")
+    if search_query:
+        books = books.filter(name__icontains=search_query)
 
-    # Calculate net balance and member count for each book
-    books_with_balance = []
-    for book in books:
-        entries = CashEntry.objects.filter(book=book)
-        net_balance = entries.aggregate(
-            net_balance=Sum(
-                Case(
-                    When(transaction_type='IN', then=F('amount')),
-                    When(transaction_type='OUT', then=-F('amount')),
-                    output_field=DecimalField(max_digits=10, decimal_places=2),
-                    default=Value(0.0)
-                )
-            )
-        )['net_balance'] or 0.0
+    # Balance, member count and creator membership are all resolved in the same SQL
+    # statement as the book list, so the page costs the same for 5 books or 500
+    member_count = BookMember.objects.filter(book=OuterRef('pk')).order_by().values('book').annotate(
+        total=Count('id')).values('total')
+    books = books.annotate(
+        net_balance=Coalesce(F('balance__net'), Value(Decimal('0')), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        member_total=Coalesce(Subquery(member_count), Value(0)),
+        creator_is_member=Exists(BookMember.objects.filter(book=OuterRef('pk'), user=OuterRef('created_by'))),
+        data_version=F('balance__version'),
+    ).order_by('name', 'id')
 
-        # Count members (using BookMember model)
-        member_count = book.members.count()
-        if book.created_by and not book.members.filter(user=book.created_by).exists():
-            member_count += 1
+    paginator = Paginator(books, 25)
+    page_obj = paginator.get_page(request.GET.get('page'))
 
+    books_with_balance = []
+    for book in page_obj:
+        # The book creator counts as a member even without a BookMember row
+        member_count = book.member_total + (0 if book.creator_is_member else 1)
         books_with_balance.append({
             'book': book,
-            'net_balance': net_balance,
+            'net_balance': book.net_balance,
             'member_count': member_count
         })
 
-    # Debug: Log the final books_with_balance
-    logger.info(f"User: {user.username}, Books with balance: {len(books_with_balance)}")
+    # Versions come from the same statement as the rows, so they always describe what is cached
+    caching.store(cache_key, {
+        'rows': books_with_balance,
+        'count': paginator.count,
+        'number': page_obj.number,
+        'is_admin': 'Admin' in group_names,
+        'versions': {item['book'].id: item['book'].data_version for item in books_with_balance},
+    })
+
+    logger.info(f"User: {user.username}, Groups: {sorted(group_names)}, Books on page: {len(books_with_balance)}, "
+                f"Page: {page_obj.number}/{paginator.num_pages}, Search: {search_query or 'N/A'}")
 
     return render(request, 'homepage.html', {
         'books_with_balance': books_with_balance,
+        'page_obj': page_obj,
+        'search_query': search_query,
+        'is_admin': 'Admin' in group_names,
     })
 
 @login_required
 def edit_book(request, book_id):
     book = get_object_or_404(Book, id=book_id)
     # Only Admins or book creators can edit books
-    if not (request.user.groups.filter(name='Admin').exists() or book.created_by == request.user):
+    access = BookAccess.for_request(request, book)
+    if not (access.is_system_admin or access.is_creator):
         messages.error(request, 'You do not have permission to edit this book.')
         logger.error(f"Permission denied for User: {request.user.username}, Book ID: {book.id}")
         return redirect('homepage')
@@ -153,7 +189,8 @@ def edit_book(request, book_id):
 def delete_book(request, book_id):
     book = get_object_or_404(Book, id=book_id)
     # Only Admins or book creators can delete books
-    if not (request.user.groups.filter(name='Admin').exists() or book.created_by == request.user):
+    access = BookAccess.for_request(request, book)
+    if not (access.is_system_admin or access.is_creator):
         messages.error(request, 'You do not have permission to delete this book.')
         logger.error(f"Permission denied for User: {request.user.username}, Book ID: {book.id}")
         return redirect('homepage')
@@ -173,152 +210,125 @@ def delete_book(request, book_id):
     })
 
 
+def _book_detail_fragments(request, book, access, filters):
+    """Totals, entry page and category lists for book_detail, rendered to HTML.
+
+    Everything here depends only on the book's data, the filters and whether the
+    viewer can edit, so the result is cached and shared by every such viewer.
+    """
+    # Category names for the filters, the bulk bar and the rows, without a query while they are unchanged
+    balance = getattr(book, 'balance', None)
+    categories = category_catalog(book.id, balance.categories_stamp if balance else None)
+    logger.info(f"Categories for Book ID {book.id}: {len(categories)}")
+
+    # Get all entries for the book, narrowed by the filter bar
+    if not filters.category:
+        logger.info("No category filter applied (All Categories selected)")
+    entries = filters.apply(CashEntry.objects.filter(book=book).newest_first(), rank=True)
+
+    # Totals come from the stored ledger or the rollups unless a search needs the entries themselves
+    cash_in, cash_out, net_balance, total_entries = filters.totals(book, entries)
+
+    # Keyset pagination on (date, time, id): every page costs the same as the first.
+    # The user comes in the same query and the category from the catalog, so rows fetch neither one by one
+    paginator = CursorPaginator(entries.select_related('user'), 10, ordering=filters.ordering)
+    try:
+        page_obj = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        logger.warning(f"Invalid cursor for Book ID {book.id}: {request.GET.get('cursor')}")
+        page_obj = paginator.page()
+    categories.attach(page_obj)
+
+    # Total matching entries: free from the ledger and rollups, an extra COUNT only on request
+    if total_entries is None and request.GET.get('count') == 'exact':
+        total_entries = entries.count()
+
+    # Running balance after each row, over the filtered entries in date/time order.
+    # A page in relevance order is not a run of dates, so it has none.
+    # The entry modal loads the rest of an entry from the API when it is opened
+    running_balances = {} if filters.ranked else page_running_balances(entries, paginator, page_obj, net_balance)
+    entry_data = [(entry, running_balances.get(entry.pk)) for entry in page_obj]
+
+    context = {
+        'entry_data': entry_data,
+        'cash_in': cash_in,
+        'cash_out': cash_out,
+        'net_balance': net_balance,
+        'total_entries': total_entries,
+        'can_add_entry': access.can_edit,
+    }
+    return {
+        'fragments': {
+            'summary': render_to_string('book_detail_summary.html', context),
+            'entries': render_to_string('book_detail_entries.html', context),
+            'category_options': render_to_string('book_detail_category_options.html', {
+                'categories': categories, 'selected': filters.category}),
+            'bulk_category_options': render_to_string('book_detail_category_options.html', {'categories': categories}),
+        },
+        'next_cursor': page_obj.next_cursor,
+        'previous_cursor': page_obj.previous_cursor,
+        'total_entries': total_entries,
+        'cash_in': cash_in,
+        'cash_out': cash_out,
+        'net_balance': net_balance,
+        'category_count': len(categories),
+    }
+
+
 @login_required
 def book_detail(request, book_id):
-    book = get_object_or_404(Book, id=book_id)
+    # The balance row carries the data version the cached page is keyed on
+    book = get_object_or_404(Book.objects.select_related('created_by', 'balance'), id=book_id)
     # Check if user has permission to view the book
-    if not (
-        request.user.groups.filter(name='Admin').exists() or
-        book.created_by == request.user or
-        BookMember.objects.filter(book=book, user=request.user).exists()
-    ):
+    access = BookAccess.for_request(request, book)
+    if not access.can_view:
         messages.error(request, 'You do not have permission to view this book.')
         logger.error(f"Permission denied for User: {request.user.username}, Book ID: {book.id}")
         return redirect('homepage')
-    
-    # Define categories early to avoid undefined variable error
-    try:
-        categories = Category.objects.filter(book=book)
-        logger.info(f"Categories for Book ID {book.id}: {list(categories.values('id', 'name'))}")
-    except Exception as e:
-        logger.error(f"Error fetching categories for Book ID {book.id}: {str(e)}")
-        categories = Category.objects.none()  # Fallback to empty queryset to avoid errors
 
-    # Get all entries for the book
-    entries = CashEntry.objects.filter(book=book).order_by('-time')
-    
-    # Apply filters from query parameters
-    date_filter = request.GET.get('date_filter')
-    category_filter = request.GET.get('category')
-    type_filter = request.GET.get('type')
-    search_query = request.GET.get('search', '')
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-
-    # Date filter logic for Today, This Month, Last Month
-    # Date filter logic
-    if date_filter:
-        today = datetime.now().date()
-        if date_filter == 'today':
-            entries = entries.filter(date=today)
-        elif date_filter == 'yesterday':
-            yesterday = today - timedelta(days=1)
-            entries = entries.filter(date=yesterday)
-        elif date_filter == 'this_month':
-            start_of_month = today.replace(day=1)
-            entries = entries.filter(date__gte=start_of_month, date__lte=today)
-        elif date_filter == 'last_month':
-            last_month = today - relativedelta(months=1)
-            start_of_last_month = last_month.replace(day=1)
-            end_of_last_month = start_of_last_month + relativedelta(months=1, days=-1)
-            entries = entries.filter(date__gte=start_of_last_month, date__lte=end_of_last_month)
-        elif date_filter == 'custom' and start_date and end_date:
-            try:
-                start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-                end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-                if start_date > end_date:
-                    messages.error(request, 'Start date cannot be after end date.')
-                    logger.error(f"Invalid date range: Start date {start_date} is after end date {end_date}")
-                else:
-                    entries = entries.filter(date__gte=start_date, date__lte=end_date)
-            except ValueError:
-                messages.error(request, 'Invalid date format. Please use YYYY-MM-DD.')
-                logger.error(f"Invalid date format for start_date: {start_date}, end_date: {end_date}")
-
-    # Category filter
-    if category_filter:
-        entries = entries.filter(category__id=category_filter)
-    else:
-        logger.info("No category filter applied (All Categories selected)")
-    
-    # Transaction type filter
-    if type_filter:
-        entries = entries.filter(transaction_type=type_filter)
-    
-    # Search query filter
-    if search_query:
-        entries = entries.filter(Q(remarks__icontains=search_query) | Q(amount__icontains=search_query))
-
-    # Calculate cash in, cash out, and net balance
-    cash_in = entries.filter(transaction_type='IN').aggregate(Sum('amount'))['amount__sum'] or 0
-    cash_out = entries.filter(transaction_type='OUT').aggregate(Sum('amount'))['amount__sum'] or 0
-    net_balance = cash_in - cash_out
-
-    # Paginate entries for all users
-    paginator = Paginator(entries, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    entry_data = []
-    running_balance = 0
-    for entry in page_obj:
-        if entry.transaction_type == 'IN':
-            running_balance += entry.amount
-        else:
-            running_balance -= entry.amount
-        serialized_entry = {
-            'id': entry.id,
-            'transaction_type': entry.get_transaction_type_display(),
-            'amount': str(entry.amount),
-            'date': entry.date.isoformat() if entry.date else '',
-            'time': entry.time.strftime('%H:%M:%S') if entry.time else '',
-            'remarks': entry.remarks or '',
-            'category': entry.category.name if entry.category else '',
-            'image': entry.image.url if entry.image else '',
-            'optional_field': entry.optional_field or '',
-            'user': entry.user.username if entry.user else '',
-            'created_at': entry.created_at.isoformat() if entry.created_at else '',
-            'book_id': entry.book.id,
-            'running_balance': str(running_balance),
-        }
-        entry_data.append((entry, json.dumps(serialized_entry, ensure_ascii=False), running_balance))
+    filters = EntryFilters(request.GET)
+    for error in filters.errors:
+        messages.error(request, error)
+
+    # Reloads of an unchanged book skip the queries and the rendering of the list
+    balance = getattr(book, 'balance', None)
+    cache_key = None
+    if balance is not None:
+        cache_key = caching.book_detail_key(book.id, balance.version, 'editor' if access.can_edit else 'viewer',
+                                            filters, request.GET.get('cursor'), request.GET.get('count') == 'exact')
+    page = caching.get_book_detail(cache_key) if cache_key else None
+    cached = page is not None
+    if not cached:
+        page = _book_detail_fragments(request, book, access, filters)
+        if cache_key:
+            caching.store(cache_key, page)
+
+    # Filters/search carried over into the next/previous links
+    filter_params = request.GET.copy()
+    for key in ('cursor', 'page'):
+        filter_params.pop(key, None)
 
     context = {
         'book': book,
-        'entry_data': entry_data,
-        'categories': categories,  # Use the defined categories variable
-        'cash_in': cash_in,
-        'cash_out': cash_out,
-        'net_balance': net_balance,
-        'search_query': search_query,
-        'page_obj': page_obj,
+        'fragments': page['fragments'],
+        'search_query': filters.search,
+        'page_obj': CursorPage([], page['next_cursor'], page['previous_cursor']),
+        'total_entries': page['total_entries'],
+        'filter_query': filter_params.urlencode(),
         'current_user': request.user,
-        'is_book_admin': (
-            request.user.groups.filter(name='Admin').exists() or
-            book.created_by == request.user or
-            BookMember.objects.filter(book=book, user=request.user, role='admin').exists()
-        ),
-        'can_add_entry': (
-            request.user.groups.filter(name='Admin').exists() or
-            request.user.groups.filter(name='Manager').exists() or
-            book.created_by == request.user or
-            BookMember.objects.filter(book=book, user=request.user, role__in=['admin', 'manager']).exists()
-        ),
-        'can_generate_report': (
-            request.user.groups.filter(name='Admin').exists() or
-            request.user.groups.filter(name='Manager').exists() or
-            book.created_by == request.user or
-            BookMember.objects.filter(book=book, user=request.user, role='admin').exists()
-        ),
-        'date_filter': date_filter,  # Pass date_filter to template
+        'is_book_admin': access.is_admin,
+        'can_add_entry': access.can_edit,
+        'can_generate_report': access.can_report,
+        'date_filter': filters.date_filter,  # Pass date_filter to template
+        'ranked': filters.ranked,
     }
     
-    logger.info(f"Book Detail - User: {request.user.username}, Book ID: {book.id}, "
-                f"Entries Count: {entries.count()}, Cash In: {cash_in}, Cash Out: {cash_out}, Net Balance: {net_balance}, "
-                f"Categories Count: {categories.count()}, "
-                f"Date Filter: {date_filter}, Start Date: {start_date or 'N/A'}, End Date: {end_date or 'N/A'}, "
+    logger.info(f"Book Detail - User: {request.user.username}, Book ID: {book.id}, Cached: {cached}, "
+                f"Entries Count: {page['total_entries'] if page['total_entries'] is not None else 'not counted'}, Cash In: {page['cash_in']}, Cash Out: {page['cash_out']}, Net Balance: {page['net_balance']}, "
+                f"Categories Count: {page['category_count']}, "
+                f"Date Filter: {filters.date_filter}, Start Date: {filters.start_date or 'N/A'}, End Date: {filters.end_date or 'N/A'}, "
                 f"Is Book Admin: {context['is_book_admin']}, Can Add Entry: {context['can_add_entry']}, "
-                f"BookMember Role: {BookMember.objects.filter(book=book, user=request.user).values('role').first() or 'None'}")
+                f"BookMember Role: {access.role or 'None'}")
     
     return render(request, 'book_detail.html', context)
 
@@ -443,9 +453,7 @@ def book_detail(request, book_id):
 def create_user_for_book(request, book_id):
     book = get_object_or_404(Book, id=book_id)
     # Only Admins, book creators, or book admins can add users
-    if not (request.user.groups.filter(name='Admin').exists() or 
-            book.created_by == request.user or 
-            BookMember.objects.filter(book=book, user=request.user, role='admin').exists()):
+    if not BookAccess.for_request(request, book).is_admin:
         messages.error(request, 'You do not have permission to create users for this book.')
         return redirect('book_detail', book_id=book.id)
     if request.method == 'POST':
@@ -503,7 +511,7 @@ def create_user_for_book(request, book_id):
 @login_required
 def add_book(request):
     # Only Admins can create books
-    if not request.user.groups.filter(name='Admin').exists():
+    if 'Admin' not in user_group_names(request):
         messages.error(request, 'Only Admins can create books.')
         logger.error(f"Permission denied for User: {request.user.username} to create book (not Admin)")
         return redirect('homepage')
@@ -529,22 +537,18 @@ def add_book(request):
 def add_entry(request, book_id, transaction_type):
     book = get_object_or_404(Book, id=book_id)
     # Check if user is an Admin, book creator, or has admin/manager role in BookMember
-    is_authorized = (
-        request.user.groups.filter(name='Admin').exists() or
-        book.created_by == request.user or
-        BookMember.objects.filter(book=book, user=request.user, role__in=['admin', 'manager']).exists()
-    )
+    access = BookAccess.for_request(request, book)
     logger.info(f"User: {request.user.username}, Book: {book.id}, "
-                f"Is Admin: {request.user.groups.filter(name='Admin').exists()}, "
-                f"Is Book Creator: {book.created_by == request.user}, "
-                f"BookMember Role: {BookMember.objects.filter(book=book, user=request.user).values('role').first()}")
-    if not is_authorized:
+                f"Is Admin: {access.is_system_admin}, "
+                f"Is Book Creator: {access.is_creator}, "
+                f"BookMember Role: {access.role}")
+    if not access.can_edit:
         messages.error(request, 'You do not have permission to add entries to this book.')
         return redirect('book_detail', book_id=book.id)
     
     if request.method == 'POST':
         if 'add_category' in request.POST:
-            if request.user.groups.filter(name='Partner').exists():
+            if access.is_partner:
                 messages.error(request, 'Partners cannot create categories.')
                 return redirect('add_entry', book_id=book_id, transaction_type=transaction_type)
             category_form = CategoryForm(request.POST)
@@ -579,6 +583,7 @@ def add_entry(request, book_id, transaction_type):
                 entry.date = datetime.now().date()
                 entry.time = datetime.now().time()
                 entry.save()
+                form.process_image()
                 # messages.success(request, f'{"Cash In" if transaction_type == "IN" else "Cash Out"} added successfully.')
                 if 'save_and_add' in request.POST:
                     return redirect('add_entry', book_id=book.id, transaction_type=transaction_type)
@@ -604,16 +609,12 @@ def edit_entry(request, book_id, pk):
     book = get_object_or_404(Book, id=book_id)
     entry = get_object_or_404(CashEntry, id=pk, book=book)
     # Check if user is an Admin, book creator, or has admin/manager role in BookMember
-    is_authorized = (
-        request.user.groups.filter(name='Admin').exists() or
-        book.created_by == request.user or
-        BookMember.objects.filter(book=book, user=request.user, role__in=['admin', 'manager']).exists()
-    )
+    access = BookAccess.for_request(request, book)
     logger.info(f"User: {request.user.username}, Book: {book.id}, "
-                f"Is Admin: {request.user.groups.filter(name='Admin').exists()}, "
-                f"Is Book Creator: {book.created_by == request.user}, "
-                f"BookMember Role: {BookMember.objects.filter(book=book, user=request.user).values('role').first()}")
-    if not is_authorized:
+                f"Is Admin: {access.is_system_admin}, "
+                f"Is Book Creator: {access.is_creator}, "
+                f"BookMember Role: {access.role}")
+    if not access.can_edit:
         messages.error(request, 'You do not have permission to edit this entry.')
         return redirect('book_detail', book_id=book.id)
     if request.method == 'POST':
@@ -638,16 +639,12 @@ def delete_entry(request, book_id, pk):
     book = get_object_or_404(Book, id=book_id)
     entry = get_object_or_404(CashEntry, id=pk, book=book)
     # Check if user is an Admin, book creator, or has admin/manager role in BookMember
-    is_authorized = (
-        request.user.groups.filter(name='Admin').exists() or
-        book.created_by == request.user or
-        BookMember.objects.filter(book=book, user=request.user, role__in=['admin', 'manager']).exists()
-    )
+    access = BookAccess.for_request(request, book)
     logger.info(f"User: {request.user.username}, Book: {book.id}, "
-                f"Is Admin: {request.user.groups.filter(name='Admin').exists()}, "
-                f"Is Book Creator: {book.created_by == request.user}, "
-                f"BookMember Role: {BookMember.objects.filter(book=book, user=request.user).values('role').first()}")
-    if not is_authorized:
+                f"Is Admin: {access.is_system_admin}, "
+                f"Is Book Creator: {access.is_creator}, "
+                f"BookMember Role: {access.role}")
+    if not access.can_edit:
         messages.error(request, 'You do not have permission to delete this entry.')
         return redirect('book_detail', book_id=book.id)
     if request.method == 'POST':
@@ -659,9 +656,115 @@ def delete_entry(request, book_id, pk):
         'entry': entry,
     })
 
+@login_required
+def bulk_entries(request, book_id):
+    book = get_object_or_404(Book, id=book_id)
+    # One permission check covers every selected entry: they all belong to this book
+    access = BookAccess.for_request(request, book)
+    if not access.can_edit:
+        messages.error(request, 'You do not have permission to change entries in this book.')
+        return redirect('book_detail', book_id=book.id)
+    if request.method != 'POST':
+        return redirect('book_detail', book_id=book.id)
+
+    form = BulkEntryActionForm(book, request.POST)
+    back = reverse('book_detail', args=[book.id])
+    filter_query = QueryDict(request.POST.get('filters', '')).urlencode()
+    if filter_query:
+        back = f"{back}?{filter_query}"
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return redirect(back)
+
+    if form.cleaned_data['all_matching']:
+        filters = EntryFilters(QueryDict(form.cleaned_data['filters']))
+        if filters.errors:
+            for error in filters.errors:
+                messages.error(request, error)
+            return redirect(back)
+        entries = filters.apply(CashEntry.objects.filter(book=book))
+    else:
+        entries = form.cleaned_data['entries']
+
+    # A single UPDATE or DELETE; CashEntryQuerySet moves the balance and rollups in the same transaction
+    action = form.cleaned_data['action']
+    with transaction.atomic():
+        if action == 'delete':
+            count = entries.delete()[1].get(CashEntry._meta.label, 0)
+            message = f'Deleted {count} {"entry" if count == 1 else "entries"}.'
+        elif action == 'set_category':
+            category = form.cleaned_data['new_category']
+            count = entries.update(category=category)
+            message = f'Moved {count} {"entry" if count == 1 else "entries"} to {category.name if category else "no category"}.'
+        else:
+            transaction_type = form.cleaned_data['new_type']
+            count = entries.update(transaction_type=transaction_type)
+            message = f'Marked {count} {"entry" if count == 1 else "entries"} as {dict(CashEntry.TRANSACTION_TYPES)[transaction_type]}.'
+    logger.info(f"Bulk {action} by {request.user.username} on Book ID {book.id}: {count} entries, "
+                f"all matching: {form.cleaned_data['all_matching']}")
+    messages.success(request, message)
+    return redirect(back)
+
+# Longest prefix first: thumbnails and previews live inside the images folder
+MEDIA_FIELDS = sorted(((CashEntry._meta.get_field(name).upload_to, name) for name in ('image', 'thumbnail', 'preview')),
+                      key=lambda item: -len(item[0]))
+
+
+@login_required
+def serve_media(request, path):
+    # Receipt images are only readable by people who can open the entry's book
+    field = next((name for prefix, name in MEDIA_FIELDS if path.startswith(prefix)), None)
+    if field is None:
+        raise Http404('No such file.')
+    # The __gt='' term lets the partial index on the field answer this
+    entry = CashEntry.objects.filter(**{field: path, f'{field}__gt': ''}).select_related('book').first()
+    if entry is None or not BookAccess.for_request(request, entry.book).can_view:
+        logger.warning(f"Media request refused for User: {request.user.username}, Path: {path}")
+        raise Http404('No such file.')
+    return media.serve(request, path)
+
+
+@login_required
+def import_entries(request, book_id):
+    book = get_object_or_404(Book, id=book_id)
+    access = BookAccess.for_request(request, book)
+    if not access.can_edit:
+        messages.error(request, 'You do not have permission to add entries to this book.')
+        return redirect('book_detail', book_id=book.id)
+
+    result = None
+    if request.method == 'POST':
+        form = EntryImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                # Partners cannot create categories here either, only use existing ones
+                result = import_entry_file(book, request.user, upload, upload.extension,
+                                           dry_run=form.cleaned_data['dry_run'], can_create_categories=not access.is_partner)
+            except InvalidImportFile as e:
+                messages.error(request, str(e))
+                logger.error(f"Import rejected for Book ID {book.id}: {str(e)}")
+            else:
+                if result.dry_run:
+                    messages.info(request, f'{result.imported} of {result.rows} rows are valid. Nothing was imported.')
+                elif result.imported:
+                    messages.success(request, f'Imported {result.imported} of {result.rows} rows.')
+                if result.error_count:
+                    messages.error(request, f'{result.error_count} row(s) have errors and were skipped.')
+    else:
+        form = EntryImportForm()
+    return render(request, 'import_entries.html', {
+        'book': book,
+        'form': form,
+        'result': result,
+        'max_rows': IMPORT_MAX_ROWS,
+    })
+
 @login_required
 def manage_categories(request):
-    if request.user.groups.filter(name='Partner').exists():
+    if 'Partner' in user_group_names(request):
         messages.error(request, 'Partners cannot manage categories.')
         return redirect('homepage')
     # Only show categories for books the user has access to
@@ -676,9 +779,10 @@ def manage_categories(request):
 @login_required
 def edit_category(request, pk):
     category = get_object_or_404(Category, id=pk)
-    if not (request.user.groups.filter(name='Admin').exists() or 
-            category.created_by == request.user or 
-            BookMember.objects.filter(book=category.book, user=request.user, role='admin').exists()):
+    access = BookAccess.for_request(request, category.book)
+    if not (access.is_system_admin or
+            category.created_by_id == request.user.id or
+            access.role == 'admin'):
         messages.error(request, 'You do not have permission to edit this category.')
         return redirect('manage_categories')
     if request.method == 'POST':
@@ -699,9 +803,10 @@ def edit_category(request, pk):
 @login_required
 def delete_category(request, pk):
     category = get_object_or_404(Category, id=pk)
-    if not (request.user.groups.filter(name='Admin').exists() or 
-            category.created_by == request.user or 
-            BookMember.objects.filter(book=category.book, user=request.user, role='admin').exists()):
+    access = BookAccess.for_request(request, category.book)
+    if not (access.is_system_admin or
+            category.created_by_id == request.user.id or
+            access.role == 'admin'):
         messages.error(request, 'You do not have permission to delete this category.')
         return redirect('manage_categories')
     if request.method == 'POST':
@@ -725,11 +830,8 @@ def edit_user(request, user_id, book_id=None):
 
     # Permission check
     is_authorized = (
-        request.user.groups.filter(name='Admin').exists() or
-        (book and (
-            book.created_by == request.user or
-            BookMember.objects.filter(book=book, user=request.user, role='admin').exists()
-        ))
+        'Admin' in user_group_names(request) or
+        (book and BookAccess.for_request(request, book).is_admin)
     )
     if not is_authorized:
         messages.error(request, 'You do not have permission to edit users.')
@@ -808,11 +910,8 @@ def delete_user(request, user_id, book_id=None):
 
     # Permission check
     is_authorized = (
-        request.user.groups.filter(name='Admin').exists() or
-        (book and (
-            book.created_by == request.user or
-            BookMember.objects.filter(book=book, user=request.user, role='admin').exists()
-        ))
+        'Admin' in user_group_names(request) or
+        (book and BookAccess.for_request(request, book).is_admin)
     )
     if not is_authorized:
         messages.error(request, 'You do not have permission to delete users.')
@@ -820,7 +919,7 @@ def delete_user(request, user_id, book_id=None):
         return redirect('manage_my_users')
 
     if book_id:
-        if book.created_by == user:
+        if book.created_by_id == user.id:
             messages.error(request, 'Cannot delete the book creator.')
             logger.warning(f"Attempt to delete book creator User: {user.username} for Book ID: {book_id}")
             return redirect('manage_my_users')
@@ -853,25 +952,25 @@ def delete_user(request, user_id, book_id=None):
 def generate_report(request, book_id):
     book = get_object_or_404(Book, id=book_id)
     # Only Admins, Managers, book creators, or book admins can generate reports
-    if not (request.user.groups.filter(name='Admin').exists() or 
-            request.user.groups.filter(name='Manager').exists() or 
-            book.created_by == request.user or 
-            BookMember.objects.filter(book=book, user=request.user, role='admin').exists()):
+    if not BookAccess.for_request(request, book).can_report:
         messages.error(request, 'You do not have permission to generate reports for this book.')
         return redirect('book_detail', book_id=book.id)
-    categories = Category.objects.filter(book=book)
+    categories = category_catalog(book.id)
+    # ?job= shows the progress of a report that is being rendered in the background
+    job = None
+    job_id = request.GET.get('job')
+    if job_id and job_id.isdigit():
+        job = ReportJob.objects.defer('content').filter(id=job_id, book=book, requested_by=request.user).first()
     return render(request, 'generate_report.html', {
         'book': book,
         'categories': categories,
+        'job': job,
     })
 
 @login_required
 def download_report(request, book_id):
     book = get_object_or_404(Book, id=book_id)
-    if not (request.user.groups.filter(name='Admin').exists() or 
-            request.user.groups.filter(name='Manager').exists() or 
-            book.created_by == request.user or 
-            BookMember.objects.filter(book=book, user=request.user, role='admin').exists()):
+    if not BookAccess.for_request(request, book).can_report:
         messages.error(request, 'You do not have permission to generate reports for this book.')
         return redirect('book_detail', book_id=book.id)
     
@@ -882,143 +981,136 @@ def download_report(request, book_id):
     if not report_type or not report_scope:
         messages.error(request, 'Please select both report type and scope.')
         return redirect('generate_report', book_id=book_id)
+    if report_scope != 'category' or not category_id:
+        category_id = None
+    if report_type not in REPORT_EXTENSIONS:
+        messages.error(request, 'Invalid report type selected.')
+        return redirect('generate_report', book_id=book_id)
     
-    entries = CashEntry.objects.filter(book=book)
-    if report_scope == 'category' and category_id:
-        entries = entries.filter(category__id=category_id)
-        category_name = Category.objects.get(id=category_id).name
-    else:
-        category_name = 'All Categories'
+    # An unchanged book renders the same file: answer with a 304 or with an earlier job's file when we can
+    balance = BookBalance.for_book(book)
+    cache_key = report_cache.cache_key(book.id, report_type, report_scope, category_id, balance.version)
+    modified = int(balance.updated_at.timestamp())
+    not_modified = get_conditional_response(request, etag=report_cache.etag(cache_key), last_modified=modified)
+    if not_modified is not None:
+        return report_cache.set_validators(not_modified, cache_key, modified)
     
-    if report_type == 'pdf':
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        title = Paragraph(f"Cashbook Report - {book.name} ({category_name})", styles['Title'])
-        elements.append(title)
-        
-        data = [['Date', 'Type', 'Amount', 'Category', 'Remarks', 'Running Balance']]
-        running_balance = 0
-        for entry in entries.order_by('date', 'time'):
-            if entry.transaction_type == 'IN':
-                running_balance += entry.amount
-            else:
-                running_balance -= entry.amount
-            data.append([
-                entry.date.strftime('%Y-%m-%d'),
-                entry.get_transaction_type_display(),
-                str(entry.amount),
-                entry.category.name if entry.category else 'N/A',
-                entry.remarks or 'N/A',
-                str(running_balance),
-            ])
-        
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(table)
-        
-        cash_in = entries.filter(transaction_type='IN').aggregate(Sum('amount'))['amount__sum'] or 0
-        cash_out = entries.filter(transaction_type='OUT').aggregate(Sum('amount'))['amount__sum'] or 0
-        net_balance = cash_in - cash_out
-        summary = Paragraph(
-            f"<br/>Summary:<br/>Cash In: {cash_in}<br/>Cash Out: {cash_out}<br/>Net Balance: {net_balance}",
-            styles['Normal']
-        )
-        elements.append(summary)
-        
-        doc.build(elements)
-        buffer.seek(0)
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="cashbook_report_{book.name}_{report_scope}.pdf"'
-        response.write(buffer.getvalue())
-        buffer.close()
-        return response
+    # Only this book's categories; anything else would fail deep inside report_data
+    catalog = category_catalog(book.id, balance.categories_stamp)
+    if category_id and catalog.name(category_id) is None:
+        messages.error(request, 'Selected category does not exist.')
+        return redirect('generate_report', book_id=book_id)
     
-    elif report_type == 'excel':
-        workbook = openpyxl.Workbook()
-        worksheet = workbook.active
-        worksheet.title = f"{book.name} Report"
-        
-        worksheet.append([f"Cashbook Report - {book.name} ({category_name})"])
-        worksheet.append(['Date', 'Type', 'Amount', 'Category', 'Remarks', 'Running Balance'])
-        
-        running_balance = 0
-        for entry in entries.order_by('date', 'time'):
-            if entry.transaction_type == 'IN':
-                running_balance += entry.amount
-            else:
-                running_balance -= entry.amount
-            worksheet.append([
-                entry.date,
-                entry.get_transaction_type_display(),
-                entry.amount,
-                entry.category.name if entry.category else 'N/A',
-                entry.remarks or 'N/A',
-                running_balance,
-            ])
-        
-        cash_in = entries.filter(transaction_type='IN').aggregate(Sum('amount'))['amount__sum'] or 0
-        cash_out = entries.filter(transaction_type='OUT').aggregate(Sum('amount'))['amount__sum'] or 0
-        net_balance = cash_in - cash_out
-        worksheet.append([])
-        worksheet.append(['Summary'])
-        worksheet.append(['Cash In', cash_in])
-        worksheet.append(['Cash Out', cash_out])
-        worksheet.append(['Net Balance', net_balance])
-        
-        for col in worksheet.columns:
-            max_length = 0
-            column = col[0].column_letter
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = max_length + 2
-            worksheet.column_dimensions[column].width = adjusted_width
-        
-        buffer = BytesIO()
-        workbook.save(buffer)
-        buffer.seek(0)
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = f'attachment; filename="cashbook_report_{book.name}_{report_scope}.xlsx"'
-        response.write(buffer.getvalue())
-        buffer.close()
-        return response
+    if report_type in ('pdf', 'excel'):
+        cached = report_cache.open_cached(cache_key)
+        if cached is not None:
+            logger.info(f"Serving cached {report_type} report for Book ID {book.id}, scope {report_scope}")
+            response = FileResponse(cached, as_attachment=True, filename=report_filename(book, report_type, report_scope))
+            return report_cache.set_validators(response, cache_key, modified)
+        # Rendering a whole book would pin this worker, so queue it for run_report_worker.
+        # A second click while the same report is still pending reuses that job.
+        job = ReportJob.objects.defer('content').filter(
+            book=book, requested_by=request.user, report_type=report_type, report_scope=report_scope,
+            category_id=category_id, status__in=(ReportJob.QUEUED, ReportJob.RUNNING),
+        ).first()
+        if job is None:
+            job = ReportJob.objects.create(book=book, requested_by=request.user, report_type=report_type,
+                                           report_scope=report_scope, category_id=category_id)
+            logger.info(f"Queued report job {job.id}: {report_type} for Book ID {book.id}, By: {request.user.username}")
+        return redirect(f"{reverse('generate_report', args=[book.id])}?job={job.id}")
     
-    else:
-        messages.error(request, 'Invalid report type selected.')
+    elif report_type in STREAM_WRITERS:
+        entries = report_data(book, report_scope, category_id)[0]
+        # Rows go out as the cursor produces them; nothing is built up front
+        names = catalog.names
+        chunks = (chunk.encode('utf-8') for chunk in STREAM_WRITERS[report_type](entries, names))
+        response = StreamingHttpResponse(chunks, content_type=STREAM_CONTENT_TYPES[report_type])
+        if request.GET.get('compress') == 'gzip' and 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response.streaming_content = compress_sequence(response.streaming_content)
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        report_cache.set_validators(response, cache_key, modified)
+        if response.has_header('Content-Encoding'):
+            # Compressed bytes differ from the plain ones, so only a weak match is honest
+            response['ETag'] = f"W/{response['ETag']}"
+        # Stop nginx from buffering the whole stream before passing it on
+        response['X-Accel-Buffering'] = 'no'
+        response['Content-Disposition'] = f'attachment; filename="{report_filename(book, report_type, report_scope)}"'
+        logger.info(f"Streaming {report_type} report for Book ID {book.id}, scope {report_scope}")
+        return response
+
+def _report_job_for(request, book_id, job_id, content=False):
+    book = get_object_or_404(Book, id=book_id)
+    if not BookAccess.for_request(request, book).can_report:
+        return None
+    jobs = ReportJob.objects.filter(id=job_id, book=book, requested_by=request.user)
+    # The rendered file can be megabytes; status polls only need the small columns
+    return (jobs if content else jobs.defer('content')).first()
+
+@login_required
+def report_job_status(request, book_id, job_id):
+    job = _report_job_for(request, book_id, job_id)
+    if job is None:
+        return JsonResponse({'error': 'Report not found.'}, status=404)
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'error': job.error,
+        'download_url': reverse('report_job_download', args=[book_id, job.id]) if job.status == ReportJob.DONE else None,
+    })
+
+@login_required
+def report_job_download(request, book_id, job_id):
+    job = _report_job_for(request, book_id, job_id, content=True)
+    if job is None or job.status != ReportJob.DONE or not job.content:
+        messages.error(request, 'That report is not available.')
         return redirect('generate_report', book_id=book_id)
+    return FileResponse(BytesIO(job.content), as_attachment=True,
+                        filename=report_filename(job.book, job.report_type, job.report_scope))
+
+
+# ?sort= choices for manage_my_users: value -> (label, ordering)
+MANAGED_USER_SORTS = {
+    'username': ('Username (A-Z)', ('username',)),
+    '-username': ('Username (Z-A)', ('-username',)),
+    'newest': ('Newest first', ('-date_joined', '-id')),
+    'oldest': ('Oldest first', ('date_joined', 'id')),
+    'books': ('Most books', ('-managed_books', 'username')),
+}
 
 
 @login_required
 def manage_my_users(request):
-    if not request.user.groups.filter(name='Admin').exists():
+    if 'Admin' not in user_group_names(request):
         messages.error(request, 'Only Admins can manage their users.')
         return redirect('homepage')
     
     # Get BookMember entries where you are the creator
-    book_members = BookMember.objects.filter(created_by=request.user).select_related('user', 'book')
-    # Get unique users you added to books
-    users = User.objects.filter(book_memberships__created_by=request.user).distinct()
+    book_members = BookMember.objects.filter(created_by=request.user).select_related('book')
+    # Users you added to books, searched and sorted in SQL. Groups and memberships are
+    # prefetched for the current page only, so every page costs the same four queries
+    users = User.objects.filter(id__in=book_members.values('user_id'))
+    search_query = request.GET.get('q', '').strip()
+    if search_query:
+        users = users.filter(username__icontains=search_query)
+    sort = request.GET.get('sort', 'username')
+    if sort not in MANAGED_USER_SORTS:
+        sort = 'username'
+    if sort == 'books':
+        users = users.annotate(managed_books=Count('book_memberships', filter=Q(book_memberships__created_by=request.user)))
+    users = users.order_by(*MANAGED_USER_SORTS[sort][1]).prefetch_related(
+        'groups', Prefetch('book_memberships', queryset=book_members, to_attr='managed_memberships'))
+
+    paginator = Paginator(users, 25)
+    page_obj = paginator.get_page(request.GET.get('page'))
     user_data = []
     
-    for user in users:
-        system_role = user.groups.first().name if user.groups.exists() else 'No Role'
+    for user in page_obj:
+        groups = list(user.groups.all())
+        system_role = min(groups, key=lambda group: group.pk).name if groups else 'No Role'
         # Get books this user is assigned to
-        user_book_memberships = book_members.filter(user=user)
+        user_book_memberships = user.managed_memberships
         books = [
             {
                 'book': membership.book,
@@ -1033,10 +1125,81 @@ def manage_my_users(request):
             'can_manage': user != request.user  # Prevent self-deletion
         })
     
-    logger.info(f"Manage My Users - Admin: {request.user.username}, Total Users: {len(users)}")
+    logger.info(f"Manage My Users - Admin: {request.user.username}, Total Users: {paginator.count}, "
+                f"Page: {page_obj.number}/{paginator.num_pages}, Search: {search_query or 'N/A'}, Sort: {sort}")
     
     context = {
         'user_data': user_data,
-        'is_admin': request.user.groups.filter(name='Admin').exists(),
+        'page_obj': page_obj,
+        'search_query': search_query,
+        'sort': sort,
+        'sort_options': [(value, label) for value, (label, _) in MANAGED_USER_SORTS.items()],
+        'is_admin': True,  # Only Admins reach this point
     }
-    return render(request, 'manage_my_users.html', context)
\ No newline at end of file
+    return render(request, 'manage_my_users.html', context)
+
+@login_required
+def api_book_entries(request, book_id):
+    """A book's entries and totals as JSON (API v1).
+
+    Takes the same filters as book_detail plus cursor, limit and fields=a,b,c.
+    With sort=relevance and a search, running_balance is null.
+    """
+    book = get_object_or_404(Book.objects.select_related('balance'), id=book_id)
+    if not BookAccess.for_request(request, book).can_view:
+        return json_response({'error': 'You do not have permission to view this book.'}, status=403)
+    try:
+        fields = parse_fields(request.GET.get('fields'), DEFAULT_LIST_FIELDS)
+        limit = min(max(int(request.GET.get('limit', API_PAGE_SIZE)), 1), API_MAX_PAGE_SIZE)
+    except InvalidFields as e:
+        return json_response({'error': str(e)}, status=400)
+    except ValueError:
+        return json_response({'error': 'limit must be a whole number.'}, status=400)
+    filters = EntryFilters(request.GET)
+    if filters.errors:
+        return json_response({'error': ' '.join(filters.errors)}, status=400)
+
+    entries = filters.apply(CashEntry.objects.filter(book=book), rank=True)
+    cash_in, cash_out, net_balance, count = filters.totals(book, entries)
+    # Only join what the selected fields read; category names come from the catalog
+    related = ['user'] if 'user' in fields else []
+    paginator = CursorPaginator(entries.select_related(*related), limit, ordering=filters.ordering)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return json_response({'error': 'Invalid cursor.'}, status=400)
+    if 'category' in fields:
+        category_catalog(book.id, book.balance.categories_stamp if hasattr(book, 'balance') else None).attach(page)
+    running_balances = {}
+    if 'running_balance' in fields and not filters.ranked:
+        running_balances = page_running_balances(entries, paginator, page, net_balance)
+
+    return json_response({
+        'book': {'id': book.id, 'name': book.name},
+        'totals': {'cash_in': str(cash_in), 'cash_out': str(cash_out), 'net_balance': str(net_balance), 'count': count},
+        'entries': [serialize_entry(entry, fields, running_balances.get(entry.pk)) for entry in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+
+@login_required
+def api_book_entry(request, book_id, pk):
+    """One entry as JSON (API v1), for the entry modal; fields=a,b,c picks the fields."""
+    book = get_object_or_404(Book.objects.select_related('balance'), id=book_id)
+    if not BookAccess.for_request(request, book).can_view:
+        return json_response({'error': 'You do not have permission to view this book.'}, status=403)
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+    except InvalidFields as e:
+        return json_response({'error': str(e)}, status=400)
+    entry = CashEntry.objects.select_related('user').filter(book=book, pk=pk).first()
+    if entry is None:
+        return json_response({'error': 'Entry not found.'}, status=404)
+    category_catalog(book.id, book.balance.categories_stamp if hasattr(book, 'balance') else None).attach([entry])
+    running_balance = None
+    if 'running_balance' in fields:
+        # Book balance after this entry: everything before it in date/time order, plus the entry itself
+        entries = CashEntry.objects.filter(book=book)
+        earlier = entries.filter(CursorPaginator(entries, 1, OLDEST_FIRST).preceding(entry)).net_total()
+        running_balance = earlier + (entry.amount if entry.transaction_type == 'IN' else -entry.amount)
+    return json_response({'entry': serialize_entry(entry, fields, running_balance)})
@@ -52,6 +52,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'cashbook.middleware.UserRoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -68,6 +69,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'cashbook.context_processors.user_role',
             ],
         },
     },
@@ -92,6 +94,10 @@ DATABASES = {
 
 DATABASES["default"] = dj_database_url.parse(config("DATABASE_URL"))
 
+# Full-text and trigram lookups for entry search (cashbook/search.py)
+if DATABASES["default"]["ENGINE"] == 'django.db.backends.postgresql':
+    INSTALLED_APPS.append('django.contrib.postgres')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -129,6 +135,33 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / "cashbook_project/static"]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Who sends media bytes once serve_media has checked access (cashbook/media.py):
+# '' = Django (sendfile for whole files), 'nginx' = X-Accel-Redirect to MEDIA_ACCEL_PREFIX,
+# 'sendfile' = X-Sendfile for Apache mod_xsendfile / lighttpd. The nginx side needs
+#   location /protected-media/ { internal; alias /path/to/media/; }
+MEDIA_SERVER = config('MEDIA_SERVER', default='')
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/protected-media/')
+
+# Rendered reports are kept in their ReportJob rows and reused while the book's data version
+# is unchanged (cashbook/report_cache.py); the least recently used go past this many bytes
+REPORT_CACHE_MAX_BYTES = config('REPORT_CACHE_MAX_BYTES', default=512 * 1024 * 1024, cast=int)
+# Processes one large PDF report is split across (needs pypdf to merge the parts)
+REPORT_PDF_PROCESSES = config('REPORT_PDF_PROCESSES', default=1, cast=int)
+# Threads that compress uploaded entry images and make thumbnails (0 = do it inline in the request)
+IMAGE_WORKERS = config('IMAGE_WORKERS', default=2, cast=int)
+# Cached page data (cashbook/caching.py). Local memory is per process, which only costs
+# cache hits: every cached page is checked against versions and stamps kept in the database.
+# A shared backend (file, database, Redis or Memcached) lets workers reuse each other's pages.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='cashbook'),
+    }
+}
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=300, cast=int)
+# How long the role shown in menus may come from the session (cashbook/permissions.py:user_role).
+# Permission checks always read the user's groups from the database.
+USER_ROLE_SESSION_SECONDS = config('USER_ROLE_SESSION_SECONDS', default=300, cast=int)
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
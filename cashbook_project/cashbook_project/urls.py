@@ -1,9 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from cashbook import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('cashbook.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # Receipt images go through a book permission check, not django.conf.urls.static
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", views.serve_media, name='serve_media'),
+]